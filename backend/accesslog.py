@@ -0,0 +1,134 @@
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+from urllib.parse import parse_qsl, urlencode
+from stats import request_queries
+
+# One JSON line per request. The middleware only builds a small dict and puts
+# it on a queue; JSON encoding and I/O happen on the QueueListener thread.
+
+_logger = logging.getLogger("access")
+_logger.propagate = False
+_logger.setLevel(logging.INFO)
+_listener = None
+
+_SECRET = re.compile(r"token|secret|password|passwd|hash|auth|key|init_?data|signature", re.I)
+
+
+def _parse_sampling(spec: str):
+    out = {}
+    for part in spec.split(","):
+        path, _, rate = part.partition("=")
+        if path.strip() and rate.strip():
+            out[path.strip()] = float(rate)
+    return out
+
+
+# Per-route sample rates, e.g. "/healthz=0.01,/=0.1"; errors are always logged.
+SAMPLING = _parse_sampling(os.getenv("ACCESS_LOG_SAMPLE", "/healthz=0.01"))
+
+
+def redact_query(qs: str) -> str:
+    if not qs:
+        return ""
+    pairs = parse_qsl(qs, keep_blank_values=True)
+    return urlencode([(k, "[redacted]" if _SECRET.search(k) else v) for k, v in pairs])
+
+
+# Per-request hooks fn(route_template, status, seconds, db_queries), called for every
+# request regardless of sampling. Unmatched paths share one label so the
+# number of distinct routes stays bounded.
+UNMATCHED = "<unmatched>"
+_observers = []
+
+
+def add_observer(fn):
+    _observers.append(fn)
+    return fn
+
+
+class _RawQueueHandler(QueueHandler):
+    def prepare(self, record):
+        # The default prepare() formats on the caller's thread; leave that to the listener.
+        return record
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        msg = record.msg
+        if isinstance(msg, dict):
+            return json.dumps(msg, separators=(",", ":"), default=str)
+        return json.dumps({"ts": round(record.created, 3), "msg": record.getMessage()})
+
+
+def start(stream=None):
+    """Attach the queue handler and start the background writer thread"""
+    global _listener
+    if _listener is not None:
+        return
+    q = queue.SimpleQueue()
+    out = logging.StreamHandler(stream or sys.stdout)
+    out.setFormatter(JSONFormatter())
+    _logger.handlers[:] = [_RawQueueHandler(q)]
+    _listener = QueueListener(q, out, respect_handler_level=False)
+    _listener.start()
+
+
+def stop():
+    """Flush pending records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    _logger.handlers[:] = []
+
+
+class AccessLogMiddleware:
+    """Pure ASGI middleware; cheaper than BaseHTTPMiddleware on every request"""
+
+    def __init__(self, app, sampling=None):
+        self.app = app
+        self.sampling = SAMPLING if sampling is None else sampling
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        status = 500
+        queries = [0]
+        token = request_queries.set(queries)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            request_queries.reset(token)
+            template = getattr(scope.get("route"), "path", None)
+            for fn in _observers:
+                fn(template or UNMATCHED, status, elapsed, queries[0])
+            path = template or scope["path"]
+            rate = self.sampling.get(path)
+            if rate is None or status >= 400 or random.random() < rate:
+                client = scope.get("client")
+                _logger.info({
+                    "ts": round(time.time(), 3),
+                    "method": scope["method"],
+                    "path": path,
+                    "query": redact_query(scope.get("query_string", b"").decode("latin-1")),
+                    "status": status,
+                    "ms": round(elapsed * 1000, 2),
+                    "user": scope.get("state", {}).get("user_id"),
+                    "ip": client[0] if client else None,
+                })
@@ -0,0 +1,175 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+from db import fetch, execute
+
+logger = logging.getLogger(__name__)
+
+# Active ads live in memory keyed by (bot_slug, placement); ads without a
+# bot_slug are filed under (None, placement) and served to every bot.
+# Serving is a dict lookup plus a scan of that key's candidates, no DB hit.
+IMPRESSION_FLUSH_INTERVAL = float(os.getenv("ADS_IMPRESSION_FLUSH_INTERVAL", "5"))
+
+_AD_COLUMNS = """id, name, placement, content, is_active,
+                 extract(epoch from start_at)::int as start_at,
+                 extract(epoch from end_at)::int as end_at,
+                 targeting, bot_slug"""
+
+
+def _set(v) -> frozenset:
+    if not v:
+        return frozenset()
+    return frozenset(v if isinstance(v, (list, tuple)) else (v,))
+
+
+class AdEntry:
+    __slots__ = ("id", "bot_slug", "placement", "start_at", "end_at", "weight",
+                 "tiers", "languages", "chat_types", "current", "payload")
+
+    def __init__(self, row):
+        t = row["targeting"]
+        if isinstance(t, str):
+            t = json.loads(t)
+        t = t or {}
+        if not isinstance(t, dict):
+            raise ValueError(f"targeting must be an object, got {type(t).__name__}")
+        self.id = row["id"]
+        self.bot_slug = row["bot_slug"]
+        self.placement = row["placement"]
+        self.start_at = row["start_at"]
+        self.end_at = row["end_at"]
+        self.weight = max(1, int(t.get("weight", 1)))
+        self.tiers = _set(t.get("tiers"))
+        self.languages = _set(t.get("languages"))
+        self.chat_types = _set(t.get("chat_types"))
+        self.current = 0  # smooth weighted round-robin state
+        self.payload = {"id": row["id"], "name": row["name"], "placement": row["placement"],
+                        "content": row["content"], "bot_slug": row["bot_slug"]}
+
+    def live(self, now: float) -> bool:
+        return (self.start_at is None or self.start_at <= now) and (self.end_at is None or now < self.end_at)
+
+    def matches(self, tier: Optional[str], language: Optional[str], chat_type: Optional[str]) -> bool:
+        return ((not self.tiers or tier in self.tiers)
+                and (not self.languages or language in self.languages)
+                and (not self.chat_types or chat_type in self.chat_types))
+
+
+_index: Dict[Tuple[Optional[str], str], List[AdEntry]] = {}
+_max_id = 0
+_impressions: Dict[int, int] = {}
+_task = None
+
+
+def _add(entry: AdEntry):
+    global _max_id
+    bucket = _index.setdefault((entry.bot_slug, entry.placement), [])
+    bucket[:] = [e for e in bucket if e.id != entry.id]
+    bucket.append(entry)
+    _max_id = max(_max_id, entry.id)
+
+
+def upsert(row):
+    """Index a freshly written ad row (as returned by create_ad)"""
+    if row["is_active"] and (row["end_at"] is None or row["end_at"] > time.time()):
+        _add(AdEntry(row))
+
+
+def _add_rows(rows):
+    """Index rows one by one; a row with broken targeting is logged and skipped"""
+    global _max_id
+    for r in rows:
+        try:
+            _add(AdEntry(r))
+        except Exception as e:
+            _max_id = max(_max_id, r["id"])  # don't refetch it on every load_new
+            logger.error(f"Skipping ad {r['id']}: bad targeting {r['targeting']!r}: {e}")
+
+
+async def rebuild():
+    """Reload every active, not yet ended ad"""
+    global _index, _max_id
+    rows = await fetch(
+        f"select {_AD_COLUMNS} from dashboard_ads where is_active=true and (end_at is null or end_at > now())"
+    )
+    _index, _max_id = {}, 0
+    _add_rows(rows)
+
+
+async def load_new():
+    """Index ads created since the last load (e.g. by another worker)"""
+    rows = await fetch(
+        f"select {_AD_COLUMNS} from dashboard_ads where id > $1 and is_active=true and (end_at is null or end_at > now())",
+        _max_id
+    )
+    _add_rows(rows)
+
+
+def serve(bot_slug: Optional[str], placement: str, tier: Optional[str] = None,
+          language: Optional[str] = None, chat_type: Optional[str] = None) -> Optional[dict]:
+    """Pick one live, matching ad by smooth weighted round-robin and count the impression"""
+    now = time.time()
+    best, total = None, 0
+    for key in ((bot_slug, placement), (None, placement)) if bot_slug else ((None, placement),):
+        for e in _index.get(key, ()):
+            if not e.live(now) or not e.matches(tier, language, chat_type):
+                continue
+            e.current += e.weight
+            total += e.weight
+            if best is None or e.current > best.current:
+                best = e
+    if best is None:
+        return None
+    best.current -= total
+    _impressions[best.id] = _impressions.get(best.id, 0) + 1
+    return best.payload
+
+
+async def flush_impressions():
+    global _impressions
+    if not _impressions:
+        return
+    pending, _impressions = _impressions, {}
+    try:
+        await execute(
+            """update dashboard_ads a set impressions=a.impressions + v.n
+               from unnest($1::int[], $2::bigint[]) as v(id, n)
+               where a.id=v.id""",
+            list(pending.keys()), list(pending.values())
+        )
+    except Exception as e:
+        logger.warning(f"Impression flush failed, keeping {sum(pending.values())} for the next run: {e}")
+        for ad_id, n in pending.items():
+            _impressions[ad_id] = _impressions.get(ad_id, 0) + n
+
+
+async def _flush_forever():
+    while True:
+        await asyncio.sleep(IMPRESSION_FLUSH_INTERVAL)
+        await flush_impressions()
+
+
+def start():
+    global _task
+    if _task is None:
+        _task = asyncio.create_task(_flush_forever())
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+    await flush_impressions()
+
+
+def stats() -> dict:
+    return {"keys": len(_index), "ads": sum(len(v) for v in _index.values()),
+            "pending_impressions": sum(_impressions.values())}
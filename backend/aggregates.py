@@ -0,0 +1,119 @@
+import asyncio
+import logging
+from typing import Optional
+from db import fetchrow
+from rollups import HW_BOT_EVENTS, HW_MODERATION
+
+logger = logging.getLogger(__name__)
+
+# Each dashboard counter block is answered by one statement: scalar subqueries
+# for counters spread over several tables, FILTER clauses for counters on the
+# same table. That is one round trip and one pool connection per endpoint.
+
+OVERVIEW_SQL = """
+select (select count(1) from dashboard_users) as users_total,
+       (select count(1) from dashboard_ads where is_active=true) as ads_active,
+       (select count(1) from dashboard_bots where is_active=true) as bots_active
+"""
+
+# Fallback when one of the tables is missing: same counters, run concurrently,
+# each one degrading to 0 on its own like the old per-query helper did.
+OVERVIEW_PARTS = {
+    "users_total": "select count(1) as c from dashboard_users",
+    "ads_active": "select count(1) as c from dashboard_ads where is_active=true",
+    "bots_active": "select count(1) as c from dashboard_bots where is_active=true",
+}
+
+# Moderation and bot event counters come from the rollups plus the raw tail
+# above the rollup high-water mark, so they stay exact without full scans.
+MODERATION_SQL = f"""
+select coalesce(sum(n) filter (where type='spam'), 0)::bigint as spam_detected,
+       coalesce(sum(n) filter (where action='delete'), 0)::bigint as messages_deleted,
+       (select count(1) from (
+            select user_id from dashboard_rollup_banned_users
+            union
+            select user_id from dashboard_moderation
+            where action='ban' and user_id is not null and id > {HW_MODERATION}
+        ) b) as users_banned
+from (
+    select type, action, events as n from dashboard_rollup_moderation
+    union all
+    select type, action, 1 from dashboard_moderation where id > {HW_MODERATION}
+) t
+"""
+
+PAYMENT_SQL = """
+select coalesce(sum(amount) filter (where status='completed'), 0) as total,
+       count(1) as c
+from dashboard_payments
+"""
+
+BOT_STATS_SQL = f"""
+select b.id, b.name, b.slug,
+       (select count(1) from dashboard_bot_users u where u.bot_id=b.id) as users_total,
+       (select extract(epoch from now() - max(created_at))::bigint
+        from dashboard_bot_events where bot_id=b.id) as idle_seconds,
+       e.messages_total, e.commands_total
+from dashboard_bots b
+cross join lateral (
+    select coalesce(sum(n) filter (where type='message'), 0)::bigint as messages_total,
+           coalesce(sum(n) filter (where type='command'), 0)::bigint as commands_total
+    from (
+        select type, events as n from dashboard_rollup_bot_events where bot_id=b.id
+        union all
+        select type, 1 from dashboard_bot_events where bot_id=b.id and id > {HW_BOT_EVENTS}
+    ) t
+) e
+where b.id=$1
+"""
+
+async def _count(q: str, *args) -> int:
+    try:
+        r = await fetchrow(q, *args)
+        return r["c"] if r and r["c"] is not None else 0
+    except Exception as e:
+        logger.warning(f"Query error: {e}")
+        return 0
+
+
+async def gather_counts(parts: dict, *args) -> dict:
+    """Run independent `select ... as c` counters concurrently"""
+    values = await asyncio.gather(*(_count(q, *args) for q in parts.values()))
+    return dict(zip(parts.keys(), values))
+
+
+async def overview_counts() -> dict:
+    try:
+        return dict(await fetchrow(OVERVIEW_SQL))
+    except Exception as e:
+        logger.warning(f"Overview query failed, falling back to per-table counts: {e}")
+        return await gather_counts(OVERVIEW_PARTS)
+
+
+async def moderation_counts() -> dict:
+    return dict(await fetchrow(MODERATION_SQL))
+
+
+async def payment_totals() -> dict:
+    row = await fetchrow(PAYMENT_SQL)
+    total, count = row["total"] or 0, row["c"] or 0
+    return {
+        "total_revenue_usd": float(total),
+        "transactions_total": count,
+        "avg_transaction": float(total / max(count, 1)),
+    }
+
+
+async def bot_counts(bot_id: int) -> Optional[dict]:
+    """Bot row plus its counters, or None if the bot does not exist"""
+    row = await fetchrow(BOT_STATS_SQL, bot_id)
+    if not row:
+        return None
+    d = dict(row)
+    return {
+        "bot": {"id": d["id"], "name": d["name"], "slug": d["slug"]},
+        "users_total": d["users_total"] or 0,
+        "messages_total": d["messages_total"] or 0,
+        "commands_total": d["commands_total"] or 0,
+        "idle_seconds": d["idle_seconds"],
+    }
@@ -1,24 +1,54 @@
 import os
 import json
+import asyncio
 import time
 import logging
 import httpx
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Union
+from datetime import datetime
 from decimal import Decimal, getcontext
-from fastapi import FastAPI, Depends, HTTPException, Header
+from fastapi import FastAPI, Depends, HTTPException, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-from pydantic import BaseModel
+from fastapi.responses import Response
+from pydantic import BaseModel, ConfigDict, Field
+import db
 from db import fetch, fetchrow, execute
+import jwt_tools
 from jwt_tools import create_token, decode_token
-from telegram_auth import verify_telegram_auth
+import telegram_auth
+from telegram_auth import verify_telegram_auth, verify_webapp_init_data
+from ratelimit import KeyedBuckets
+from aggregates import overview_counts, moderation_counts, payment_totals, bot_counts
+import rollups
+from cache import cache, cached_fetch, cached_fetchrow
+import notify
+from notify import publish
+from pagination import Keyset, page, page_json, stream_ndjson
+from fastjson import FastJSONResponse, dumps, raw_json
+import accesslog
+from accesslog import AccessLogMiddleware
+import monitor
+import metrics
+import ingest
+import ads_index
+import partitions
+import ton_watch
+import token_data
+import static_assets
+import migrations
+import feature_flags
+import rss
+import timeseries
 
 getcontext().prec = 40
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Emerald DevDash API", version="0.2-min")
+# The default class only changes how bodies are rendered: FastAPI still runs
+# jsonable_encoder over returned dicts, so list endpoints return FastJSONResponse
+# (or raw_json) themselves to skip that walk.
+app = FastAPI(title="Emerald DevDash API", version="0.2-min", default_response_class=FastJSONResponse)
 
 _origins = [o.strip() for o in os.getenv("ALLOWED_ORIGINS", "*").split(",") if o.strip()]
 allow_all = "*" in _origins
@@ -34,13 +64,9 @@ app.add_middleware(
 )
 
 
-@app.middleware("http")
-async def log_requests(request, call_next):
-    logger.info(f"Request: {request.method} {request.url}")
-    logger.info(f"Headers: {dict(request.headers)}")
-    response = await call_next(request)
-    logger.info(f"Response status: {response.status_code}")
-    return response
+app.add_middleware(AccessLogMiddleware)
+accesslog.add_observer(monitor.observe)
+accesslog.add_observer(metrics.observe)
 
 class TelegramAuthPayload(BaseModel):
     id: int
@@ -51,28 +77,63 @@ class TelegramAuthPayload(BaseModel):
     last_name: Optional[str] = None
     photo_url: Optional[str] = None
 
+class WebAppAuthPayload(BaseModel):
+    init_data: str
+
 class TokenResponse(BaseModel):
     access_token: str
     token_type: str = "bearer"
 
-def get_current_user(authorization: Optional[str] = Header(None)) -> Dict[str, Any]:
+async def paginated(key: str, keyset: Keyset, base: str, cursor: Optional[str], limit: int,
+                    stream: bool = False, where=(), args=(), fetcher=None):
+    """One keyset page as {key: [...], "next_cursor": ...}, or an NDJSON stream"""
+    try:
+        if stream:
+            return stream_ndjson(keyset, base, cursor, where, args)
+        rows, next_cursor = await page(keyset, base, cursor, limit, where, args, fetcher)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {key: rows, "next_cursor": next_cursor}  # Records; fastjson encodes them directly
+
+async def paginated_json(key: str, keyset: Keyset, base: str, cursor: Optional[str], limit: int,
+                         stream: bool = False, where=(), args=(), fetcher=None, drop=()):
+    """Same contract as paginated(), but the page is rendered to JSON by Postgres
+    and passed through as bytes; `fetcher` is fetchrow-like here"""
+    try:
+        if stream:
+            return stream_ndjson(keyset, base, cursor, where, args, drop)
+        body, next_cursor = await page_json(keyset, base, cursor, limit, where, args, fetcher, drop)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return raw_json(b'{"' + key.encode() + b'":' + body.encode() + b',"next_cursor":' + dumps(next_cursor) + b"}")
+
+async def get_current_user(request: Request, authorization: Optional[str] = Header(None)) -> Dict[str, Any]:
     if not authorization or not authorization.lower().startswith("bearer "):
         raise HTTPException(status_code=401, detail="Missing or invalid Authorization header")
     try:
-        return decode_token(authorization.split(" ", 1)[1])
+        claims = decode_token(authorization.split(" ", 1)[1])
     except Exception as e:
         raise HTTPException(status_code=401, detail=str(e))
+    request.state.user_id = claims.get("sub")  # picked up by the access log
+    return claims
+
+@app.get("/metrics")
+async def prometheus_metrics(authorization: Optional[str] = Header(None)):
+    """Prometheus text exposition; guarded by METRICS_TOKEN when it is set"""
+    if metrics.METRICS_TOKEN and authorization != f"Bearer {metrics.METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 @app.get("/healthz")
 async def healthz():
     return {"status": "ok", "time": int(time.time())}
 
 @app.get("/")
-async def root():
+async def root(request: Request):
     """Serve index.html for root path (supports GET and HEAD requests)"""
-    index_path = os.path.join(os.path.dirname(__file__), "..", "frontend", "index.html")
-    if os.path.exists(index_path):
-        return FileResponse(index_path, media_type="text/html")
+    asset = static_assets.get("/frontend/index.html")
+    if asset is not None:
+        return _static_response(request, asset)
     # Fallback if index.html not found
     return {"status": "ok", "message": "Emerald Dashboard API"}
 
@@ -81,74 +142,217 @@ async def root_head():
     """Support HEAD requests to root path"""
     return None
 
-# ---------- Startup: kleine, idempotente Migrationen ----------
+# ---------- Static assets ----------
+def _static_response(request: Request, asset: static_assets.Asset) -> Response:
+    return static_assets.respond(
+        asset, request.query_params.get("v"),
+        request.headers.get("if-none-match"), request.headers.get("accept-encoding")
+    )
+
+async def serve_static(request: Request):
+    """frontend/, miniapp/, offchain/, assets/ and news.json from the startup scan"""
+    asset = static_assets.get(request.url.path)
+    if asset is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    return _static_response(request, asset)
+
+for _prefix, _target in static_assets.MOUNTS.items():
+    app.add_api_route(_prefix if "." in _target else _prefix + "/{path:path}", serve_static,
+                      methods=["GET", "HEAD"], include_in_schema=False)
+
+@app.get("/system/static")
+async def static_stats(current=Depends(get_current_user)):
+    """Static asset index: file count, in-memory bytes, brotli availability"""
+    return static_assets.stats()
+
+# ---------- Startup: versionierte Migrationen (migrations.py) ----------
 @app.on_event("startup")
-async def _migrate():
+async def _start_access_log():
+    accesslog.start()
+
+@app.on_event("startup")
+async def _scan_static():
+    n = await asyncio.to_thread(static_assets.scan)
+    logger.info(f"Indexed {n} static assets")
+    static_assets.start()
+
+@app.on_event("startup")
+async def _warm_pool():
     try:
-        await execute("alter table if exists dashboard_users add column if not exists ton_address text;")
-    except Exception:
-        pass  # Column might already exist
+        await db.warmup()
+    except Exception as e:
+        logger.warning(f"DB pool warm-up failed: {e}")
+
+@app.on_event("startup")
+async def _migrate():
     try:
-        await execute("""
-          create table if not exists dashboard_watch_accounts(
-            id serial primary key,
-            chain text not null check (chain in ('ton')),
-            account_id text not null,
-            label TEXT NOT NULL DEFAULT '',
-            meta jsonb default '{}'::jsonb,
-            created_at timestamp not null default now(),
-            unique(chain, account_id)
-          );
-        """)
-    except Exception:
-        pass  # Table might already exist
+        await migrations.migrate()
+    except Exception as e:
+        logger.error(f"Schema migration failed: {e}")
 
+@app.on_event("startup")
+async def _load_auth():
+    jwt_tools.load_keys()  # fail fast on a missing/misconfigured signing key
+    try:
+        telegram_auth.load_keys()
+    except ValueError as e:
+        logger.warning(f"Telegram login disabled: {e}")
+    await _reload_revoked()
 
-@app.post("/auth/telegram", response_model=TokenResponse)
-async def auth_telegram(payload: TelegramAuthPayload):
-    logger.info(f"Telegram auth attempt for user: {payload.username}")
-    
-    # Verify telegram signature
-    user = verify_telegram_auth(payload.dict())
-    
-    # Store or update user in database
-    await execute(
-        """
-        insert into dashboard_users(telegram_id, username, first_name, last_name, photo_url)
-        values($1, $2, $3, $4, $5)
-        on conflict(telegram_id) do update set 
-            username=excluded.username,
-            first_name=excluded.first_name,
-            last_name=excluded.last_name,
-            photo_url=excluded.photo_url,
-            updated_at=now()
-        """,
-        user["id"],
-        user.get("username"),
-        user.get("first_name"),
-        user.get("last_name"),
-        user.get("photo_url")
-    )
-    
-    # Get user role and tier
+@app.on_event("startup")
+async def _start_workers():
+    rollups.start()
+    notify.start()
+    monitor.start()
+    ingest.start()
+    try:
+        await ads_index.rebuild()
+    except Exception as e:
+        logger.warning(f"Ad index build failed: {e}")
+    ads_index.start()
+    await _rebuild_flags()
+    partitions.start()
+    ton_watch.start()
+    token_data.start()
+    rss.start()
+
+@app.on_event("shutdown")
+async def _stop_workers():
+    await rollups.stop()
+    await notify.stop()
+    await monitor.stop()
+    await ingest.stop()
+    await ads_index.stop()
+    await partitions.stop()
+    await ton_watch.stop()
+    await token_data.stop()
+    await rss.stop()
+    await static_assets.stop()
+    await db.close_pool()
+    accesslog.stop()
+
+# Login spikes (bot campaigns) are absorbed per IP and per Telegram id
+_login_ip_limit = KeyedBuckets(float(os.getenv("LOGIN_IP_RATE", "1")), float(os.getenv("LOGIN_IP_BURST", "20")))
+_login_user_limit = KeyedBuckets(float(os.getenv("LOGIN_USER_RATE", "0.2")), float(os.getenv("LOGIN_USER_BURST", "5")))
+
+# One round trip: the upsert skips unchanged profiles, and the trailing
+# select returns role/tier from the statement snapshot when nothing was written.
+LOGIN_UPSERT_SQL = """
+with ins as (
+    insert into dashboard_users(telegram_id, username, first_name, last_name, photo_url)
+    values($1, $2, $3, $4, $5)
+    on conflict(telegram_id) do update set
+        username=excluded.username,
+        first_name=excluded.first_name,
+        last_name=excluded.last_name,
+        photo_url=excluded.photo_url,
+        updated_at=now()
+    where (dashboard_users.username, dashboard_users.first_name, dashboard_users.last_name, dashboard_users.photo_url)
+          is distinct from (excluded.username, excluded.first_name, excluded.last_name, excluded.photo_url)
+    returning role, tier
+)
+select role, tier, true as changed from ins
+union all
+select role, tier, false from dashboard_users where telegram_id=$1 and not exists(select 1 from ins)
+"""
+
+def _check_login_rate(key_limit: KeyedBuckets, key):
+    wait = key_limit.hit(key)
+    if wait:
+        raise HTTPException(status_code=429, detail="Too many login attempts",
+                            headers={"Retry-After": str(max(1, int(wait + 0.999)))})
+
+async def _login(user: Dict[str, Any]) -> TokenResponse:
+    _check_login_rate(_login_user_limit, user["id"])
     row = await fetchrow(
-        "select role, tier from dashboard_users where telegram_id=$1",
-        user["id"]
+        LOGIN_UPSERT_SQL,
+        user["id"], user.get("username"), user.get("first_name"), user.get("last_name"), user.get("photo_url")
     )
+    if row is None or row["changed"]:
+        await publish("users")
     role = row["role"] if row else "dev"
     tier = row["tier"] if row else "pro"
-    
-    # Create JWT token
     tok = create_token({
         "sub": str(user["id"]),
         "tg": user,
         "role": role,
         "tier": tier
     })
-    
-    logger.info(f"Auth successful for user: {payload.username} (id: {user['id']})")
+    logger.info(f"Auth successful for user: {user.get('username')} (id: {user['id']})")
     return TokenResponse(access_token=tok)
 
+@app.post("/auth/telegram", response_model=TokenResponse)
+async def auth_telegram(payload: TelegramAuthPayload, request: Request):
+    """Telegram Login Widget"""
+    _check_login_rate(_login_ip_limit, request.client.host if request.client else None)
+    try:
+        user = verify_telegram_auth(payload.model_dump(exclude_none=True))
+    except ValueError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    return await _login(user)
+
+@app.post("/auth/webapp", response_model=TokenResponse)
+async def auth_webapp(payload: WebAppAuthPayload, request: Request):
+    """Telegram Mini App: verifies WebApp.initData"""
+    _check_login_rate(_login_ip_limit, request.client.host if request.client else None)
+    try:
+        user = verify_webapp_init_data(payload.init_data)
+    except (ValueError, KeyError) as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    return await _login(user)
+
+async def _reload_revoked():
+    try:
+        rows = await fetch(
+            "select jti, extract(epoch from expires_at)::bigint as exp from dashboard_revoked_tokens where expires_at > now()"
+        )
+        jwt_tools.set_revoked((r["jti"], r["exp"]) for r in rows)
+    except Exception as e:
+        logger.warning(f"Loading revoked tokens failed: {e}")
+
+@notify.subscribe
+def _on_ads_changed(tags):
+    if notify.ALL in tags:
+        asyncio.get_running_loop().create_task(ads_index.rebuild())
+    elif "ads" in tags:
+        asyncio.get_running_loop().create_task(ads_index.load_new())
+
+@notify.subscribe
+def _on_flags_changed(tags):
+    if "flags" in tags or notify.ALL in tags:
+        asyncio.get_running_loop().create_task(_rebuild_flags())
+
+async def _rebuild_flags():
+    try:
+        await feature_flags.rebuild()
+    except Exception as e:
+        logger.warning(f"Feature flag rebuild failed: {e}")
+
+@notify.subscribe
+def _on_token_changed(tags):
+    if "token" in tags or notify.ALL in tags:
+        token_data.refresh()
+
+@notify.subscribe
+def _on_revoked(tags):
+    if "revoked" in tags or notify.ALL in tags:
+        asyncio.get_running_loop().create_task(_reload_revoked())
+
+@app.post("/auth/logout")
+async def logout(current=Depends(get_current_user)):
+    """Revoke the presented token on every worker"""
+    jti, exp = current.get("jti"), current.get("exp")
+    if jti:
+        # Persist first: a token revoked only in this worker's memory would
+        # still be accepted by every other worker
+        await execute(
+            "insert into dashboard_revoked_tokens(jti, expires_at) values($1, to_timestamp($2)) on conflict do nothing",
+            jti, exp
+        )
+        jwt_tools.revoke(jti, exp)
+        await publish("revoked")
+    return {"ok": True}
+
 @app.get("/me")
 async def me(current=Depends(get_current_user)):
     """Get current user info from JWT token"""
@@ -160,8 +364,8 @@ async def me(current=Depends(get_current_user)):
 
 @app.get("/bots")
 async def list_bots(current=Depends(get_current_user)):
-    rows = await fetch("select id, username, title, env_token_key, is_active, meta from dashboard_bots order by id asc")
-    return {"bots": [dict(r) for r in rows]}
+    rows = await cached_fetch(("bots",), "select id, username, title, env_token_key, is_active, meta from dashboard_bots order by id asc")
+    return FastJSONResponse({"bots": rows})
 
 class BotMeta(BaseModel):
     username: str
@@ -175,24 +379,13 @@ async def add_bot(meta: BotMeta, current=Depends(get_current_user)):
         "insert into dashboard_bots(username, title, env_token_key, is_active, meta) values($1, $2, $3, $4, $5) returning id, username, title, env_token_key, is_active, meta",
         meta.username, meta.title, meta.env_token_key, meta.is_active, json.dumps({})
     )
+    await publish("bots")
     return dict(row)
 
 @app.get("/metrics/overview")
 async def metrics_overview(current=Depends(get_current_user)):
-    async def c(q):
-        try:
-            r = await fetchrow(q)
-            return r["c"] if r and "c" in r else 0
-        except Exception as e:
-            logger.warning(f"Query error: {e}")
-            return 0
-    
-    return {
-        "users_total": await c("select count(1) as c from dashboard_users"),
-        "ads_active": await c("select count(1) as c from dashboard_ads where is_active=true"),
-        "bots_active": await c("select count(1) as c from dashboard_bots where is_active=true"),
-        "token_events_total": 0
-    }
+    counts = await overview_counts()
+    return {**counts, "token_events_total": 0}
 
 # ---------- TON: Adresse setzen & Übersicht ----------
 @app.post("/wallets/ton")
@@ -203,45 +396,49 @@ async def set_ton_address(payload: dict, current=Depends(get_current_user)):
         addr,
         int(current["sub"])
     )
+    await publish("wallets")
     return {"ok": True, "ton_address": addr}
 
+WATCH_KEYSET = Keyset(["id"], desc=False)
+
 @app.get("/wallets")
-async def wallets_overview(current=Depends(get_current_user)):
-    me = await fetchrow(
+async def wallets_overview(current=Depends(get_current_user), cursor: Optional[str] = None, limit: int = 200):
+    me = await cached_fetchrow(
+        ("wallets",),
         "select ton_address from dashboard_users where telegram_id=$1",
         int(current["sub"])
     )
-    watches = await fetch(
-        "select id, chain, account_id, label, meta, created_at from dashboard_watch_accounts order by id asc"
+    watches = await paginated(
+        "watch", WATCH_KEYSET,
+        "select id, chain, account_id, label, meta, created_at from dashboard_watch_accounts",
+        cursor, limit, fetcher=lambda q, *a: cached_fetch(("watch",), q, *a)
     )
-    return {
-        "me": dict(me) if me else None,
-        "watch": [dict(w) for w in watches]
-    }
+    return FastJSONResponse({"me": me, **watches})
+
+ADS_KEYSET = Keyset(["id"])
 
 @app.get("/ads")
-async def list_ads(current=Depends(get_current_user), bot_slug: Optional[str] = None):
-    if bot_slug:
-        rows = await fetch(
-            """select id, name, placement, content, is_active,
-                      extract(epoch from start_at)::int as start_at,
-                      extract(epoch from end_at)::int as end_at,
-                      targeting, bot_slug
-               from dashboard_ads
-               where bot_slug=$1
-               order by id desc""",
-            bot_slug
-        )
-    else:
-        rows = await fetch(
-            """select id, name, placement, content, is_active,
-                      extract(epoch from start_at)::int as start_at,
-                      extract(epoch from end_at)::int as end_at,
-                      targeting, bot_slug
-               from dashboard_ads
-               order by id desc"""
-        )
-    return {"ads": [dict(r) for r in rows]}
+async def list_ads(current=Depends(get_current_user), bot_slug: Optional[str] = None,
+                   cursor: Optional[str] = None, limit: int = 200, stream: bool = False):
+    return await paginated_json(
+        "ads", ADS_KEYSET,
+        """select id, name, placement, content, is_active,
+                  extract(epoch from start_at)::int as start_at,
+                  extract(epoch from end_at)::int as end_at,
+                  targeting, bot_slug
+           from dashboard_ads""",
+        cursor, limit, stream,
+        where=["bot_slug=$1"] if bot_slug else [],
+        args=[bot_slug] if bot_slug else [],
+        fetcher=lambda q, *a: cached_fetchrow(("ads",), q, *a)
+    )
+
+class AdTargeting(BaseModel):
+    model_config = ConfigDict(extra="allow")
+    weight: int = Field(1, ge=1)
+    tiers: Optional[Union[str, List[str]]] = None
+    languages: Optional[Union[str, List[str]]] = None
+    chat_types: Optional[Union[str, List[str]]] = None
 
 class Ad(BaseModel):
     name: str
@@ -250,7 +447,7 @@ class Ad(BaseModel):
     is_active: bool = True
     start_at: Optional[int] = None
     end_at: Optional[int] = None
-    targeting: Optional[dict] = None
+    targeting: Optional[AdTargeting] = None
     bot_slug: Optional[str] = None
 
 @app.post("/ads")
@@ -263,22 +460,29 @@ async def create_ad(ad: Ad, current=Depends(get_current_user)):
            extract(epoch from end_at)::int as end_at,
            targeting, bot_slug""",
         ad.name, ad.placement, ad.content, ad.is_active,
-        ad.start_at, ad.end_at, ad.targeting, ad.bot_slug
+        ad.start_at, ad.end_at, json.dumps(ad.targeting.model_dump(exclude_none=True) if ad.targeting else {}), ad.bot_slug
     )
+    ads_index.upsert(row)
+    await publish("ads")
     return dict(row)
 
+@app.get("/ads/serve")
+async def serve_ad(placement: str, bot_slug: Optional[str] = None, tier: Optional[str] = None,
+                   language: Optional[str] = None, chat_type: Optional[str] = None,
+                   current=Depends(get_current_user)):
+    """Pick one ad that is live now and matches the targeting, from memory"""
+    return {"ad": ads_index.serve(bot_slug, placement, tier or current.get("tier"), language, chat_type)}
+
+TIERS_KEYSET = Keyset(["created_at", "telegram_id"])
+
 @app.get("/tiers")
-async def list_tiers(current=Depends(get_current_user), limit: int = 100):
-    rows = await fetch(
-        "select telegram_id, username, role, tier, created_at, updated_at from dashboard_users order by created_at desc limit $1",
-        limit
+async def list_tiers(current=Depends(get_current_user), limit: int = 100,
+                     cursor: Optional[str] = None, stream: bool = False):
+    return await paginated_json(
+        "users", TIERS_KEYSET,
+        "select telegram_id, username, role, tier, created_at, updated_at from dashboard_users",
+        cursor, limit, stream, fetcher=lambda q, *a: cached_fetchrow(("users",), q, *a)
     )
-    out = []
-    for r in rows:
-        d = dict(r)
-        d["telegram_id"] = int(d["telegram_id"])
-        out.append(d)
-    return {"users": out}
 
 class TierPatch(BaseModel):
     telegram_id: int
@@ -291,12 +495,13 @@ async def set_tier(p: TierPatch, current=Depends(get_current_user)):
         "update dashboard_users set tier=$2, role=coalesce($3, role), updated_at=now() where telegram_id=$1",
         p.telegram_id, p.tier, p.role
     )
+    await publish("users")
     return {"ok": True}
 
 @app.get("/feature-flags")
 async def list_flags(current=Depends(get_current_user)):
-    rows = await fetch("select key, value, description from dashboard_feature_flags order by key asc")
-    return {"flags": [dict(r) for r in rows]}
+    rows = await cached_fetch(("flags",), "select key, value, description from dashboard_feature_flags order by key asc")
+    return FastJSONResponse({"flags": rows})
 
 class Flag(BaseModel):
     key: str
@@ -305,12 +510,48 @@ class Flag(BaseModel):
 
 @app.post("/feature-flags")
 async def upsert_flag(f: Flag, current=Depends(get_current_user)):
+    try:
+        feature_flags.validate(f.key, f.value)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Unchanged flags are not rewritten, so nothing is recompiled or broadcast
     row = await fetchrow(
-        "insert into dashboard_feature_flags(key, value, description) values($1, $2, $3) on conflict(key) do update set value=$2, description=$3 returning key, value, description",
-        f.key, f.value, f.description
+        """insert into dashboard_feature_flags(key, value, description) values($1, $2, $3)
+           on conflict(key) do update set value=$2, description=$3
+           where (dashboard_feature_flags.value, dashboard_feature_flags.description) is distinct from ($2::jsonb, $3)
+           returning key, value, description""",
+        f.key, json.dumps(f.value), f.description
     )
+    if row is None:
+        row = await fetchrow("select key, value, description from dashboard_feature_flags where key=$1", f.key)
+        return dict(row)
+    feature_flags.compile_flag(row["key"], row["value"])
+    await publish("flags")
     return dict(row)
 
+class FlagSubject(BaseModel):
+    telegram_id: Optional[int] = None
+    tier: Optional[str] = None
+    role: Optional[str] = None
+    bot_slug: Optional[str] = None
+
+class FlagEvaluation(BaseModel):
+    subjects: List[FlagSubject]
+    keys: Optional[List[str]] = None
+
+MAX_FLAG_SUBJECTS = 1000
+
+@app.post("/feature-flags/evaluate")
+async def evaluate_flags(req: FlagEvaluation, current=Depends(get_current_user)):
+    """Every (or the requested) flag's value for each subject, in request order"""
+    if len(req.subjects) > MAX_FLAG_SUBJECTS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_FLAG_SUBJECTS} subjects per call")
+    subjects = [s.model_dump() for s in req.subjects]
+    return FastJSONResponse({"results": [
+        {"subject": s, "flags": flags}
+        for s, flags in zip(subjects, feature_flags.evaluate_many(subjects, req.keys))
+    ]})
+
 async def get_token(authorization: Optional[str] = Header(None)) -> str:
     """Extract bearer token from Authorization header"""
     if not authorization or not authorization.lower().startswith("bearer "):
@@ -331,17 +572,19 @@ async def check_auth(token: str = Depends(get_token)):
 @app.get("/token/emrd")
 async def get_emrd_info(current=Depends(get_current_user)):
     """Get EMRD token information (price, market cap, holders, etc.)"""
+    try:
+        live = await token_data.snapshot()
+    except Exception as e:
+        logger.warning(f"EMRD snapshot unavailable: {e}")
+        live = {"price_usd": None, "market_cap": None, "holders": None,
+                "total_supply": str(token_data.TOTAL_SUPPLY), "circulating_supply": None, "updated_at": None}
     return {
         "name": "Emerald Token",
         "symbol": "EMRD",
-        "contract": "EQDkjqMPPCLYN2xUQp_mWMFt3zPxUgcLIEMCDe-RDHfx2Gsp",
+        "contract": token_data.CONTRACT,
         "chain": "TON",
         "decimals": 9,
-        "price_usd": 0.025,
-        "market_cap": 2500000,
-        "holders": 1250,
-        "total_supply": "100000000",
-        "circulating_supply": "45000000",
+        **live,
         "links": {
             "dedust": "https://dedust.io/swap/TON/EQDkjqMPPCLYN2xUQp_mWMFt3zPxUgcLIEMCDe-RDHfx2Gsp",
             "tonviewer": "https://tonviewer.com/EQDkjqMPPCLYN2xUQp_mWMFt3zPxUgcLIEMCDe-RDHfx2Gsp",
@@ -349,113 +592,119 @@ async def get_emrd_info(current=Depends(get_current_user)):
         }
     }
 
+HOLDERS_KEYSET = Keyset(["balance", "ton_address"])
+TRANSACTIONS_KEYSET = Keyset(["created_at", "id"])
+
 @app.get("/token/holders")
-async def get_token_holders(current=Depends(get_current_user), limit: int = 50):
+async def get_token_holders(current=Depends(get_current_user), limit: int = 50,
+                            cursor: Optional[str] = None, stream: bool = False):
     """Get top EMRD token holders"""
     try:
-        rows = await fetch(
-            """select telegram_id, ton_address, balance, percentage
-               from dashboard_token_holders
-               order by balance desc
-               limit $1""",
-            limit
+        return await paginated_json(
+            "holders", HOLDERS_KEYSET,
+            "select telegram_id, ton_address, balance, percentage from dashboard_token_holders",
+            cursor, limit, stream, where=["balance > 0"]
         )
-        return {"holders": [dict(r) for r in rows]}
+    except HTTPException:
+        raise
     except Exception:
-        return {"holders": []}
+        return {"holders": [], "next_cursor": None}
 
 @app.get("/token/transactions")
-async def get_token_transactions(current=Depends(get_current_user), limit: int = 100):
+async def get_token_transactions(current=Depends(get_current_user), limit: int = 100,
+                                 cursor: Optional[str] = None, stream: bool = False):
     """Get recent EMRD token transactions"""
     try:
-        rows = await fetch(
-            """select id, type, amount, from_address, to_address, hash, created_at
-               from dashboard_token_events
-               order by created_at desc
-               limit $1""",
-            limit
+        return await paginated_json(
+            "transactions", TRANSACTIONS_KEYSET,
+            "select id, type, amount, from_address, to_address, hash, created_at from dashboard_token_events",
+            cursor, limit, stream, where=[token_data.EMRD_EVENTS]
         )
-        return {"transactions": [dict(r) for r in rows]}
+    except HTTPException:
+        raise
     except Exception:
-        return {"transactions": []}
+        return {"transactions": [], "next_cursor": None}
 
 # ---------- Bot Statistics ----------
 @app.get("/bots/{bot_id}/stats")
 async def get_bot_stats(bot_id: int, current=Depends(get_current_user)):
     """Get detailed statistics for a specific bot"""
     try:
-        bot = await fetchrow(
-            "select id, name, slug from dashboard_bots where id=$1",
-            bot_id
-        )
-        if not bot:
-            raise HTTPException(status_code=404, detail="Bot not found")
-        
-        # Get stats
-        users = await fetchrow(
-            "select count(1) as c from dashboard_bot_users where bot_id=$1",
-            bot_id
-        )
-        messages = await fetchrow(
-            "select count(1) as c from dashboard_bot_events where bot_id=$1 and type='message'",
-            bot_id
-        )
-        commands = await fetchrow(
-            "select count(1) as c from dashboard_bot_events where bot_id=$1 and type='command'",
-            bot_id
-        )
-        
-        return {
-            "bot": dict(bot),
-            "users_total": users["c"] if users else 0,
-            "messages_total": messages["c"] if messages else 0,
-            "commands_total": commands["c"] if commands else 0,
-            "last_activity": "2 minutes ago"
-        }
+        stats = await bot_counts(bot_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if not stats:
+        raise HTTPException(status_code=404, detail="Bot not found")
+    idle = stats.pop("idle_seconds")
+    return {**stats, "last_activity": monitor.ago(idle), "idle_seconds": idle}
+
+# ---------- Bulk ingestion for bots ----------
+INGEST_MAX_BODY = int(os.getenv("INGEST_MAX_BODY_BYTES", str(8 * 1024 * 1024)))
+
+@app.post("/ingest/{kind}", status_code=202)
+async def ingest_batch(kind: str, request: Request, current=Depends(get_current_user)):
+    """Accept an NDJSON batch of bot-events, moderation, logs or bot-users rows"""
+    if kind not in ingest.KINDS:
+        raise HTTPException(status_code=404, detail=f"Unknown ingest kind: {kind}")
+    body = await request.body()
+    if len(body) > INGEST_MAX_BODY:
+        raise HTTPException(status_code=413, detail="Batch too large")
+    try:
+        records = ingest.parse_ndjson(kind, body)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        buffered = ingest.submit(kind, records)
+    except ingest.QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(int(e.retry_after + 0.999))})
+    return {"accepted": len(records), "buffered": buffered}
+
+@app.get("/ingest/stats")
+async def ingest_stats(current=Depends(get_current_user)):
+    return ingest.snapshot()
 
 # ---------- System Health & Monitoring ----------
+@app.get("/system/pool")
+async def pool_stats(current=Depends(get_current_user)):
+    """DB pool gauges, acquire-wait and per-query timing histograms"""
+    return db.pool_stats()
+
+@app.get("/system/cache")
+async def cache_stats(current=Depends(get_current_user)):
+    """Response cache hit/miss/eviction counters"""
+    return cache.stats()
+
 @app.get("/system/health")
 async def system_health(current=Depends(get_current_user)):
-    """Get system health and uptime information"""
-    return {
-        "status": "operational",
-        "uptime_days": 45,
-        "uptime_percent": 99.9,
-        "response_time_ms": 45,
-        "database": "connected",
-        "cache": "active",
-        "queue": "healthy",
-        "last_backup": "2 hours ago"
-    }
+    """Live health: DB probe, pool saturation, request latency and event-loop lag"""
+    return {**await monitor.health(), "cache": cache.stats()}
+
+LOGS_KEYSET = Keyset(["created_at", "id"])
 
 @app.get("/system/logs")
-async def get_system_logs(current=Depends(get_current_user), limit: int = 100):
+async def get_system_logs(current=Depends(get_current_user), limit: int = 100,
+                          cursor: Optional[str] = None, stream: bool = False):
     """Get system activity logs"""
     try:
-        rows = await fetch(
-            """select level, message, created_at
-               from dashboard_logs
-               order by created_at desc
-               limit $1""",
-            limit
+        return await paginated_json(
+            "logs", LOGS_KEYSET,
+            "select id, level, message, created_at from dashboard_logs",
+            cursor, limit, stream
         )
-        return {"logs": [dict(r) for r in rows]}
+    except HTTPException:
+        raise
     except Exception:
-        return {"logs": []}
+        return {"logs": [], "next_cursor": None}
 
 # ---------- User Activity Analytics ----------
+ANALYTICS_TTL = float(os.getenv("CACHE_ANALYTICS_TTL", "60"))
+
 @app.get("/analytics/user-growth")
 async def user_growth_analytics(current=Depends(get_current_user)):
     """Get user growth analytics"""
     try:
-        weekly = await fetch(
-            """select date_trunc('week', created_at)::date as week, count(*) as count
-               from dashboard_users
-               group by week
-               order by week desc
-               limit 12"""
+        weekly = await cache.get_or_load(
+            ("analytics", "user-growth"), lambda: rollups.weekly_user_growth(12), ANALYTICS_TTL, ("users",)
         )
         return {
             "weekly_growth": [{"week": str(r["week"]), "users": r["count"]} for r in weekly]
@@ -467,59 +716,79 @@ async def user_growth_analytics(current=Depends(get_current_user)):
 async def bot_activity_analytics(current=Depends(get_current_user)):
     """Get bot activity analytics"""
     try:
-        rows = await fetch(
-            """select slug, count(*) as events
-               from dashboard_bots b
-               left join dashboard_bot_events e on b.id = e.bot_id
-               group by b.slug
-               order by events desc"""
+        rows = await cache.get_or_load(
+            ("analytics", "bot-activity"), rollups.bot_activity, ANALYTICS_TTL, ("bots",)
         )
-        return {"bot_activity": [dict(r) for r in rows]}
+        return FastJSONResponse({"bot_activity": rows})
     except Exception:
         return {"bot_activity": []}
 
+@app.get("/analytics/timeseries")
+async def timeseries_analytics(metric: str, bucket: str = "day", bot_id: Optional[int] = None,
+                               start: Optional[datetime] = None, end: Optional[datetime] = None,
+                               current=Depends(get_current_user)):
+    """Bucketed, gap-filled series of one metric, read from the coarsest rollup that fits"""
+    try:
+        timeseries.plan(metric, bucket, start, end, bot_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    key = ("analytics", "timeseries", metric, bucket, bot_id, start, end)
+    try:
+        return FastJSONResponse(await cache.get_or_load(
+            key, lambda: timeseries.series(metric, bucket, start, end, bot_id),
+            ANALYTICS_TTL if end else min(ANALYTICS_TTL, float(timeseries.BUCKETS[bucket]))
+        ))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Time series query timed out; use a coarser bucket or a shorter range")
+    except Exception as e:
+        logger.warning(f"Time series {metric}/{bucket} failed: {e}")
+        return {"metric": metric, "bot_id": bot_id, "bucket": bucket, "points": []}
+
 # ---------- Bot Groups Management ----------
+GROUPS_KEYSET = Keyset(["member_count", "id"])
+
 @app.get("/bot-groups")
-async def get_bot_groups(current=Depends(get_current_user)):
+async def get_bot_groups(current=Depends(get_current_user), limit: int = 200,
+                         cursor: Optional[str] = None, stream: bool = False):
     """Get all bot-managed groups"""
     try:
-        rows = await fetch(
-            """select id, chat_id, chat_title, chat_type, member_count, created_at
-               from dashboard_bot_groups
-               order by member_count desc"""
+        return await paginated_json(
+            "groups", GROUPS_KEYSET,
+            "select id, chat_id, chat_title, chat_type, member_count, created_at from dashboard_bot_groups",
+            cursor, limit, stream
         )
-        return {"groups": [dict(r) for r in rows]}
+    except HTTPException:
+        raise
     except Exception:
-        return {"groups": []}
+        return {"groups": [], "next_cursor": None}
 
 # ---------- Content & RSS Feeds ----------
+# Never-updated feeds sort last; the expression matches the feeds index.
+FEEDS_KEYSET = Keyset(["coalesce(last_update, '-infinity')", "id"], ["sort_key", "id"])
+
 @app.get("/content/feeds")
-async def get_feeds(current=Depends(get_current_user)):
+async def get_feeds(current=Depends(get_current_user), limit: int = 200,
+                    cursor: Optional[str] = None, stream: bool = False):
     """Get all RSS feeds managed"""
     try:
-        rows = await fetch(
-            """select id, name, url, last_update, item_count
-               from dashboard_rss_feeds
-               order by last_update desc"""
+        return await paginated_json(
+            "feeds", FEEDS_KEYSET,
+            """select id, name, url, last_update, item_count,
+                      coalesce(last_update, '-infinity') as sort_key
+               from dashboard_rss_feeds""",
+            cursor, limit, stream, drop=["sort_key"]
         )
-        return {"feeds": [dict(r) for r in rows]}
+    except HTTPException:
+        raise
     except Exception:
-        return {"feeds": []}
+        return {"feeds": [], "next_cursor": None}
 
 # ---------- Moderation Stats ----------
 @app.get("/moderation/stats")
 async def get_moderation_stats(current=Depends(get_current_user)):
     """Get moderation statistics"""
     try:
-        spam = await fetchrow("select count(1) as c from dashboard_moderation where type='spam'")
-        deleted_msgs = await fetchrow("select count(1) as c from dashboard_moderation where action='delete'")
-        users_banned = await fetchrow("select count(distinct user_id) as c from dashboard_moderation where action='ban'")
-        
-        return {
-            "spam_detected": spam["c"] if spam else 0,
-            "messages_deleted": deleted_msgs["c"] if deleted_msgs else 0,
-            "users_banned": users_banned["c"] if users_banned else 0
-        }
+        return await moderation_counts()
     except Exception:
         return {"spam_detected": 0, "messages_deleted": 0, "users_banned": 0}
 
@@ -528,17 +797,6 @@ async def get_moderation_stats(current=Depends(get_current_user)):
 async def get_payment_stats(current=Depends(get_current_user)):
     """Get payment and revenue statistics"""
     try:
-        total_revenue = await fetchrow(
-            "select sum(amount) as total from dashboard_payments where status='completed'"
-        )
-        transactions = await fetchrow(
-            "select count(1) as c from dashboard_payments"
-        )
-        
-        return {
-            "total_revenue_usd": float(total_revenue["total"] or 0),
-            "transactions_total": transactions["c"] if transactions else 0,
-            "avg_transaction": float((total_revenue["total"] or 0) / max(transactions["c"] or 1, 1))
-        }
+        return await payment_totals()
     except Exception:
         return {"total_revenue_usd": 0, "transactions_total": 0, "avg_transaction": 0}
@@ -0,0 +1,92 @@
+"""Per-request overhead of the old header-logging middleware vs. the access log.
+
+    python bench/bench_accesslog.py [requests]
+
+Drives a trivial route directly through the ASGI interface (no sockets), so
+the difference between the runs is middleware cost. Both loggers write to
+os.devnull to keep terminal I/O out of the numbers.
+"""
+import asyncio
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI  # noqa: E402
+import accesslog  # noqa: E402
+
+HEADERS = [
+    (b"host", b"api.example.org"),
+    (b"authorization", b"Bearer eyJhbGciOiJIUzI1NiJ9.eyJzdWIiOiIxIn0.signature"),
+    (b"user-agent", b"Mozilla/5.0 (Telegram WebApp)"),
+    (b"accept", b"application/json"),
+]
+
+
+def make_app(kind):
+    app = FastAPI()
+
+    @app.get("/bots/{bot_id}/stats")
+    async def stats(bot_id: int):
+        return {"bot": bot_id}
+
+    if kind == "old":
+        logger = logging.getLogger("bench.old")
+        logger.propagate = False
+        logger.addHandler(logging.StreamHandler(open(os.devnull, "w")))
+        logger.setLevel(logging.INFO)
+
+        @app.middleware("http")
+        async def log_requests(request, call_next):
+            logger.info(f"Request: {request.method} {request.url}")
+            logger.info(f"Headers: {dict(request.headers)}")
+            response = await call_next(request)
+            logger.info(f"Response status: {response.status_code}")
+            return response
+    elif kind == "new":
+        app.add_middleware(accesslog.AccessLogMiddleware)
+    return app
+
+
+async def call(app):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": "/bots/7/stats", "raw_path": b"/bots/7/stats",
+        "query_string": b"", "root_path": "", "headers": HEADERS,
+        "client": ("127.0.0.1", 5000), "server": ("127.0.0.1", 8000),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    await app(scope, receive, send)
+
+
+async def bench(kind, n):
+    app = make_app(kind)
+    for _ in range(200):
+        await call(app)
+    t0 = time.perf_counter()
+    for _ in range(n):
+        await call(app)
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+async def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    accesslog.start(open(os.devnull, "w"))
+    base = await bench("none", n)
+    print(f"{'no middleware':<24} {base:8.1f} us/request")
+    for kind, label in (("old", "header logging (old)"), ("new", "access log (new)")):
+        us = await bench(kind, n)
+        print(f"{label:<24} {us:8.1f} us/request  (+{us - base:.1f} us)")
+    accesslog.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
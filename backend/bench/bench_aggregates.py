@@ -0,0 +1,65 @@
+"""Sequential vs. batched dashboard counters against a local Postgres.
+
+    DATABASE_URL=postgresql://localhost/emerald python bench/bench_aggregates.py [rounds]
+
+Compares the old one-query-per-counter flow with the single-statement
+aggregates used by /metrics/overview, /moderation/stats and /payment/stats.
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aggregates  # noqa: E402
+from db import fetchrow, get_pool  # noqa: E402
+
+SEQUENTIAL = [
+    "select count(1) as c from dashboard_users",
+    "select count(1) as c from dashboard_ads where is_active=true",
+    "select count(1) as c from dashboard_bots where is_active=true",
+    "select count(1) as c from dashboard_moderation where type='spam'",
+    "select count(1) as c from dashboard_moderation where action='delete'",
+    "select count(distinct user_id) as c from dashboard_moderation where action='ban'",
+    "select sum(amount) as total from dashboard_payments where status='completed'",
+    "select count(1) as c from dashboard_payments",
+]
+
+
+async def sequential():
+    for q in SEQUENTIAL:
+        await fetchrow(q)
+
+
+async def batched():
+    await asyncio.gather(
+        aggregates.overview_counts(),
+        aggregates.moderation_counts(),
+        aggregates.payment_totals(),
+    )
+
+
+async def run(name, fn, rounds):
+    await fn()  # warm up plans and connections
+    samples = []
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    print(f"{name:<12} p50={statistics.median(samples):7.2f}ms "
+          f"p95={samples[int(len(samples) * 0.95) - 1]:7.2f}ms "
+          f"mean={statistics.fmean(samples):7.2f}ms")
+
+
+async def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    await get_pool()
+    await run("sequential", sequential, rounds)
+    await run("batched", batched, rounds)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+"""Authenticated-request throughput with and without the verified-JWT cache.
+
+    python bench/bench_auth.py [requests] [concurrency]
+
+Calls GET /me on the real app through the ASGI interface (no sockets, no DB),
+so the numbers isolate auth cost: header parsing, get_current_user and
+jwt_tools.decode_token.
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SECRET_KEY", "bench-secret-key-bench-secret-key")
+
+import jwt_tools  # noqa: E402
+from app import app  # noqa: E402
+
+
+async def call(headers):
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": "/me", "raw_path": b"/me",
+        "query_string": b"", "root_path": "", "headers": headers,
+        "client": ("127.0.0.1", 5000), "server": ("127.0.0.1", 8000),
+    }
+    status = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    await app(scope, receive, send)
+    assert status == [200], status
+
+
+async def run(label, n, concurrency, headers):
+    for _ in range(100):
+        await call(headers)
+    per_worker = n // concurrency
+
+    async def worker():
+        for _ in range(per_worker):
+            await call(headers)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    dt = time.perf_counter() - t0
+    print(f"{label:<14} {per_worker * concurrency / dt:9.0f} req/s  {dt / (per_worker * concurrency) * 1e6:7.1f} us/req")
+
+
+async def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    jwt_tools.load_keys()
+    token = jwt_tools.create_token({"sub": "1", "tg": {"id": 1}, "role": "dev", "tier": "pro"})
+    headers = [(b"authorization", f"Bearer {token}".encode())]
+
+    size = jwt_tools.CACHE_SIZE
+    jwt_tools.CACHE_SIZE = 0
+    jwt_tools.load_keys()
+    await run("no cache", n, concurrency, headers)
+    jwt_tools.CACHE_SIZE = size
+    await run("cached", n, concurrency, headers)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
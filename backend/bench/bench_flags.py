@@ -0,0 +1,68 @@
+"""Feature-flag evaluations per second (no database).
+
+    python bench/bench_flags.py [flags] [subjects]
+
+Compiles a synthetic flag set with a mix of plain config, kill switches,
+tier/role/bot targeting and percentage rollouts, then evaluates every flag
+for batches of subjects the way POST /feature-flags/evaluate does.
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import feature_flags  # noqa: E402
+
+TIERS = ("free", "pro", "business")
+ROLES = ("user", "dev", "admin")
+BOTS = ("content", "crossposter", "learning", "support", "affiliate", "dao")
+
+
+def make_flag(i):
+    kind = i % 5
+    if kind == 0:
+        return {"limit": random.randint(1, 100), "label": f"config {i}"}
+    if kind == 1:
+        return {"enabled": random.random() < 0.5, "rollout": 50}
+    if kind == 2:
+        return {"tiers": random.sample(TIERS, 2), "bot_slugs": random.sample(BOTS, 3)}
+    if kind == 3:
+        return {"rollout": random.randint(1, 99)}
+    return {"rules": [
+        {"roles": ["admin"], "value": "variant-admin"},
+        {"tiers": ["business"], "rollout": 50, "value": "variant-b"},
+        {"rollout": 10, "value": "variant-a"},
+    ], "off": "control"}
+
+
+def main():
+    n_flags = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    n_subjects = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    t0 = time.perf_counter()
+    for i in range(n_flags):
+        feature_flags.compile_flag(f"flag_{i}", make_flag(i))
+    print(f"compile       {n_flags} flags in {(time.perf_counter() - t0) * 1000:.1f} ms")
+
+    subjects = [{"telegram_id": random.randint(1, 10**9), "tier": random.choice(TIERS),
+                 "role": random.choice(ROLES), "bot_slug": random.choice(BOTS)} for _ in range(n_subjects)]
+    feature_flags.evaluate_many(subjects[:10])
+    rounds = 5
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        feature_flags.evaluate_many(subjects)
+    dt = time.perf_counter() - t0
+    evals = rounds * n_subjects * n_flags
+    print(f"evaluate      {evals / dt:12.0f} flag evals/s  {rounds * n_subjects / dt:10.0f} subjects/s  "
+          f"({dt / rounds * 1000:.1f} ms per {n_subjects}-subject batch)")
+
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        feature_flags.evaluate_many(subjects, ["flag_3", "flag_4"])
+    dt = time.perf_counter() - t0
+    print(f"two keys      {rounds * n_subjects / dt:10.0f} subjects/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Ingest throughput (rows/s) against a local Postgres.
+
+    DATABASE_URL=postgresql://localhost/emerald python bench/bench_ingest.py [rows] [batch]
+
+Pushes synthetic bot events through ingest.parse_ndjson/submit in NDJSON
+batches, lets the COPY flusher drain them and reports end-to-end rows/s.
+A per-row INSERT run over a tenth of the rows is shown for comparison.
+"""
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+import ingest  # noqa: E402
+
+
+def make_batch(n):
+    now = time.time()
+    lines = (json.dumps({
+        "bot_id": random.randint(1, 8),
+        "type": random.choice(("message", "message", "message", "command", "join")),
+        "user_id": random.randint(1, 200000),
+        "chat_id": -random.randint(1, 5000),
+        "created_at": now - random.random() * 86400,
+    }) for _ in range(n))
+    return "\n".join(lines).encode()
+
+
+async def copy_path(rows, batch):
+    ingest.start()
+    t0 = time.perf_counter()
+    sent = 0
+    while sent < rows:
+        body = make_batch(min(batch, rows - sent))
+        records = ingest.parse_ndjson("bot-events", body)
+        while True:
+            try:
+                ingest.submit("bot-events", records)
+                break
+            except ingest.QueueFull as e:
+                await asyncio.sleep(e.retry_after / 10)
+        sent += len(records)
+        await asyncio.sleep(0)
+    await ingest.stop()
+    dt = time.perf_counter() - t0
+    print(f"COPY ingest   {rows:>9} rows in {dt:6.2f}s  {rows / dt:10.0f} rows/s  {ingest.snapshot()}")
+
+
+async def insert_path(rows):
+    records = ingest.parse_ndjson("bot-events", make_batch(rows))
+    t0 = time.perf_counter()
+    for r in records:
+        await db.execute(
+            "insert into dashboard_bot_events(bot_id, type, user_id, chat_id, payload, created_at) "
+            "values($1, $2, $3, $4, $5, $6)", *r)
+    dt = time.perf_counter() - t0
+    print(f"row INSERTs   {rows:>9} rows in {dt:6.2f}s  {rows / dt:10.0f} rows/s")
+
+
+async def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    batch = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    await db.warmup()
+    await copy_path(rows, batch)
+    await insert_path(max(1, rows // 10))
+    await db.close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,78 @@
+"""CPU per row and peak memory of the JSON list-response paths.
+
+    DATABASE_URL=postgresql://localhost/emerald_bench python bench/bench_json.py [rows ...]
+
+For each size (default 10k, 50k, 100k) the same generate_series rows (id,
+text, timestamp, numeric and jsonb columns) are turned into a response
+body three ways:
+
+    records    Records -> dict -> jsonable_encoder -> json.dumps (the old path)
+    fastjson   Records -> fastjson.dumps (orjson when installed)
+    postgres   json_agg in the database, bytes passed straight through
+
+CPU is process time of this process only, so the postgres row is what the
+API worker pays; the database's own cost shows up in the wall time.
+Peak memory is the tracemalloc high-water mark while building the body.
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+import db  # noqa: E402
+import fastjson  # noqa: E402
+
+ROWS_SQL = """
+select i as id, 'item ' || i as name, now()::timestamp - make_interval(secs => i) as created_at,
+       (i * 1.37)::numeric as amount, jsonb_build_object('tier', 'pro', 'n', i) as meta
+from generate_series(1, $1) i
+"""
+JSON_SQL = f"select coalesce(json_agg(r), '[]'::json)::text from ({ROWS_SQL}) r"
+
+
+async def records(n):
+    rows = await db.fetch(ROWS_SQL, n)
+    return json.dumps(jsonable_encoder({"items": [dict(r) for r in rows]})).encode()
+
+
+async def fast(n):
+    rows = await db.fetch(ROWS_SQL, n)
+    return fastjson.dumps({"items": rows})
+
+
+async def postgres(n):
+    body = (await db.fetchrow(JSON_SQL, n))[0]
+    return b'{"items":' + body.encode() + b"}"
+
+
+async def measure(fn, n):
+    await fn(min(n, 1000))  # warm the statement cache
+    tracemalloc.start()
+    cpu, wall = time.process_time(), time.perf_counter()
+    body = await fn(n)
+    cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return cpu, wall, peak, len(body)
+
+
+async def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [10_000, 50_000, 100_000]
+    await db.warmup()
+    print(f"encoder: {'orjson' if fastjson.orjson else 'json'}")
+    print(f"{'rows':>8} {'path':<9} {'cpu us/row':>11} {'wall ms':>9} {'peak MiB':>9} {'body MiB':>9}")
+    for n in sizes:
+        for name, fn in (("records", records), ("fastjson", fast), ("postgres", postgres)):
+            cpu, wall, peak, size = await measure(fn, n)
+            print(f"{n:>8} {name:<9} {cpu / n * 1e6:>11.2f} {wall * 1000:>9.1f} "
+                  f"{peak / 2**20:>9.1f} {size / 2**20:>9.1f}")
+    await db.close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,81 @@
+"""Pool sizing benchmark: replay a synthetic endpoint query mix per pool size.
+
+    DATABASE_URL=postgresql://localhost/emerald \
+        python bench/bench_pool.py --sizes 2,5,10,20 --concurrency 50 --seconds 10
+
+For each max pool size it runs `concurrency` workers issuing the queries the
+dashboard endpoints issue, weighted roughly like a dashboard page load, and
+reports throughput, request latency and time spent waiting in pool.acquire().
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aggregates  # noqa: E402
+import db  # noqa: E402
+import rollups  # noqa: E402
+from stats import Histogram  # noqa: E402
+
+# (weight, sql, args)
+MIX = [
+    (10, aggregates.OVERVIEW_SQL, ()),
+    (5, aggregates.MODERATION_SQL, ()),
+    (5, aggregates.PAYMENT_SQL, ()),
+    (5, aggregates.BOT_STATS_SQL, (1,)),
+    (5, rollups.WEEKLY_GROWTH_SQL, (12,)),
+    (5, rollups.BOT_ACTIVITY_SQL, ()),
+    (10, "select id, username, title, env_token_key, is_active, meta from dashboard_bots order by id asc", ()),
+    (10, "select key, value, description from dashboard_feature_flags order by key asc", ()),
+    (10, "select id, name, placement, content, is_active, targeting, bot_slug from dashboard_ads order by id desc limit 200", ()),
+    (5, "select telegram_id, username, role, tier, created_at from dashboard_users order by created_at desc, telegram_id desc limit 100", ()),
+    (5, "select id, level, message, created_at from dashboard_logs order by created_at desc, id desc limit 100", ()),
+    (5, "select id, type, amount, created_at from dashboard_token_events order by created_at desc, id desc limit 100", ()),
+]
+
+
+async def worker(deadline, latency, errors):
+    weights = [w for w, _, _ in MIX]
+    while time.perf_counter() < deadline:
+        _, sql, args = random.choices(MIX, weights)[0]
+        t0 = time.perf_counter()
+        try:
+            await db.fetch(sql, *args)
+        except Exception:
+            errors[0] += 1
+        latency.observe(time.perf_counter() - t0)
+
+
+async def run(size, concurrency, seconds):
+    db.POOL_MAX_SIZE = size
+    db.POOL_MIN_SIZE = min(db.POOL_MIN_SIZE, size)
+    db.acquire_wait = Histogram()
+    await db.close_pool()
+    await db.warmup()
+    latency, errors = Histogram(), [0]
+    deadline = time.perf_counter() + seconds
+    await asyncio.gather(*(worker(deadline, latency, errors) for _ in range(concurrency)))
+    wait = db.acquire_wait
+    print(f"pool={size:<3} rps={latency.count / seconds:8.1f} "
+          f"p50={latency.quantile(0.5) * 1000:7.1f}ms p95={latency.quantile(0.95) * 1000:7.1f}ms "
+          f"p99={latency.quantile(0.99) * 1000:7.1f}ms "
+          f"acquire_p95={wait.quantile(0.95) * 1000:7.1f}ms errors={errors[0]}")
+    await db.close_pool()
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="2,5,10,20")
+    ap.add_argument("--concurrency", type=int, default=50)
+    ap.add_argument("--seconds", type=float, default=10)
+    opts = ap.parse_args()
+    for size in (int(s) for s in opts.sizes.split(",")):
+        await run(size, opts.concurrency, opts.seconds)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
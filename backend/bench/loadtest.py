@@ -0,0 +1,321 @@
+"""End-to-end load test: a weighted API route mix at a fixed request rate, per-route latency.
+
+    DATABASE_URL=postgresql://localhost/emerald_bench python bench/loadtest.py \\
+        [--rate 500] [--duration 30] [--concurrency 64] [--url http://127.0.0.1:8000] \\
+        [--save NAME] [--compare NAME]
+
+Without --url the app runs in-process behind httpx's ASGI transport, with its
+startup and shutdown hooks. With --url it drives a real uvicorn, so the
+numbers include HTTP parsing and the worker count. Requests are scheduled
+open-loop at --rate; latency is measured from the scheduled start, so a
+backed-up server shows up as queueing instead of a lower offered load
+(--rate 0 runs closed-loop as fast as --concurrency allows).
+
+Results go to bench/baselines/NAME.json. --compare prints per-route deltas
+against a saved baseline and exits 1 when p95 or throughput regress by more
+than --threshold. Seed the database first with bench/seed.py.
+
+Every route is in the mix except three that would skew later runs:
+POST /auth/logout revokes the shared bench token, and POST /bots and
+POST /ads insert a new row per call, growing the tables every other route
+reads. The remaining writes touch seeded rows only: POST /tiers rewrites a
+seeded user's tier, POST /wallets/ton the bench user's address and POST
+/feature-flags re-upserts a seeded flag.
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("SECRET_KEY", "bench-secret-key-bench-secret-key")
+os.environ.setdefault("BOT_TOKEN", "123456:bench")
+# Logins come from one client IP here; keep the per-IP bucket out of the way.
+os.environ.setdefault("LOGIN_IP_RATE", "1000000")
+os.environ.setdefault("LOGIN_IP_BURST", "1000000")
+
+import httpx  # noqa: E402
+import jwt_tools  # noqa: E402
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+USERS = 10_000
+BOTS = 8
+PLACEMENTS = ("header", "footer", "inline", "post")
+TIERS = ("free", "pro", "business")
+
+
+def init_data(user_id: int) -> str:
+    """Signed Telegram WebApp initData for /auth/webapp"""
+    d = {"user": json.dumps({"id": user_id, "username": f"user{user_id - 1_000_000}"}),
+         "auth_date": str(int(time.time())), "query_id": "bench"}
+    dcs = "\n".join(f"{k}={d[k]}" for k in sorted(d))
+    key = hmac.new(b"WebAppData", os.environ["BOT_TOKEN"].encode(), hashlib.sha256).digest()
+    d["hash"] = hmac.new(key, dcs.encode(), hashlib.sha256).hexdigest()
+    return urlencode(d)
+
+
+def widget_login(user_id: int) -> dict:
+    """Signed Telegram Login Widget payload for /auth/telegram"""
+    d = {"id": user_id, "username": f"user{user_id - 1_000_000}", "auth_date": int(time.time())}
+    dcs = "\n".join(f"{k}={d[k]}" for k in sorted(d))
+    key = hashlib.sha256(os.environ["BOT_TOKEN"].encode()).digest()
+    d["hash"] = hmac.new(key, dcs.encode(), hashlib.sha256).hexdigest()
+    return d
+
+
+def flag_subjects(n: int = 50) -> list:
+    return [{"telegram_id": 1_000_000 + random.randint(1, USERS), "tier": random.choice(TIERS),
+             "role": random.choice(("user", "dev")), "bot_slug": random.choice(("content", "dao", "support"))}
+            for _ in range(n)]
+
+
+def ndjson_events(n: int = 50) -> bytes:
+    now = time.time()
+    return "\n".join(json.dumps({"bot_id": random.randint(1, BOTS), "type": "message",
+                                 "user_id": 1_000_000 + random.randint(1, USERS),
+                                 "chat_id": -random.randint(1, 5000), "created_at": now}) for _ in range(n)).encode()
+
+
+# (route name, weight, request factory -> (method, path, kwargs))
+SCENARIOS = [
+    ("GET /healthz", 2, lambda: ("GET", "/healthz", {})),
+    ("GET /metrics", 1, lambda: ("GET", "/metrics", {})),
+    ("GET /", 2, lambda: ("GET", "/", {})),
+    ("GET /miniapp/{path}", 4, lambda: ("GET", "/miniapp/appcontent.html", {"headers": {"accept-encoding": "gzip"}})),
+    ("GET /offchain/{path}", 2, lambda: ("GET", "/offchain/emrd.json", {})),
+    ("GET /me", 5, lambda: ("GET", "/me", {})),
+    ("GET /auth/check", 3, lambda: ("GET", "/auth/check", {})),
+    ("POST /auth/webapp", 2, lambda: ("POST", "/auth/webapp",
+                                      {"json": {"init_data": init_data(1_000_000 + random.randint(1, USERS))}})),
+    ("POST /auth/telegram", 1, lambda: ("POST", "/auth/telegram",
+                                        {"json": widget_login(1_000_000 + random.randint(1, USERS))})),
+    ("GET /bots", 4, lambda: ("GET", "/bots", {})),
+    ("GET /bots/{bot_id}/stats", 4, lambda: ("GET", f"/bots/{random.randint(1, BOTS)}/stats", {})),
+    ("GET /metrics/overview", 4, lambda: ("GET", "/metrics/overview", {})),
+    ("GET /wallets", 2, lambda: ("GET", "/wallets", {})),
+    ("POST /wallets/ton", 1, lambda: ("POST", "/wallets/ton", {"json": {"address": "EQBench"}})),
+    ("GET /ads", 3, lambda: ("GET", "/ads", {"params": {"limit": 50}})),
+    ("GET /ads/serve", 15, lambda: ("GET", "/ads/serve", {"params": {
+        "placement": random.choice(PLACEMENTS), "bot_slug": random.choice(("content", "dao", "support")),
+        "language": random.choice(("de", "en"))}})),
+    ("GET /tiers", 2, lambda: ("GET", "/tiers", {"params": {"limit": 100}})),
+    ("POST /tiers", 1, lambda: ("POST", "/tiers", {"json": {
+        "telegram_id": 1_000_000 + random.randint(2, USERS), "tier": random.choice(TIERS)}})),
+    ("GET /feature-flags", 3, lambda: ("GET", "/feature-flags", {})),
+    ("POST /feature-flags", 1, lambda: ("POST", "/feature-flags", {"json": {
+        "key": "flag_0", "value": {"enabled": True}, "description": "Bench flag 0"}})),
+    ("POST /feature-flags/evaluate", 3, lambda: ("POST", "/feature-flags/evaluate",
+                                                 {"json": {"subjects": flag_subjects()}})),
+    ("GET /token/emrd", 5, lambda: ("GET", "/token/emrd", {})),
+    ("GET /token/holders", 2, lambda: ("GET", "/token/holders", {"params": {"limit": 50}})),
+    ("GET /token/transactions", 2, lambda: ("GET", "/token/transactions", {"params": {"limit": 100}})),
+    ("GET /system/logs", 2, lambda: ("GET", "/system/logs", {"params": {"limit": 100}})),
+    ("GET /system/health", 1, lambda: ("GET", "/system/health", {})),
+    ("GET /system/pool", 1, lambda: ("GET", "/system/pool", {})),
+    ("GET /system/cache", 1, lambda: ("GET", "/system/cache", {})),
+    ("GET /system/static", 1, lambda: ("GET", "/system/static", {})),
+    ("GET /analytics/user-growth", 2, lambda: ("GET", "/analytics/user-growth", {})),
+    ("GET /analytics/bot-activity", 2, lambda: ("GET", "/analytics/bot-activity", {})),
+    ("GET /analytics/timeseries", 3, lambda: ("GET", "/analytics/timeseries", {"params": {
+        "metric": random.choice(("bot_events", "moderation", "users")),
+        "bucket": random.choice(("minute", "hour", "day", "week"))}})),
+    ("GET /bot-groups", 2, lambda: ("GET", "/bot-groups", {"params": {"limit": 100}})),
+    ("GET /content/feeds", 2, lambda: ("GET", "/content/feeds", {})),
+    ("GET /moderation/stats", 2, lambda: ("GET", "/moderation/stats", {})),
+    ("GET /payment/stats", 2, lambda: ("GET", "/payment/stats", {})),
+    ("POST /ingest/{kind}", 3, lambda: ("POST", "/ingest/bot-events", {
+        "content": ndjson_events(), "headers": {"content-type": "application/x-ndjson"}})),
+    ("GET /ingest/stats", 1, lambda: ("GET", "/ingest/stats", {})),
+]
+
+
+def percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {name: [] for name, _, _ in SCENARIOS}
+        self.statuses = {name: {} for name, _, _ in SCENARIOS}
+
+    def add(self, name: str, status, seconds: float):
+        self.latencies[name].append(seconds)
+        self.statuses[name][str(status)] = self.statuses[name].get(str(status), 0) + 1
+
+    def report(self, elapsed: float) -> dict:
+        routes = {}
+        for name, lat in self.latencies.items():
+            if not lat:
+                continue
+            lat.sort()
+            ok = sum(n for s, n in self.statuses[name].items() if s.startswith("2") or s == "304")
+            routes[name] = {
+                "requests": len(lat),
+                "rps": round(len(lat) / elapsed, 1),
+                "p50_ms": round(percentile(lat, 0.50) * 1000, 2),
+                "p95_ms": round(percentile(lat, 0.95) * 1000, 2),
+                "p99_ms": round(percentile(lat, 0.99) * 1000, 2),
+                "max_ms": round(lat[-1] * 1000, 2),
+                "error_rate": round(1 - ok / len(lat), 4),
+                "statuses": self.statuses[name],
+            }
+        everything = sorted(x for lat in self.latencies.values() for x in lat)
+        routes["*"] = {
+            "requests": len(everything),
+            "rps": round(len(everything) / elapsed, 1),
+            "p50_ms": round(percentile(everything, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(everything, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(everything, 0.99) * 1000, 2),
+            "max_ms": round(everything[-1] * 1000, 2) if everything else 0.0,
+        }
+        return routes
+
+
+async def drive(client: httpx.AsyncClient, rate: float, duration: float, concurrency: int) -> dict:
+    names = [s[0] for s in SCENARIOS]
+    weights = [s[1] for s in SCENARIOS]
+    factories = {s[0]: s[2] for s in SCENARIOS}
+    rec = Recorder()
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(name: str, scheduled: float):
+        method, path, kwargs = factories[name]()
+        async with sem:
+            try:
+                r = await client.request(method, path, **kwargs)
+                status = r.status_code
+            except Exception as e:
+                status = type(e).__name__
+        rec.add(name, status, time.perf_counter() - scheduled)
+
+    t0 = time.perf_counter()
+    end = t0 + duration
+    tasks = set()
+    if rate > 0:
+        interval, n = 1.0 / rate, 0
+        while True:
+            scheduled = t0 + n * interval
+            if scheduled >= end:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            t = asyncio.create_task(one(random.choices(names, weights)[0], scheduled))
+            tasks.add(t)
+            t.add_done_callback(tasks.discard)
+            n += 1
+        await asyncio.gather(*tasks)
+    else:
+        async def worker():
+            while time.perf_counter() < end:
+                await one(random.choices(names, weights)[0], time.perf_counter())
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return rec.report(time.perf_counter() - t0)
+
+
+def _git_rev() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return "unknown"
+
+
+def print_report(routes: dict):
+    print(f"{'route':<30} {'reqs':>7} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'err':>6}")
+    for name, r in sorted(routes.items(), key=lambda kv: (kv[0] == "*", kv[0])):
+        print(f"{name:<30} {r['requests']:>7} {r['rps']:>8.1f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} "
+              f"{r['p99_ms']:>8.2f} {r.get('error_rate', 0):>6.1%}")
+
+
+def compare(routes: dict, baseline: dict, threshold: float) -> bool:
+    """Print per-route deltas; True if any route regressed beyond threshold"""
+    regressed = False
+    print(f"\n{'route':<30} {'p95 base':>9} {'p95 now':>9} {'delta':>8} {'rps delta':>10}")
+    for name, old in sorted(baseline["routes"].items()):
+        new = routes.get(name)
+        if new is None or not old["p95_ms"] or not old["rps"]:
+            continue
+        d95 = new["p95_ms"] / old["p95_ms"] - 1
+        drps = new["rps"] / old["rps"] - 1
+        bad = d95 > threshold or drps < -threshold
+        regressed |= bad
+        print(f"{name:<30} {old['p95_ms']:>9.2f} {new['p95_ms']:>9.2f} {d95:>+8.1%} {drps:>+10.1%}"
+              f"{'  REGRESSION' if bad else ''}")
+    return regressed
+
+
+async def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--rate", type=float, default=500, help="requests per second (0 = closed loop)")
+    ap.add_argument("--duration", type=float, default=30)
+    ap.add_argument("--concurrency", type=int, default=64)
+    ap.add_argument("--url", help="drive a running server instead of the in-process app")
+    ap.add_argument("--warmup", type=float, default=3, help="seconds of unrecorded traffic first")
+    ap.add_argument("--save", help="write bench/baselines/NAME.json")
+    ap.add_argument("--compare", help="diff against bench/baselines/NAME.json")
+    ap.add_argument("--threshold", type=float, default=0.15, help="allowed relative regression")
+    args = ap.parse_args()
+
+    jwt_tools.load_keys()
+    token = jwt_tools.create_token({"sub": "1000001", "tg": {"id": 1000001}, "role": "dev", "tier": "pro"})
+    headers = {"authorization": f"Bearer {token}"}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    app = None
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, headers=headers, limits=limits, timeout=30)
+    else:
+        from app import app
+        await app.router.startup()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench",
+                                   headers=headers, timeout=30)
+    try:
+        if args.warmup:
+            await drive(client, args.rate, args.warmup, args.concurrency)
+        routes = await drive(client, args.rate, args.duration, args.concurrency)
+    finally:
+        await client.aclose()
+        if app is not None:
+            await app.router.shutdown()
+
+    print_report(routes)
+    result = {
+        "meta": {
+            "git": _git_rev(),
+            "time": int(time.time()),
+            "mode": "http" if args.url else "asgi",
+            "rate": args.rate,
+            "duration": args.duration,
+            "concurrency": args.concurrency,
+            "python": platform.python_version(),
+            "db_pool": [os.getenv("DB_POOL_MIN_SIZE", "1"), os.getenv("DB_POOL_MAX_SIZE", "5")],
+        },
+        "routes": routes,
+    }
+    if args.save:
+        os.makedirs(BASELINES, exist_ok=True)
+        path = os.path.join(BASELINES, f"{args.save}.json")
+        with open(path, "w") as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nsaved {path}")
+    if args.compare:
+        with open(os.path.join(BASELINES, f"{args.compare}.json")) as f:
+            if compare(routes, json.load(f), args.threshold):
+                return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,168 @@
+"""Seed a local Postgres with production-sized data for the load tests.
+
+    DATABASE_URL=postgresql://localhost/emerald_bench python bench/seed.py [scale]
+
+Migrates the schema, then COPYs synthetic users, bots, ads, events, logs,
+moderation actions, token events, groups, feeds and payments. At scale 1
+that is 2M bot events, 5k ads and 10k users. Rollups are backfilled at the
+end so the analytics endpoints read what they read in production. Run it
+against an empty database: rows are appended, not replaced.
+"""
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from itertools import islice
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db  # noqa: E402
+import migrations  # noqa: E402
+import rollups  # noqa: E402
+
+CHUNK = 100_000
+BOTS = ["content", "crossposter", "learning", "support", "affiliate", "dao", "trade-api", "trade-dex"]
+NOW = datetime.utcnow()
+
+
+def ago(days: float = 90) -> datetime:
+    return NOW - timedelta(seconds=random.random() * days * 86400)
+
+
+def address(i: int) -> str:
+    return f"EQ{i:046d}"
+
+
+async def copy(table, columns, rows, total):
+    t0 = time.perf_counter()
+    done = 0
+    async with db.acquire() as c:
+        while done < total:
+            batch = list(islice(rows, min(CHUNK, total - done)))
+            if not batch:
+                break
+            await c.copy_records_to_table(table, columns=columns, records=batch)
+            done += len(batch)
+    print(f"{table:<28} {done:>10} rows  {time.perf_counter() - t0:6.1f}s")
+
+
+def users():
+    i = 0
+    while True:
+        i += 1
+        ts = ago(365)
+        yield (1_000_000 + i, f"user{i}", f"First{i}", None, None,
+               random.choice(("dev", "user", "user", "user")), random.choice(("free", "free", "pro", "business")),
+               address(i) if random.random() < 0.3 else None, ts, ts)
+
+
+def bot_events(n_users):
+    while True:
+        yield (random.randint(1, len(BOTS)), random.choice(("message", "message", "message", "command", "join", "leave")),
+               1_000_000 + random.randint(1, n_users), -random.randint(1, 5000), None, ago())
+
+
+def moderation(n_users):
+    while True:
+        yield (random.randint(1, len(BOTS)), -random.randint(1, 5000), 1_000_000 + random.randint(1, n_users),
+               random.choice(("spam", "spam", "flood", "link")), random.choice(("delete", "delete", "warn", "ban")),
+               None, ago())
+
+
+def logs():
+    while True:
+        yield (random.choice(("info", "info", "info", "warning", "error")), f"bench log line {random.random():.6f}", ago(30))
+
+
+def ads():
+    i = 0
+    while True:
+        i += 1
+        targeting = {"weight": random.randint(1, 5)}
+        if random.random() < 0.3:
+            targeting["tiers"] = random.sample(["free", "pro", "business"], 2)
+        if random.random() < 0.2:
+            targeting["languages"] = ["de"] if random.random() < 0.5 else ["en", "de"]
+        yield (f"Ad {i}", random.choice(("header", "footer", "inline", "post")), f"Content of ad {i}",
+               random.random() < 0.8, ago(30), NOW + timedelta(days=random.randint(-5, 60)),
+               json.dumps(targeting), random.choice(BOTS) if random.random() < 0.7 else None, ago(60))
+
+
+def token_events(n_users):
+    while True:
+        yield (random.choice(("transfer", "in", "out")), Decimal(random.randint(1, 100_000)),
+               address(random.randint(1, n_users)), address(random.randint(1, n_users)),
+               f"{random.getrandbits(128):032x}", ago())
+
+
+def bot_groups():
+    i = 0
+    while True:
+        i += 1
+        yield (random.randint(1, len(BOTS)), -1_000_000 - i, f"Group {i}",
+               random.choice(("group", "supergroup", "channel")), random.randint(3, 50_000), ago(365))
+
+
+def feeds():
+    i = 0
+    while True:
+        i += 1
+        yield (f"Feed {i}", f"https://example.com/feed/{i}.xml", ago(2) if random.random() < 0.9 else None,
+               random.randint(0, 500), ago(365))
+
+
+def payments(n_users):
+    while True:
+        yield (1_000_000 + random.randint(1, n_users), Decimal(random.randint(1, 500)), random.choice(("TON", "EUR")),
+               random.choice(("completed", "completed", "pending", "failed")), ago(180))
+
+
+async def main():
+    scale = float(sys.argv[1]) if len(sys.argv) > 1 else 1.0
+    n_users = int(10_000 * scale)
+    await db.warmup()
+    print(f"schema at version {await migrations.migrate()}")
+    async with db.acquire() as c:
+        await c.executemany(
+            "insert into dashboard_bots(slug, name, username, title, is_active) values($1, $2, $3, $4, true) "
+            "on conflict(slug) do nothing",
+            [(s, f"Emerald {s}", f"emerald_{s.replace('-', '_')}_bot", f"Emerald {s.title()}") for s in BOTS]
+        )
+        await c.executemany(
+            "insert into dashboard_feature_flags(key, value, description) values($1, $2, $3) on conflict do nothing",
+            [(f"flag_{i}", json.dumps({"enabled": random.random() < 0.5}), f"Bench flag {i}") for i in range(50)]
+        )
+    await copy("dashboard_users", ["telegram_id", "username", "first_name", "last_name", "photo_url",
+                                   "role", "tier", "ton_address", "created_at", "updated_at"], users(), n_users)
+    await copy("dashboard_bot_users", ["bot_id", "user_id", "created_at"],
+               ((b, 1_000_000 + u, ago(365)) for b in range(1, len(BOTS) + 1) for u in range(1, n_users + 1)
+                if (u + b) % 3 == 0), n_users * len(BOTS))
+    await copy("dashboard_bot_events", ["bot_id", "type", "user_id", "chat_id", "payload", "created_at"],
+               bot_events(n_users), int(2_000_000 * scale))
+    await copy("dashboard_moderation", ["bot_id", "chat_id", "user_id", "type", "action", "reason", "created_at"],
+               moderation(n_users), int(200_000 * scale))
+    await copy("dashboard_logs", ["level", "message", "created_at"], logs(), int(200_000 * scale))
+    await copy("dashboard_ads", ["name", "placement", "content", "is_active", "start_at", "end_at",
+                                 "targeting", "bot_slug", "created_at"], ads(), int(5_000 * scale))
+    await copy("dashboard_token_events", ["type", "amount", "from_address", "to_address", "hash", "created_at"],
+               token_events(n_users), int(100_000 * scale))
+    await copy("dashboard_bot_groups", ["bot_id", "chat_id", "chat_title", "chat_type", "member_count", "created_at"],
+               bot_groups(), int(2_000 * scale))
+    await copy("dashboard_rss_feeds", ["name", "url", "last_update", "item_count", "created_at"],
+               feeds(), int(500 * scale))
+    await copy("dashboard_payments", ["telegram_id", "amount", "currency", "status", "created_at"],
+               payments(n_users), int(20_000 * scale))
+    t0 = time.perf_counter()
+    await rollups.backfill()
+    print(f"rollup backfill {time.perf_counter() - t0:.1f}s")
+    async with db.acquire() as c:
+        await c.execute("analyze")
+    await db.close_pool()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,143 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Set, Tuple
+from db import fetch, fetchrow
+
+_MISS = object()
+
+
+class TTLCache:
+    """Bounded LRU cache with per-entry TTLs and tag-based invalidation"""
+
+    def __init__(self, maxsize: int = 1024, default_ttl: float = 30.0):
+        self.maxsize = maxsize
+        self.default_ttl = default_ttl
+        self._data: "OrderedDict[Any, Tuple[float, Any, Tuple[str, ...]]]" = OrderedDict()
+        self._tags: Dict[str, Set[Any]] = {}
+        self._inflight: Dict[Any, Tuple[asyncio.Task, tuple]] = {}
+        # Bumped on every invalidate/clear so a load that started earlier
+        # does not store its (possibly stale) result afterwards
+        self._generations: Dict[str, int] = {}
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return _MISS
+        if entry[0] < time.monotonic():
+            self._drop(key)
+            self.expirations += 1
+            self.misses += 1
+            return _MISS
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value, ttl: float = None, tags: Iterable[str] = ()):
+        tags = tuple(tags)
+        if key in self._data:
+            self._drop(key)
+        self._data[key] = (time.monotonic() + (self.default_ttl if ttl is None else ttl), value, tags)
+        for t in tags:
+            self._tags.setdefault(t, set()).add(key)
+        while len(self._data) > self.maxsize:
+            self._drop(next(iter(self._data)))
+            self.evictions += 1
+
+    def invalidate(self, *tags: str) -> int:
+        """Drop every entry carrying any of the given tags"""
+        n = 0
+        for t in tags:
+            self._generations[t] = self._generations.get(t, 0) + 1
+            for key in self._tags.pop(t, ()):
+                if key in self._data:
+                    self._drop(key)
+                    n += 1
+        self.invalidations += n
+        return n
+
+    def clear(self):
+        self._epoch += 1
+        self.invalidations += len(self._data)
+        self._data.clear()
+        self._tags.clear()
+
+    def _drop(self, key):
+        _, _, tags = self._data.pop(key)
+        for t in tags:
+            keys = self._tags.get(t)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[t]
+
+    def _generation(self, tags: Tuple[str, ...]) -> tuple:
+        return (self._epoch,) + tuple(self._generations.get(t, 0) for t in tags)
+
+    async def _load(self, key, loader, ttl, tags: Tuple[str, ...], gen: tuple):
+        try:
+            value = await loader()
+            if self._generation(tags) == gen:
+                self.set(key, value, ttl, tags)
+            return value
+        finally:
+            entry = self._inflight.get(key)
+            if entry is not None and entry[0] is asyncio.current_task():
+                del self._inflight[key]
+
+    async def get_or_load(self, key, loader, ttl: float = None, tags: Iterable[str] = ()):
+        """Return the cached value or await loader(); concurrent misses share one load.
+
+        The load runs as its own task, so a caller that is cancelled (e.g. a
+        client disconnect) does not cancel it for the others. A load that was
+        invalidated while in flight is returned to its callers but not stored,
+        and later misses start a fresh load instead of joining it.
+        """
+        value = self.get(key)
+        if value is not _MISS:
+            return value
+        tags = tuple(tags)
+        gen = self._generation(tags)
+        inflight = self._inflight.get(key)
+        if inflight is None or inflight[1] != gen:
+            task = asyncio.ensure_future(self._load(key, loader, ttl, tags, gen))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())  # retrieved even if every caller left
+            inflight = self._inflight[key] = (task, gen)
+        return await asyncio.shield(inflight[0])
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+cache = TTLCache(
+    maxsize=int(os.getenv("CACHE_MAX_ENTRIES", "1024")),
+    default_ttl=float(os.getenv("CACHE_DEFAULT_TTL", "30")),
+)
+
+
+async def cached_fetch(tags: Iterable[str], q: str, *args, ttl: float = None):
+    return await cache.get_or_load(("fetch", q, args), lambda: fetch(q, *args), ttl, tags)
+
+
+async def cached_fetchrow(tags: Iterable[str], q: str, *args, ttl: float = None):
+    return await cache.get_or_load(("fetchrow", q, args), lambda: fetchrow(q, *args), ttl, tags)
+
+
+def invalidate(*tags: str) -> int:
+    return cache.invalidate(*tags)
@@ -1,18 +1,107 @@
-import os, asyncpg
+import os, re, time, asyncio, asyncpg
+from contextlib import asynccontextmanager
+from stats import Histogram, request_queries
+
+# Pool settings; set DB_STATEMENT_CACHE_SIZE=0 behind pgbouncer in transaction mode.
+POOL_MIN_SIZE=int(os.getenv("DB_POOL_MIN_SIZE","1"))
+POOL_MAX_SIZE=int(os.getenv("DB_POOL_MAX_SIZE","5"))
+MAX_INACTIVE_LIFETIME=float(os.getenv("DB_MAX_INACTIVE_CONNECTION_LIFETIME","300"))
+MAX_QUERIES=int(os.getenv("DB_MAX_QUERIES","50000"))
+COMMAND_TIMEOUT=float(os.getenv("DB_COMMAND_TIMEOUT","30")) or None
+ACQUIRE_TIMEOUT=float(os.getenv("DB_ACQUIRE_TIMEOUT","10")) or None
+STATEMENT_CACHE_SIZE=int(os.getenv("DB_STATEMENT_CACHE_SIZE","256"))
+STATEMENT_CACHE_LIFETIME=float(os.getenv("DB_STATEMENT_CACHE_LIFETIME","3600"))
+
 _pool=None
+_pool_lock=asyncio.Lock()
+acquire_wait=Histogram()
+query_time={}
+_waiting=0
+
 async def get_pool():
   global _pool
   if _pool is None:
-    db=os.getenv("DATABASE_URL")
-    if not db: raise RuntimeError("DATABASE_URL is not set")
-    _pool=await asyncpg.create_pool(dsn=db, min_size=1, max_size=5)
+    async with _pool_lock:
+      if _pool is None:
+        db=os.getenv("DATABASE_URL")
+        if not db: raise RuntimeError("DATABASE_URL is not set")
+        _pool=await asyncpg.create_pool(
+          dsn=db, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE,
+          max_queries=MAX_QUERIES, max_inactive_connection_lifetime=MAX_INACTIVE_LIFETIME,
+          command_timeout=COMMAND_TIMEOUT, statement_cache_size=STATEMENT_CACHE_SIZE,
+          max_cached_statement_lifetime=STATEMENT_CACHE_LIFETIME)
   return _pool
-async def fetchrow(q,*a):
+
+async def warmup():
+  """Open the pool and check min_size connections out at once so the first requests don't pay for connects"""
   p=await get_pool()
-  async with p.acquire() as c: return await c.fetchrow(q,*a)
-async def fetch(q,*a):
+  async def ping():
+    async with acquire() as c: await c.fetchval("select 1")
+  await asyncio.gather(*(ping() for _ in range(p.get_min_size())))
+
+async def close_pool():
+  global _pool
+  if _pool is not None:
+    await _pool.close()
+    _pool=None
+
+@asynccontextmanager
+async def acquire():
+  global _waiting
   p=await get_pool()
-  async with p.acquire() as c: return await c.fetch(q,*a)
+  t=time.perf_counter(); _waiting+=1
+  try: c=await p.acquire(timeout=ACQUIRE_TIMEOUT)
+  finally: _waiting-=1
+  acquire_wait.observe(time.perf_counter()-t)
+  try: yield c
+  finally: await p.release(c)
+
+_names={}
+_name_re=re.compile(r"\b(select|insert\s+into|update|delete\s+from|from|copy)\s+([a-z_][\w.]*)",re.I)
+def query_name(q):
+  """Short, stable label for a statement, e.g. 'select:dashboard_ads'"""
+  n=_names.get(q)
+  if n is None:
+    verb=q.lstrip().split(None,1)[0].lower() if q.strip() else "?"
+    tables=[m.group(2).lower() for m in _name_re.finditer(q) if m.group(2).lower().startswith("dashboard_")]
+    n=_names[q]=f"{verb}:{tables[0]}" if tables else verb
+  return n
+
+def _observe(q,t):
+  n=query_name(q); h=query_time.get(n)
+  if h is None: h=query_time[n]=Histogram()
+  h.observe(time.perf_counter()-t)
+  c=request_queries.get()
+  if c is not None: c[0]+=1
+
+async def fetchrow(q,*a):
+  async with acquire() as c:
+    t=time.perf_counter()
+    try: return await c.fetchrow(q,*a)
+    finally: _observe(q,t)
+async def fetch(q,*a):
+  async with acquire() as c:
+    t=time.perf_counter()
+    try: return await c.fetch(q,*a)
+    finally: _observe(q,t)
 async def execute(q,*a):
-  p=await get_pool()
-  async with p.acquire() as c: return await c.execute(q,*a)
+  async with acquire() as c:
+    t=time.perf_counter()
+    try: return await c.execute(q,*a)
+    finally: _observe(q,t)
+async def stream(q,*a,prefetch=500):
+  """Yield rows through a server-side cursor; holds one connection until exhausted"""
+  async with acquire() as c:
+    async with c.transaction():
+      async for r in c.cursor(q,*a,prefetch=prefetch): yield r
+
+def pool_stats():
+  p=_pool
+  size=p.get_size() if p else 0
+  idle=p.get_idle_size() if p else 0
+  return {
+    "size":size, "idle":idle, "in_use":size-idle, "waiting":_waiting,
+    "min_size":POOL_MIN_SIZE, "max_size":POOL_MAX_SIZE,
+    "acquire_wait_s":acquire_wait.snapshot(),
+    "queries":{n:h.snapshot() for n,h in sorted(query_time.items())},
+  }
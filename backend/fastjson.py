@@ -0,0 +1,46 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from asyncpg import Record
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # optional: stdlib json fallback
+    orjson = None
+
+
+def _default(v):
+    if isinstance(v, Record):
+        return dict(v)
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    if isinstance(v, (set, frozenset, tuple)):
+        return list(v)
+    return str(v)
+
+
+if orjson is not None:
+    def dumps(obj) -> bytes:
+        """Serialize to JSON bytes; asyncpg Records and Decimals are handled directly"""
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+else:
+    def dumps(obj) -> bytes:
+        """Serialize to JSON bytes; asyncpg Records and Decimals are handled directly"""
+        return json.dumps(obj, default=_default, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+class FastJSONResponse(Response):
+    """JSON response rendered with orjson when it is installed"""
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def raw_json(body: bytes, status_code: int = 200) -> Response:
+    """Pass already-serialized JSON (e.g. built by Postgres) through untouched"""
+    return Response(body, status_code=status_code, media_type="application/json")
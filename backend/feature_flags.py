@@ -0,0 +1,146 @@
+"""Server-side feature-flag evaluation.
+
+A flag's jsonb value is compiled once into rules; evaluating a subject
+(telegram_id, tier, role, bot_slug) is then a few set lookups and one hash
+per percentage rule. Recognised keys of a flag value:
+
+    enabled    false acts as a kill switch: everyone gets "off"
+    value      served when the flag is on (default true)
+    off        served when it is off or nothing matches (default false)
+    rules      [{tiers, roles, bot_slugs, rollout, value}, ...], first match wins
+    tiers, roles, bot_slugs, rollout
+               top-level targeting, checked after the rules
+    salt       bucketing salt (default: the flag key)
+
+rollout is a percentage of telegram ids, bucketed by a stable hash of
+salt:telegram_id so a user keeps their bucket as the percentage grows.
+Values without any of these keys are plain config and are served as-is.
+"""
+import hashlib
+import json
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from db import fetch
+
+logger = logging.getLogger(__name__)
+
+_RULE_KEYS = ("tiers", "roles", "bot_slugs", "rollout")
+_FLAG_KEYS = ("enabled", "value", "off", "rules", "salt") + _RULE_KEYS
+
+
+def bucket(salt: str, telegram_id) -> int:
+    """Stable bucket in [0, 10000) for a subject"""
+    h = hashlib.blake2b(f"{salt}:{telegram_id}".encode(), digest_size=8).digest()
+    return int.from_bytes(h, "big") % 10000
+
+
+def _set(v) -> Optional[frozenset]:
+    if v is None:
+        return None
+    return frozenset(v if isinstance(v, (list, tuple)) else (v,))
+
+
+class Rule:
+    __slots__ = ("tiers", "roles", "bot_slugs", "threshold", "value")
+
+    def __init__(self, spec: dict, default_value):
+        self.tiers = _set(spec.get("tiers"))
+        self.roles = _set(spec.get("roles"))
+        self.bot_slugs = _set(spec.get("bot_slugs"))
+        rollout = spec.get("rollout")
+        self.threshold = None if rollout is None else int(round(max(0.0, min(100.0, float(rollout))) * 100))
+        self.value = spec.get("value", default_value)
+
+
+class CompiledFlag:
+    __slots__ = ("key", "raw", "plain", "killed", "on", "off", "rules", "salt")
+
+    def __init__(self, key: str, value):
+        if isinstance(value, str):
+            value = json.loads(value)
+        self.key = key
+        self.raw = value
+        self.plain = not isinstance(value, dict) or not any(k in value for k in _FLAG_KEYS)
+        value = value if isinstance(value, dict) else {}
+        self.killed = value.get("enabled") is False
+        self.on = value.get("value", True)
+        self.off = value.get("off", False)
+        self.salt = str(value.get("salt", key))
+        rules = value.get("rules") or []
+        if not isinstance(rules, list) or not all(isinstance(r, dict) for r in rules):
+            raise ValueError("rules must be a list of objects")
+        self.rules: Tuple[Rule, ...] = tuple(Rule(r, self.on) for r in rules)
+        if any(k in value for k in _RULE_KEYS):
+            self.rules += (Rule(value, self.on),)
+        elif not self.rules:
+            self.rules = (Rule({}, self.on),)  # no targeting: on for everyone
+
+    def evaluate(self, telegram_id, tier, role, bot_slug):
+        if self.plain:
+            return self.raw
+        if self.killed:
+            return self.off
+        b = -1  # hashed at most once, and only if a rollout rule is reached
+        for r in self.rules:
+            if r.tiers is not None and tier not in r.tiers:
+                continue
+            if r.roles is not None and role not in r.roles:
+                continue
+            if r.bot_slugs is not None and bot_slug not in r.bot_slugs:
+                continue
+            if r.threshold is not None:
+                if b < 0:
+                    b = bucket(self.salt, telegram_id)
+                if b >= r.threshold:
+                    continue
+            return r.value
+        return self.off
+
+
+_flags: Dict[str, CompiledFlag] = {}
+
+
+def validate(key: str, value):
+    """Raise ValueError if a flag value would not compile into rules"""
+    try:
+        CompiledFlag(key, value)
+    except Exception as e:
+        raise ValueError(f"Invalid feature flag value: {e}") from e
+
+
+def compile_flag(key: str, value):
+    """Compile and install one flag; a bad value is logged and served as plain config"""
+    try:
+        _flags[key] = CompiledFlag(key, value)
+    except Exception as e:
+        logger.warning(f"Feature flag {key} has invalid rules, serving it raw: {e}")
+        c = CompiledFlag(key, None)
+        c.raw = value
+        _flags[key] = c
+
+
+async def rebuild():
+    global _flags
+    rows = await fetch("select key, value from dashboard_feature_flags")
+    old, _flags = _flags, {}
+    try:
+        for r in rows:
+            compile_flag(r["key"], r["value"])
+    except Exception:
+        _flags = old
+        raise
+
+
+def evaluate(subject: Dict[str, Any], keys: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    tid, tier, role, slug = subject.get("telegram_id"), subject.get("tier"), subject.get("role"), subject.get("bot_slug")
+    flags = _flags if keys is None else {k: _flags[k] for k in keys if k in _flags}
+    return {k: f.evaluate(tid, tier, role, slug) for k, f in flags.items()}
+
+
+def evaluate_many(subjects: List[Dict[str, Any]], keys: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+    keys = list(keys) if keys is not None else None
+    return [evaluate(s, keys) for s in subjects]
+
+
+def stats() -> dict:
+    return {"flags": len(_flags), "rules": sum(len(f.rules) for f in _flags.values())}
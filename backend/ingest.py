@@ -0,0 +1,221 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+from db import acquire
+
+logger = logging.getLogger(__name__)
+
+# Bots post NDJSON batches; rows wait in a bounded in-process buffer and are
+# written with COPY once a kind reaches FLUSH_ROWS or every FLUSH_INTERVAL.
+MAX_BUFFERED = int(os.getenv("INGEST_MAX_BUFFERED_ROWS", "100000"))
+FLUSH_ROWS = int(os.getenv("INGEST_FLUSH_ROWS", "5000"))
+FLUSH_INTERVAL = float(os.getenv("INGEST_FLUSH_INTERVAL", "1.0"))
+MAX_ATTEMPTS = 3
+# Accepted created_at window; rows outside it are rejected at validation
+# rather than failing a whole COPY batch later
+MAX_AGE_DAYS = float(os.getenv("INGEST_MAX_AGE_DAYS", "365"))
+MAX_FUTURE_SECONDS = float(os.getenv("INGEST_MAX_FUTURE_SECONDS", "86400"))
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__("Ingest buffer is full")
+        self.retry_after = retry_after
+
+
+def _ts(v) -> datetime:
+    """Naive UTC timestamp from an ISO string or unix seconds (default: now)"""
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    if v is None:
+        return now
+    try:
+        if isinstance(v, (int, float)) and not isinstance(v, bool):
+            d = datetime.fromtimestamp(v, timezone.utc).replace(tzinfo=None)
+        elif isinstance(v, str):
+            d = datetime.fromisoformat(v.replace("Z", "+00:00"))
+            d = d.astimezone(timezone.utc).replace(tzinfo=None) if d.tzinfo else d
+        else:
+            raise ValueError
+    except (OverflowError, OSError, ValueError):
+        raise ValueError(f"invalid timestamp {v!r}")
+    if not now - timedelta(days=MAX_AGE_DAYS) <= d <= now + timedelta(seconds=MAX_FUTURE_SECONDS):
+        raise ValueError(f"created_at {d.isoformat()} is outside the accepted range")
+    return d
+
+
+def _int(v, name) -> int:
+    if isinstance(v, bool) or not isinstance(v, (int, str)):
+        raise ValueError(f"{name} must be an integer")
+    return int(v)
+
+
+def _opt_int(v, name) -> Optional[int]:
+    return None if v is None else _int(v, name)
+
+
+def _str(v, name, required=True) -> Optional[str]:
+    if v is None and not required:
+        return None
+    if not isinstance(v, str):
+        raise ValueError(f"{name} must be a string")
+    return v
+
+
+def _json(v) -> Optional[str]:
+    return None if v is None else json.dumps(v)
+
+
+class Kind:
+    def __init__(self, table: str, columns: Tuple[str, ...], convert: Callable[[dict], tuple],
+                 conflict: Optional[str] = None):
+        self.table = table
+        self.columns = columns
+        self.convert = convert
+        # Tables with a unique key go through a temp table + insert ... on conflict
+        self.conflict = conflict
+
+
+KINDS: Dict[str, Kind] = {
+    "bot-events": Kind(
+        "dashboard_bot_events", ("bot_id", "type", "user_id", "chat_id", "payload", "created_at"),
+        lambda r: (_int(r.get("bot_id"), "bot_id"), _str(r.get("type"), "type"),
+                   _opt_int(r.get("user_id"), "user_id"), _opt_int(r.get("chat_id"), "chat_id"),
+                   _json(r.get("payload")), _ts(r.get("created_at")))),
+    "moderation": Kind(
+        "dashboard_moderation", ("bot_id", "chat_id", "user_id", "type", "action", "reason", "created_at"),
+        lambda r: (_opt_int(r.get("bot_id"), "bot_id"), _opt_int(r.get("chat_id"), "chat_id"),
+                   _opt_int(r.get("user_id"), "user_id"), _str(r.get("type"), "type", False),
+                   _str(r.get("action"), "action", False), _str(r.get("reason"), "reason", False),
+                   _ts(r.get("created_at")))),
+    "logs": Kind(
+        "dashboard_logs", ("level", "message", "created_at"),
+        lambda r: (_str(r.get("level", "info"), "level"), _str(r.get("message"), "message"),
+                   _ts(r.get("created_at")))),
+    "bot-users": Kind(
+        "dashboard_bot_users", ("bot_id", "user_id", "created_at"),
+        lambda r: (_int(r.get("bot_id"), "bot_id"), _int(r.get("user_id"), "user_id"),
+                   _ts(r.get("created_at"))),
+        conflict="(bot_id, user_id)"),
+}
+
+_buffers: Dict[str, List[tuple]] = {k: [] for k in KINDS}
+_buffered = 0
+_wake = None
+_task = None
+stats = {"accepted": 0, "rejected": 0, "flushed": 0, "dropped": 0, "flushes": 0}
+
+
+def parse_ndjson(kind: str, body: bytes) -> List[tuple]:
+    """Validate an NDJSON body into COPY records; ValueError names the bad line"""
+    k = KINDS[kind]
+    out = []
+    for n, line in enumerate(body.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            obj = json.loads(line)
+            if not isinstance(obj, dict):
+                raise ValueError("expected a JSON object")
+            out.append(k.convert(obj))
+        except ValueError as e:
+            raise ValueError(f"line {n}: {e}")
+    return out
+
+
+def submit(kind: str, records: List[tuple]) -> int:
+    """Buffer records or raise QueueFull; returns the buffered row count"""
+    global _buffered
+    if _buffered + len(records) > MAX_BUFFERED:
+        stats["rejected"] += len(records)
+        raise QueueFull(retry_after=max(1.0, FLUSH_INTERVAL))
+    buf = _buffers[kind]
+    buf.extend(records)
+    _buffered += len(records)
+    stats["accepted"] += len(records)
+    if len(buf) >= FLUSH_ROWS and _wake is not None:
+        _wake.set()
+    return _buffered
+
+
+async def _copy(kind: str, records: List[tuple]):
+    k = KINDS[kind]
+    async with acquire() as c:
+        if not k.conflict:
+            await c.copy_records_to_table(k.table, records=records, columns=k.columns)
+            return
+        cols = ", ".join(k.columns)
+        async with c.transaction():
+            await c.execute(f"create temp table if not exists _ingest_{k.table} "
+                            f"(like {k.table} including defaults) on commit delete rows")
+            await c.copy_records_to_table(f"_ingest_{k.table}", records=records, columns=k.columns)
+            await c.execute(f"insert into {k.table}({cols}) select {cols} from _ingest_{k.table} "
+                            f"on conflict {k.conflict} do nothing")
+
+
+async def flush(kind: str = None):
+    """Write out buffered rows (every kind by default)"""
+    global _buffered
+    for name in ([kind] if kind else list(KINDS)):
+        records = _buffers[name]
+        if not records:
+            continue
+        _buffers[name] = []
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            try:
+                await _copy(name, records)
+                stats["flushed"] += len(records)
+                stats["flushes"] += 1
+                break
+            except asyncio.CancelledError:
+                _buffers[name][:0] = records
+                raise
+            except Exception as e:
+                if attempt == MAX_ATTEMPTS:
+                    logger.error(f"Dropping {len(records)} {name} rows after {attempt} attempts: {e}")
+                    stats["dropped"] += len(records)
+                else:
+                    logger.warning(f"Ingest flush of {name} failed (attempt {attempt}): {e}")
+                    await asyncio.sleep(0.5 * attempt)
+        _buffered -= len(records)
+
+
+async def _flush_forever():
+    while True:
+        try:
+            await asyncio.wait_for(_wake.wait(), FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _wake.clear()
+        await flush()
+
+
+def start():
+    global _task, _wake
+    if _task is None:
+        _wake = asyncio.Event()
+        _task = asyncio.create_task(_flush_forever())
+
+
+async def stop():
+    """Stop the flusher and write out whatever is still buffered"""
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+    try:
+        await flush()
+    except Exception as e:
+        logger.error(f"Final ingest flush failed: {e}")
+
+
+def snapshot() -> dict:
+    return {**stats, "buffered": _buffered, "max_buffered": MAX_BUFFERED,
+            "per_kind": {k: len(v) for k, v in _buffers.items()}, "ts": int(time.time())}
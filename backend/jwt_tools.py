@@ -1,11 +1,69 @@
-import os, time, jwt
-def create_token(payload, exp_seconds=604800):
+import os, time, uuid, hashlib, jwt
+from collections import OrderedDict
+
+# Signing keys: JWT_KEYS="kid1:secret1,kid2:secret2", JWT_ACTIVE_KID picks the signer
+# (default: first). SECRET_KEY stays valid as kid "default", also for tokens without kid.
+_keys=None
+_active=None
+CACHE_SIZE=int(os.getenv("JWT_CACHE_SIZE","4096"))
+_cache=OrderedDict()  # token digest -> verified claims
+_revoked={}  # jti -> exp
+
+def load_keys():
+  global _keys,_active
+  keys={}
+  for part in os.getenv("JWT_KEYS","").split(","):
+    kid,_,secret=part.strip().partition(":")
+    if kid and secret: keys[kid]=secret
   s=os.getenv("SECRET_KEY")
-  if not s: raise RuntimeError("SECRET_KEY env is missing")
+  if s: keys.setdefault("default",s)
+  if not keys: raise RuntimeError("SECRET_KEY env is missing")
+  active=os.getenv("JWT_ACTIVE_KID") or next(iter(keys))
+  if active not in keys: raise RuntimeError(f"JWT_ACTIVE_KID {active!r} is not in JWT_KEYS")
+  _keys,_active=keys,active
+  _cache.clear()
+
+def _ensure_keys():
+  if _keys is None: load_keys()
+
+def create_token(payload, exp_seconds=604800):
+  _ensure_keys()
   now=int(time.time())
-  payload=dict(payload, iat=now, exp=now+exp_seconds)
-  return jwt.encode(payload,s,algorithm="HS256")
+  payload=dict(payload, iat=now, exp=now+exp_seconds, jti=uuid.uuid4().hex)
+  return jwt.encode(payload,_keys[_active],algorithm="HS256",headers={"kid":_active})
+
 def decode_token(t):
-  s=os.getenv("SECRET_KEY")
-  if not s: raise RuntimeError("SECRET_KEY env is missing")
-  return jwt.decode(t,s,algorithms=["HS256"])
+  """Verified claims; repeat calls with the same token are served from memory until exp"""
+  _ensure_keys()
+  digest=hashlib.blake2b(t.encode(),digest_size=16).digest()
+  now=time.time()
+  claims=_cache.get(digest)
+  if claims is not None:
+    if claims["exp"]<=now:
+      del _cache[digest]
+      raise jwt.ExpiredSignatureError("Signature has expired")
+    if claims.get("jti") in _revoked: raise jwt.InvalidTokenError("Token has been revoked")
+    _cache.move_to_end(digest)
+    return dict(claims)
+  key=_keys.get(jwt.get_unverified_header(t).get("kid","default"))
+  if key is None: raise jwt.InvalidTokenError("Unknown signing key")
+  claims=jwt.decode(t,key,algorithms=["HS256"])
+  if claims.get("jti") in _revoked: raise jwt.InvalidTokenError("Token has been revoked")
+  if CACHE_SIZE>0 and isinstance(claims.get("exp"),(int,float)):
+    _cache[digest]=claims
+    if len(_cache)>CACHE_SIZE: _cache.popitem(last=False)
+  return dict(claims)
+
+def _prune_revoked(now):
+  for j in [j for j,e in _revoked.items() if e<=now]: del _revoked[j]
+
+def revoke(jti, exp):
+  """Revoke on this worker; expired entries are dropped here so the list stays bounded between reloads"""
+  _prune_revoked(time.time())
+  if jti: _revoked[jti]=exp
+
+def set_revoked(items):
+  """Replace the in-memory revocation list with (jti, exp) pairs, dropping expired ones"""
+  now=time.time()
+  _revoked.clear()
+  _revoked.update((j,e) for j,e in items if e>now)
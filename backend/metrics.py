@@ -0,0 +1,117 @@
+import os
+import time
+from typing import Dict, List, Tuple
+import db
+import monitor
+from cache import cache
+from stats import Histogram, LATENCY_BUCKETS
+
+# Prometheus text exposition (format 0.0.4) without a client library.
+# Request series are looked up through nested dicts keyed by the label
+# values, so recording a request allocates nothing once its series exists;
+# all formatting happens at scrape time.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")  # optional bearer token for scrapers
+
+
+class HistogramVec:
+    """Histogram family with one or two labels"""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...], buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self.series: Dict[Tuple, Histogram] = {}
+        self._index: Dict = {}
+
+    def child(self, a, b=None) -> Histogram:
+        level = self._index.get(a)
+        if level is None:
+            level = self._index[a] = {}
+        h = level.get(b)
+        if h is None:
+            h = level[b] = Histogram(self.buckets)
+            self.series[(a,) if len(self.labelnames) == 1 else (a, b)] = h
+        return h
+
+
+REQUEST_LATENCY = HistogramVec(
+    "http_request_duration_seconds", "HTTP request latency by route template and status", ("route", "status"))
+REQUEST_QUERIES = HistogramVec(
+    "http_request_db_queries", "DB queries issued per HTTP request", ("route",), QUERY_COUNT_BUCKETS)
+
+
+def observe(route: str, status: int, seconds: float, queries: int = 0):
+    """Request hook, called once per request by the access-log middleware"""
+    REQUEST_LATENCY.child(route, status).observe(seconds)
+    REQUEST_QUERIES.child(route).observe(queries)
+
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _bound(b: float) -> str:
+    return "+Inf" if b == float("inf") else repr(float(b))
+
+
+def _histogram(out: List[str], name: str, help: str, labelnames, series):
+    out.append(f"# HELP {name} {help}")
+    out.append(f"# TYPE {name} histogram")
+    for values, h in sorted(series, key=lambda kv: tuple(map(str, kv[0]))):
+        for bound, total in h.cumulative():
+            le = 'le="' + _bound(bound) + '"'
+            out.append(f"{name}_bucket{_labels(labelnames, values, le)} {total}")
+        out.append(f"{name}_sum{_labels(labelnames, values)} {h.sum}")
+        out.append(f"{name}_count{_labels(labelnames, values)} {h.count}")
+
+
+def _simple(out: List[str], kind: str, name: str, help: str, value, labelnames=(), values=()):
+    out.append(f"# HELP {name} {help}")
+    out.append(f"# TYPE {name} {kind}")
+    out.append(f"{name}{_labels(labelnames, values)} {value}")
+
+
+def render() -> str:
+    out: List[str] = []
+    out.append("# HELP http_requests_total HTTP requests by route template and status")
+    out.append("# TYPE http_requests_total counter")
+    for (route, status), h in sorted(REQUEST_LATENCY.series.items(), key=lambda kv: (kv[0][0], kv[0][1])):
+        out.append(f"http_requests_total{_labels(('route', 'status'), (route, status))} {h.count}")
+    _histogram(out, REQUEST_LATENCY.name, REQUEST_LATENCY.help, REQUEST_LATENCY.labelnames,
+               REQUEST_LATENCY.series.items())
+    _histogram(out, REQUEST_QUERIES.name, REQUEST_QUERIES.help, REQUEST_QUERIES.labelnames,
+               REQUEST_QUERIES.series.items())
+    _histogram(out, "db_query_duration_seconds", "DB statement latency by short query name", ("query",),
+               [((n,), h) for n, h in db.query_time.items()])
+    _histogram(out, "db_pool_acquire_wait_seconds", "Time spent waiting for a pool connection", (),
+               [((), db.acquire_wait)])
+
+    pool = db.pool_stats()
+    _simple(out, "gauge", "db_pool_connections", "Open pool connections", pool["size"])
+    _simple(out, "gauge", "db_pool_connections_in_use", "Pool connections checked out", pool["in_use"])
+    _simple(out, "gauge", "db_pool_connections_idle", "Idle pool connections", pool["idle"])
+    _simple(out, "gauge", "db_pool_waiters", "Tasks waiting in pool.acquire()", pool["waiting"])
+    _simple(out, "gauge", "db_pool_max_size", "Configured maximum pool size", pool["max_size"])
+
+    c = cache.stats()
+    for key in ("hits", "misses", "evictions", "expirations", "invalidations"):
+        _simple(out, "counter", f"response_cache_{key}_total", f"Response cache {key}", c[key])
+    _simple(out, "gauge", "response_cache_entries", "Response cache entries", c["entries"])
+
+    lag_p95, = monitor.loop_lag.percentiles(0.95)
+    _simple(out, "gauge", "event_loop_lag_seconds", "Event-loop timer drift, p95 of the recent window", lag_p95)
+    _simple(out, "gauge", "process_start_time_seconds", "Process start time (unix seconds)", monitor.STARTED_AT)
+    _simple(out, "gauge", "process_uptime_seconds", "Seconds since process start", round(time.time() - monitor.STARTED_AT, 3))
+    out.append("")
+    return "\n".join(out)
@@ -0,0 +1,335 @@
+"""Versioned schema migrations.
+
+Every migration runs once, in order, and is recorded in schema_migrations.
+Startup costs a single `select max(version)` when the schema is current.
+Otherwise one worker takes a pg advisory lock and applies the pending
+versions. The other workers wait up to MIGRATION_LOCK_WAIT_SECONDS for it
+and then carry on without migrating.
+
+Statements use `if not exists` so version 1 also adopts databases created
+by the old ad-hoc startup DDL.
+
+    DATABASE_URL=postgresql://localhost/emerald_test python migrations.py up
+    DATABASE_URL=postgresql://localhost/emerald_test python migrations.py status
+"""
+import asyncio
+import logging
+import os
+import sys
+import time
+from typing import Awaitable, Callable, List, Tuple, Union
+import asyncpg
+import partitions
+import rollups
+import token_data
+from db import acquire
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY = 7_245_301_912
+LOCK_WAIT_SECONDS = float(os.getenv("MIGRATION_LOCK_WAIT_SECONDS", "15"))
+
+Step = Union[str, Callable[[], Awaitable[None]]]
+
+BASE_TABLES = [
+    """
+    create table if not exists dashboard_users(
+      telegram_id bigint primary key,
+      username text,
+      first_name text,
+      last_name text,
+      photo_url text,
+      role text not null default 'dev',
+      tier text not null default 'pro',
+      ton_address text,
+      created_at timestamp not null default now(),
+      updated_at timestamp not null default now()
+    );
+    """,
+    "alter table dashboard_users add column if not exists ton_address text;",
+    """
+    create table if not exists dashboard_bots(
+      id serial primary key,
+      slug text unique,
+      name text,
+      username text,
+      title text,
+      env_token_key text,
+      is_active boolean not null default true,
+      meta jsonb not null default '{}'::jsonb,
+      created_at timestamp not null default now()
+    );
+    """,
+    """
+    create table if not exists dashboard_bot_users(
+      id bigserial primary key,
+      bot_id integer not null,
+      user_id bigint,
+      created_at timestamp not null default now()
+    );
+    """,
+    "alter table dashboard_bot_users add column if not exists user_id bigint, add column if not exists created_at timestamp not null default now();",
+    "create unique index if not exists dashboard_bot_users_bot_user_uidx on dashboard_bot_users(bot_id, user_id);",
+    """
+    create table if not exists dashboard_bot_events(
+      id bigserial primary key,
+      bot_id integer,
+      type text,
+      user_id bigint,
+      chat_id bigint,
+      payload jsonb,
+      created_at timestamp not null default now()
+    );
+    """,
+    "alter table dashboard_bot_events add column if not exists user_id bigint, add column if not exists chat_id bigint, add column if not exists payload jsonb;",
+    """
+    create table if not exists dashboard_bot_groups(
+      id serial primary key,
+      bot_id integer,
+      chat_id bigint,
+      chat_title text,
+      chat_type text,
+      member_count integer not null default 0,
+      created_at timestamp not null default now()
+    );
+    """,
+    """
+    create table if not exists dashboard_moderation(
+      id bigserial primary key,
+      bot_id integer,
+      chat_id bigint,
+      user_id bigint,
+      type text,
+      action text,
+      reason text,
+      created_at timestamp not null default now()
+    );
+    """,
+    "alter table dashboard_moderation add column if not exists bot_id integer, add column if not exists chat_id bigint, add column if not exists reason text;",
+    """
+    create table if not exists dashboard_logs(
+      id bigserial primary key,
+      level text not null default 'info',
+      message text,
+      created_at timestamp not null default now()
+    );
+    """,
+    """
+    create table if not exists dashboard_ads(
+      id serial primary key,
+      name text not null,
+      placement text not null,
+      content text not null,
+      is_active boolean not null default true,
+      start_at timestamp,
+      end_at timestamp,
+      targeting jsonb not null default '{}'::jsonb,
+      bot_slug text,
+      impressions bigint not null default 0,
+      created_at timestamp not null default now()
+    );
+    """,
+    "alter table dashboard_ads add column if not exists impressions bigint not null default 0;",
+    """
+    create table if not exists dashboard_feature_flags(
+      key text primary key,
+      value jsonb not null default '{}'::jsonb,
+      description text
+    );
+    """,
+    """
+    create table if not exists dashboard_payments(
+      id serial primary key,
+      telegram_id bigint,
+      amount numeric not null default 0,
+      currency text,
+      status text not null default 'pending',
+      created_at timestamp not null default now()
+    );
+    """,
+    """
+    create table if not exists dashboard_token_events(
+      id bigserial primary key,
+      type text,
+      amount numeric,
+      from_address text,
+      to_address text,
+      hash text,
+      created_at timestamp not null default now()
+    );
+    """,
+    """
+    create table if not exists dashboard_rss_feeds(
+      id serial primary key,
+      name text,
+      url text not null unique,
+      last_update timestamp,
+      item_count integer not null default 0,
+      created_at timestamp not null default now()
+    );
+    """,
+    """
+    create table if not exists dashboard_watch_accounts(
+      id serial primary key,
+      chain text not null check (chain in ('ton')),
+      account_id text not null,
+      label text not null default '',
+      meta jsonb default '{}'::jsonb,
+      created_at timestamp not null default now(),
+      unique(chain, account_id)
+    );
+    """,
+    """
+    create table if not exists dashboard_revoked_tokens(
+      jti text primary key,
+      expires_at timestamp not null
+    );
+    """,
+]
+
+# Keyset orders of the list endpoints plus the lookups behind logins,
+# bot stats and holder folding. Created after partitioning so they land on
+# the partitioned parents.
+INDEXES = [
+    "create index if not exists dashboard_token_events_created_id_idx on dashboard_token_events(created_at desc, id desc);",
+    "create unique index if not exists dashboard_token_events_hash_uidx on dashboard_token_events(hash, created_at);",
+    "create index if not exists dashboard_logs_created_id_idx on dashboard_logs(created_at desc, id desc);",
+    "create index if not exists dashboard_users_created_tg_idx on dashboard_users(created_at desc, telegram_id desc);",
+    "create index if not exists dashboard_users_ton_address_idx on dashboard_users(ton_address) where ton_address is not null;",
+    "create index if not exists dashboard_token_holders_balance_addr_idx on dashboard_token_holders(balance desc, ton_address desc);",
+    "create index if not exists dashboard_ads_bot_slug_id_idx on dashboard_ads(bot_slug, id desc);",
+    "create index if not exists dashboard_ads_active_idx on dashboard_ads(id) where is_active;",
+    "create index if not exists dashboard_bot_groups_members_id_idx on dashboard_bot_groups(member_count desc, id desc);",
+    "create index if not exists dashboard_bot_events_bot_created_idx on dashboard_bot_events(bot_id, created_at);",
+    "create index if not exists dashboard_rss_feeds_update_id_idx on dashboard_rss_feeds((coalesce(last_update, '-infinity')) desc, id desc);",
+    "create index if not exists dashboard_revoked_tokens_expires_idx on dashboard_revoked_tokens(expires_at);",
+]
+
+RSS_REFRESH = [
+    """
+    alter table dashboard_rss_feeds
+      add column if not exists etag text,
+      add column if not exists last_modified text,
+      add column if not exists last_checked timestamp,
+      add column if not exists last_status integer,
+      add column if not exists error_count integer not null default 0,
+      add column if not exists refresh_interval integer not null default 900;
+    """,
+    """
+    create table if not exists dashboard_rss_items(
+      id bigserial primary key,
+      feed_id integer not null references dashboard_rss_feeds(id) on delete cascade,
+      content_hash text not null,
+      guid text,
+      title text,
+      link text,
+      summary text,
+      published_at timestamp,
+      created_at timestamp not null default now(),
+      unique(feed_id, content_hash)
+    );
+    """,
+    "create index if not exists dashboard_rss_items_feed_published_idx on dashboard_rss_items(feed_id, published_at desc);",
+    "create index if not exists dashboard_rss_feeds_checked_idx on dashboard_rss_feeds(last_checked nulls first);",
+]
+
+# Range scans behind /analytics/timeseries. The partitioned event tables
+# got their created_at BRIN indexes from partitions.migrate.
+TIMESERIES = rollups.HOURLY_SCHEMA + rollups.HOURLY_BACKFILL + [
+    "create index if not exists dashboard_rollup_bot_events_hourly_brin on dashboard_rollup_bot_events_hourly using brin (hour);",
+    "create index if not exists dashboard_rollup_moderation_hourly_brin on dashboard_rollup_moderation_hourly using brin (hour);",
+    "create index if not exists dashboard_rollup_bot_events_day_idx on dashboard_rollup_bot_events(day);",
+    "create index if not exists dashboard_payments_created_brin on dashboard_payments using brin (created_at);",
+    "create index if not exists dashboard_users_created_brin on dashboard_users using brin (created_at);",
+    "create index if not exists dashboard_bot_users_created_brin on dashboard_bot_users using brin (created_at);",
+]
+
+MIGRATIONS: List[Tuple[int, str, List[Step]]] = [
+    (1, "base tables", BASE_TABLES),
+    (2, "rollups and token holders", rollups.SCHEMA + token_data.SCHEMA),
+    (3, "monthly partitions", [partitions.migrate]),
+    (4, "indexes", INDEXES),
+    (5, "rss refresh state and items", RSS_REFRESH),
+    (6, "hourly rollups and time-series indexes", TIMESERIES),
+    (7, "settled rollup high-water marks", rollups.ID_STATE_SCHEMA),
+]
+LATEST = MIGRATIONS[-1][0]
+
+_SCHEMA_MIGRATIONS = """
+create table if not exists schema_migrations(
+  version integer primary key,
+  name text not null,
+  applied_at timestamp not null default now()
+);
+"""
+
+
+async def current_version(conn) -> int:
+    try:
+        return await conn.fetchval("select coalesce(max(version), 0) from schema_migrations")
+    except asyncpg.UndefinedTableError:
+        return 0
+
+
+async def _apply(conn, version: int, name: str, steps: List[Step]):
+    t = time.perf_counter()
+    record = "insert into schema_migrations(version, name) values($1, $2)"
+    callables = [step for step in steps if not isinstance(step, str)]
+    async with conn.transaction():
+        for step in steps:
+            if isinstance(step, str):
+                await conn.execute(step)
+        if not callables:
+            await conn.execute(record, version, name)  # commits with the SQL it records
+    if callables:
+        # Callable steps manage their own connection and locking; they raise on
+        # failure, so the version is only recorded once they all succeed
+        for step in callables:
+            await step()
+        await conn.execute(record, version, name)
+    logger.info(f"Applied migration {version} ({name}) in {(time.perf_counter() - t) * 1000:.0f} ms")
+
+
+async def migrate() -> int:
+    """Bring the schema to LATEST; returns the version the database ends up at"""
+    async with acquire() as c:
+        version = await current_version(c)
+        if version >= LATEST:
+            return version  # fast path: one query
+        await c.execute("select set_config('lock_timeout', $1, false)", f"{int(LOCK_WAIT_SECONDS * 1000)}ms")
+        try:
+            await c.execute("select pg_advisory_lock($1)", LOCK_KEY)
+        except asyncpg.LockNotAvailableError:
+            logger.warning(f"Another worker is still migrating after {LOCK_WAIT_SECONDS:.0f}s; skipping")
+            return await current_version(c)
+        finally:
+            await c.execute("reset lock_timeout")
+        try:
+            await c.execute(_SCHEMA_MIGRATIONS)
+            version = await current_version(c)  # the lock holder before us may have finished
+            for v, name, steps in MIGRATIONS:
+                if v > version:
+                    await _apply(c, v, name, steps)
+                    version = v
+        finally:
+            await c.execute("select pg_advisory_unlock($1)", LOCK_KEY)
+    return version
+
+
+async def _main(cmd: str) -> int:
+    if cmd == "up":
+        print(f"schema at version {await migrate()}")
+        return 0
+    if cmd == "status":
+        async with acquire() as c:
+            version = await current_version(c)
+        for v, name, _ in MIGRATIONS:
+            print(f"{v:>4}  {'applied' if v <= version else 'pending'}  {name}")
+        return 0 if version >= LATEST else 1
+    print(__doc__)
+    return 2
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main(sys.argv[1] if len(sys.argv) > 1 else "")))
@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import os
+import time
+from array import array
+from typing import Dict
+import db
+
+logger = logging.getLogger(__name__)
+
+WINDOW_SIZE = int(os.getenv("MONITOR_WINDOW_SIZE", "1024"))
+LAG_INTERVAL = float(os.getenv("MONITOR_LOOP_LAG_INTERVAL", "0.5"))
+DB_PROBE_TIMEOUT = float(os.getenv("MONITOR_DB_PROBE_TIMEOUT", "2"))
+# Thresholds above which /system/health reports "degraded"
+DEGRADED_P95_MS = float(os.getenv("MONITOR_DEGRADED_P95_MS", "1000"))
+DEGRADED_LOOP_LAG_MS = float(os.getenv("MONITOR_DEGRADED_LOOP_LAG_MS", "200"))
+
+STARTED_AT = time.time()
+
+
+class LatencyWindow:
+    """Ring buffer of the last `size` samples; percentiles are computed on read"""
+
+    __slots__ = ("samples", "size", "pos", "filled", "total")
+
+    def __init__(self, size: int = WINDOW_SIZE):
+        self.samples = array("d", bytes(8 * size))
+        self.size = size
+        self.pos = 0
+        self.filled = 0
+        self.total = 0
+
+    def add(self, value: float):
+        self.samples[self.pos] = value
+        self.pos = (self.pos + 1) % self.size
+        if self.filled < self.size:
+            self.filled += 1
+        self.total += 1
+
+    def percentiles(self, *qs: float):
+        if not self.filled:
+            return [0.0 for _ in qs]
+        data = sorted(self.samples[:self.filled])
+        return [data[min(self.filled - 1, int(q * self.filled))] for q in qs]
+
+    def max(self) -> float:
+        return max(self.samples[:self.filled]) if self.filled else 0.0
+
+
+routes: Dict[str, LatencyWindow] = {}
+errors: Dict[str, int] = {}
+overall = LatencyWindow()
+loop_lag = LatencyWindow(size=120)
+_lag_task = None
+
+
+def observe(route: str, status: int, seconds: float, queries: int = 0):
+    """Request hook, called once per request by the access-log middleware"""
+    w = routes.get(route)
+    if w is None:
+        w = routes[route] = LatencyWindow()
+    w.add(seconds)
+    overall.add(seconds)
+    if status >= 500:
+        errors[route] = errors.get(route, 0) + 1
+
+
+async def _measure_loop_lag():
+    while True:
+        t = time.perf_counter()
+        await asyncio.sleep(LAG_INTERVAL)
+        loop_lag.add(max(0.0, time.perf_counter() - t - LAG_INTERVAL))
+
+
+def start():
+    global _lag_task
+    if _lag_task is None:
+        _lag_task = asyncio.create_task(_measure_loop_lag())
+
+
+async def stop():
+    global _lag_task
+    if _lag_task is not None:
+        _lag_task.cancel()
+        try:
+            await _lag_task
+        except asyncio.CancelledError:
+            pass
+        _lag_task = None
+
+
+async def probe_db() -> dict:
+    t = time.perf_counter()
+    try:
+        await asyncio.wait_for(db.fetchrow("select 1"), DB_PROBE_TIMEOUT)
+        return {"status": "connected", "latency_ms": round((time.perf_counter() - t) * 1000, 2)}
+    except Exception as e:
+        return {"status": "unreachable", "error": str(e) or type(e).__name__,
+                "latency_ms": round((time.perf_counter() - t) * 1000, 2)}
+
+
+def _ms(values):
+    return [round(v * 1000, 2) for v in values]
+
+
+def route_latencies() -> Dict[str, dict]:
+    out = {}
+    for route, w in sorted(routes.items()):
+        p50, p95, p99 = _ms(w.percentiles(0.5, 0.95, 0.99))
+        out[route] = {"count": w.total, "errors_5xx": errors.get(route, 0),
+                      "p50_ms": p50, "p95_ms": p95, "p99_ms": p99}
+    return out
+
+
+async def health() -> dict:
+    database = await probe_db()
+    pool = db.pool_stats()
+    p50, p95, p99 = _ms(overall.percentiles(0.5, 0.95, 0.99))
+    lag_p95, = _ms(loop_lag.percentiles(0.95))
+    uptime = time.time() - STARTED_AT
+    degraded = (
+        database["status"] != "connected"
+        or p95 > DEGRADED_P95_MS
+        or lag_p95 > DEGRADED_LOOP_LAG_MS
+        or pool["waiting"] > 0
+    )
+    return {
+        "status": "degraded" if degraded else "healthy",
+        "started_at": int(STARTED_AT),
+        "uptime_seconds": int(uptime),
+        "uptime_days": round(uptime / 86400, 2),
+        "response_time_ms": {"p50": p50, "p95": p95, "p99": p99, "samples": overall.filled},
+        "database": database,
+        "pool": {
+            "size": pool["size"],
+            "in_use": pool["in_use"],
+            "idle": pool["idle"],
+            "waiting": pool["waiting"],
+            "max_size": pool["max_size"],
+            "saturation": round(pool["in_use"] / pool["max_size"], 3) if pool["max_size"] else 0.0,
+            "acquire_wait_p95_ms": round(pool["acquire_wait_s"]["p95"] * 1000, 2),
+        },
+        "event_loop_lag_ms": {"p95": lag_p95, "max": round(loop_lag.max() * 1000, 2)},
+        "routes": route_latencies(),
+    }
+
+
+def ago(seconds) -> str:
+    """'2 minutes ago' style rendering of an age in seconds"""
+    if seconds is None:
+        return "never"
+    seconds = max(0, int(seconds))
+    for unit, size in (("day", 86400), ("hour", 3600), ("minute", 60)):
+        if seconds >= size:
+            n = seconds // size
+            return f"{n} {unit}{'s' if n != 1 else ''} ago"
+    return "just now"
@@ -0,0 +1,111 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import uuid
+from typing import Callable, List, Tuple
+import asyncpg
+from db import execute
+from cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Write handlers publish the cache tags they touched on this channel; every
+# worker holds one LISTEN connection (outside the request pool) and evicts
+# its local copies when a change arrives from another worker.
+CHANNEL = os.getenv("CACHE_NOTIFY_CHANNEL", "dashboard_changes")
+KEEPALIVE_SECONDS = float(os.getenv("CACHE_NOTIFY_KEEPALIVE", "30"))
+WORKER_ID = uuid.uuid4().hex[:12]
+ALL = "*"  # pseudo-tag: anything may have changed, drop everything
+
+_subscribers: List[Callable[[Tuple[str, ...]], None]] = []
+_task = None
+
+
+def subscribe(fn: Callable[[Tuple[str, ...]], None]):
+    """Register fn(tags) to run on every local or remote change"""
+    _subscribers.append(fn)
+    return fn
+
+
+@subscribe
+def _evict_cache(tags):
+    if ALL in tags:
+        cache.clear()
+    else:
+        cache.invalidate(*tags)
+
+
+def _dispatch(tags: Tuple[str, ...]):
+    for fn in _subscribers:
+        try:
+            fn(tags)
+        except Exception as e:
+            logger.warning(f"Change subscriber {fn.__name__} failed: {e}")
+
+
+async def publish(*tags: str):
+    """Apply a change locally and broadcast it to the other workers"""
+    _dispatch(tags)
+    payload = json.dumps({"origin": WORKER_ID, "tags": list(tags)})
+    try:
+        await execute("select pg_notify($1, $2)", CHANNEL, payload)
+    except Exception as e:
+        logger.warning(f"Change notification failed for {tags}: {e}")
+
+
+def _on_notify(conn, pid, channel, payload):
+    try:
+        msg = json.loads(payload)
+    except ValueError:
+        logger.warning(f"Ignoring malformed notification on {channel}: {payload!r}")
+        return
+    if msg.get("origin") == WORKER_ID:
+        return
+    _dispatch(tuple(msg.get("tags") or (ALL,)))
+
+
+async def _listen_forever():
+    delay = 1.0
+    while True:
+        conn = None
+        lost = asyncio.Event()
+        try:
+            conn = await asyncpg.connect(dsn=os.getenv("DATABASE_URL"))
+            conn.add_termination_listener(lambda c: lost.set())
+            await conn.add_listener(CHANNEL, _on_notify)
+            # Notifications sent while we were not listening are lost for good.
+            _dispatch((ALL,))
+            delay = 1.0
+            while not lost.is_set():
+                try:
+                    await asyncio.wait_for(lost.wait(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    await conn.execute("select 1")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"LISTEN {CHANNEL} connection failed: {e}")
+        finally:
+            if conn is not None and not conn.is_closed():
+                await conn.close()
+        await asyncio.sleep(delay + random.uniform(0, delay / 2))
+        delay = min(delay * 2, 30.0)
+
+
+def start():
+    global _task
+    if _task is None:
+        _task = asyncio.create_task(_listen_forever())
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
@@ -0,0 +1,173 @@
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, List, Optional, Sequence, Tuple
+from fastapi.responses import StreamingResponse
+from db import fetch, fetchrow, stream
+from fastjson import dumps
+
+MAX_PAGE_SIZE = 1000
+
+_ENCODERS = {
+    int: "i",
+    str: "s",
+    Decimal: "d",
+    datetime: "t",
+    date: "D",
+    type(None): "n",
+}
+_DECODERS = {
+    "i": int,
+    "s": str,
+    "d": Decimal,
+    "t": datetime.fromisoformat,
+    "D": date.fromisoformat,
+    "n": lambda v: None,
+}
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    parts = []
+    for v in values:
+        tag = _ENCODERS.get(type(v))
+        if tag is None:
+            raise TypeError(f"Unsupported cursor value {v!r}")
+        parts.append([tag, None if v is None else v.isoformat() if tag in ("t", "D") else str(v)])
+    raw = json.dumps(parts, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        return [_DECODERS[tag](v) for tag, v in json.loads(raw)]
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+class Keyset:
+    """Keyset ordering on a unique column tuple, e.g. (created_at, id)
+
+    `columns` are SQL expressions, `fields` the matching output names used to
+    build the next cursor from the last row of a page. Columns may be NULL:
+    like Postgres' default ordering, NULL sorts above every value, so it
+    comes first in a descending page.
+    """
+
+    def __init__(self, columns: Sequence[str], fields: Sequence[str] = None, desc: bool = True):
+        self.columns = list(columns)
+        self.fields = list(fields or columns)
+        self.desc = desc
+
+    def query(self, base: str, cursor: Optional[str] = None, limit: Optional[int] = None,
+              where: Sequence[str] = (), args: Sequence[Any] = ()) -> Tuple[str, list]:
+        params = list(args)
+        conds = list(where)
+        if cursor:
+            values = decode_cursor(cursor)
+            if len(values) != len(self.columns):
+                raise ValueError("Invalid cursor")
+            conds.append(self._after(values, params))
+        sql = base
+        if conds:
+            sql += " where " + " and ".join(conds)
+        order = "desc" if self.desc else "asc"
+        sql += " order by " + ", ".join(f"{c} {order}" for c in self.columns)
+        if limit is not None:
+            params.append(limit)
+            sql += f" limit ${len(params)}"
+        return sql, params
+
+    def _after(self, values: List[Any], params: list) -> str:
+        """Predicate for the rows that follow the cursor `values` in this order"""
+        def mark(v):
+            params.append(v)
+            return f"${len(params)}"
+
+        if self.desc and None not in values:
+            # Row comparison uses the index and drops NULLs, which sort before the cursor
+            marks = ", ".join(mark(v) for v in values)
+            return f"({', '.join(self.columns)}) < ({marks})"
+        terms, eqs = [], []
+        for c, v in zip(self.columns, values):
+            m = None if v is None else mark(v)
+            if self.desc:
+                step = f"{c} is not null" if v is None else f"{c} < {m}"
+            else:
+                step = None if v is None else f"({c} > {m} or {c} is null)"
+            if step is not None:
+                terms.append(" and ".join(eqs + [step]))
+            eqs.append(f"{c} is null" if v is None else f"{c} = {m}")
+        return "(" + " or ".join(f"({t})" for t in terms) + ")" if terms else "false"
+
+    def cursor_for(self, row) -> str:
+        return encode_cursor([row[f] for f in self.fields])
+
+
+def clamp_limit(limit: int) -> int:
+    return max(1, min(int(limit), MAX_PAGE_SIZE))
+
+
+async def page(keyset: Keyset, base: str, cursor: Optional[str], limit: int,
+               where: Sequence[str] = (), args: Sequence[Any] = (), fetcher=None):
+    """Fetch one page; returns (rows, next_cursor or None)"""
+    limit = clamp_limit(limit)
+    sql, params = keyset.query(base, cursor, limit + 1, where, args)
+    rows = await (fetcher or fetch)(sql, *params)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, keyset.cursor_for(rows[-1])
+    return rows, None
+
+
+async def page_json(keyset: Keyset, base: str, cursor: Optional[str], limit: int,
+                    where: Sequence[str] = (), args: Sequence[Any] = (), fetcher=None,
+                    drop: Sequence[str] = ()) -> Tuple[str, Optional[str]]:
+    """Like page(), but Postgres renders the rows as one JSON array.
+
+    Returns (json text, next_cursor or None). The cursor fields of the last
+    row come back in the same statement, so no row reaches Python. `drop`
+    removes helper columns (e.g. sort keys) from the rendered objects.
+    """
+    limit = clamp_limit(limit)
+    sql, params = keyset.query(base, cursor, limit + 1, where, args)
+    order = "desc" if keyset.desc else "asc"
+    reverse = "asc" if keyset.desc else "desc"
+    fields = ", ".join(f'"{f}"' for f in keyset.fields)
+    if drop:
+        item = "to_jsonb(v)" + "".join(f" - '{d}'" for d in drop)
+        agg, empty = "jsonb_agg", "'[]'::jsonb"
+    else:
+        item, agg, empty = "v", "json_agg", "'[]'::json"
+    rendered = f"""
+        with p as ({sql}),
+             v as (select * from p order by {", ".join(f'"{f}" {order}' for f in keyset.fields)} limit {limit})
+        select (select coalesce({agg}({item} order by {", ".join(f'v."{f}" {order}' for f in keyset.fields)}), {empty})::text
+                from v) as _body,
+               (select count(1) from p) > {limit} as _more,
+               last.*
+        from (select 1) one
+        left join (select {fields} from v order by {", ".join(f'"{f}" {reverse}' for f in keyset.fields)} limit 1) last
+          on true
+    """
+    row = await (fetcher or fetchrow)(rendered, *params)
+    return row["_body"], keyset.cursor_for(row) if row["_more"] else None
+
+
+async def _ndjson(sql: str, params: list, drop: Sequence[str] = ()):
+    buf = []
+    async for r in stream(sql, *params):
+        buf.append(dumps({k: v for k, v in r.items() if k not in drop} if drop else r))
+        if len(buf) >= 200:
+            yield b"\n".join(buf) + b"\n"
+            buf.clear()
+    if buf:
+        yield b"\n".join(buf) + b"\n"
+
+
+def stream_ndjson(keyset: Keyset, base: str, cursor: Optional[str] = None,
+                  where: Sequence[str] = (), args: Sequence[Any] = (), drop: Sequence[str] = ()) -> StreamingResponse:
+    """Stream every row after `cursor` as NDJSON through a server-side cursor, without the `drop` columns"""
+    sql, params = keyset.query(base, cursor, None, where, args)
+    return StreamingResponse(_ndjson(sql, params, drop), media_type="application/x-ndjson")
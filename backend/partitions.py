@@ -0,0 +1,249 @@
+"""Monthly range partitions on created_at for the append-only event tables.
+
+migrate() converts each existing heap table in place: the old table is
+renamed to <table>_p_legacy and attached as the partition covering
+everything up to the start of next month, so no rows are copied. Attaching
+validates that partition once, under an exclusive lock, on first start.
+After that, maintain() keeps PARTITION_PREMAKE_MONTHS of future partitions
+and detaches or drops partitions older than the per-table retention.
+A DEFAULT partition catches rows outside every month (backdated or far
+future), so they cannot fail an insert. When a month is created later, its
+rows are moved out of the DEFAULT partition first.
+
+dashboard_bot_events and dashboard_moderation feed the counters in
+rollups.py, which keep the full history. They are therefore kept forever
+by default. If retention is configured for them anyway, `rollups.py check`
+reports drift for every month that was removed, and `rollups.py backfill`
+rebuilds the counters from the retained months only, so the older history
+is lost.
+"""
+import asyncio
+import logging
+import os
+import re
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+from db import acquire
+
+logger = logging.getLogger(__name__)
+
+TABLES = ("dashboard_bot_events", "dashboard_logs", "dashboard_token_events", "dashboard_moderation")
+PREMAKE_MONTHS = int(os.getenv("PARTITION_PREMAKE_MONTHS", "3"))
+MAINTENANCE_INTERVAL = float(os.getenv("PARTITION_MAINTENANCE_INTERVAL", "21600"))
+# "detach" keeps old partitions as plain tables for archiving, "drop" deletes them
+RETENTION_MODE = os.getenv("PARTITION_RETENTION_MODE", "detach")
+LOCK_KEY = 7_245_301_913  # pg advisory lock shared by every worker
+
+
+def _parse_retention(spec: str) -> Dict[str, int]:
+    out = {}
+    for part in spec.split(","):
+        table, _, months = part.partition("=")
+        if table.strip() and months.strip():
+            out[table.strip()] = int(months)
+    return out
+
+
+# Months to keep per table; 0 or missing keeps everything.
+RETENTION = _parse_retention(os.getenv("PARTITION_RETENTION_MONTHS", "dashboard_logs=3"))
+ROLLUP_SOURCES = ("dashboard_bot_events", "dashboard_moderation")  # see the module docstring
+
+_BOUND_TO = re.compile(r"TO \('(\d{4}-\d{2}-\d{2})")
+
+
+def _month(d: date, add: int = 0) -> date:
+    m = d.year * 12 + d.month - 1 + add
+    return date(m // 12, m % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+
+def default_name(table: str) -> str:
+    return f"{table}_p_default"
+
+
+async def _relkind(c, table: str) -> Optional[str]:
+    return await c.fetchval("select relkind::text from pg_class where oid=to_regclass($1)", table)
+
+
+async def _partitions(c, table: str) -> List[Tuple[str, Optional[date]]]:
+    """(partition name, exclusive upper bound) for every attached partition"""
+    rows = await c.fetch(
+        """select p.relname, pg_get_expr(p.relpartbound, p.oid) as bound
+           from pg_inherits i join pg_class p on p.oid=i.inhrelid
+           where i.inhparent=to_regclass($1)""",
+        table
+    )
+    out = []
+    for r in rows:
+        m = _BOUND_TO.search(r["bound"] or "")
+        out.append((r["relname"], date.fromisoformat(m.group(1)) if m else None))
+    return out
+
+
+async def _convert(c, table: str, upto: date):
+    legacy = f"{table}_p_legacy"
+    async with c.transaction():
+        await c.execute(f"lock table {table} in access exclusive mode")
+        has_id = await c.fetchval(
+            "select exists(select 1 from information_schema.columns where table_name=$1 and column_name='id')", table
+        )
+        await c.execute(f"update {table} set created_at=now() where created_at is null")
+        await c.execute(f"alter table {table} alter column created_at set not null")
+        # Free the index names so the same migrations can create them on the parent.
+        for r in await c.fetch(
+            "select indexname from pg_indexes where schemaname=current_schema() and tablename=$1", table
+        ):
+            await c.execute(f'alter index "{r["indexname"]}" rename to "{r["indexname"][:50]}_legacy"')
+        await c.execute(f"alter table {table} rename to {legacy}")
+        await c.execute(
+            f"create table {table} (like {legacy} including defaults including storage including comments) "
+            f"partition by range (created_at)"
+        )
+        if has_id:
+            await c.execute(f"alter table {table} add primary key (id, created_at)")
+            seq = await c.fetchval("select pg_get_serial_sequence($1, 'id')", legacy)
+            if seq:
+                await c.execute(f"alter sequence {seq} owned by {table}.id")
+        await c.execute(f"alter table {table} attach partition {legacy} for values from (minvalue) to ('{upto}')")
+    logger.info(f"Converted {table} to monthly partitions (legacy rows up to {upto})")
+
+
+async def _premake(c, table: str, today: date):
+    bounds = [b for _, b in await _partitions(c, table) if b is not None]
+    month = max(bounds) if bounds else _month(today)
+    last = _month(today, PREMAKE_MONTHS)
+    default = default_name(table)
+    await c.execute(f"create table if not exists {default} partition of {table} default")
+    while month <= last:
+        nxt = _month(month, 1)
+        name = partition_name(table, month)
+        async with c.transaction():
+            if await c.fetchval(
+                f"select exists(select 1 from {default} where created_at >= $1 and created_at < $2)", month, nxt
+            ):
+                # Postgres refuses a new range while DEFAULT still holds rows for it
+                await c.execute(f"create table {name} (like {table} including defaults including storage)")
+                await c.execute(
+                    f"with moved as (delete from {default} where created_at >= $1 and created_at < $2 returning *) "
+                    f"insert into {name} select * from moved",
+                    month, nxt
+                )
+                await c.execute(f"alter table {table} attach partition {name} for values from ('{month}') to ('{nxt}')")
+                logger.info(f"Moved rows for {month:%Y-%m} out of {default}")
+            else:
+                await c.execute(
+                    f"create table if not exists {name} partition of {table} "
+                    f"for values from ('{month}') to ('{nxt}')"
+                )
+        month = nxt
+
+
+async def _apply_retention(c, table: str, today: date):
+    months = RETENTION.get(table, 0)
+    if months <= 0:
+        return
+    cutoff = _month(today, -months)
+    if RETENTION_MODE == "drop" and await _relkind(c, default_name(table)):
+        await c.execute(f"delete from {default_name(table)} where created_at < $1", cutoff)
+    for name, upper in await _partitions(c, table):
+        if upper is None or upper > cutoff:
+            continue
+        await c.execute(f"alter table {table} detach partition {name}")
+        if RETENTION_MODE == "drop":
+            await c.execute(f"drop table {name}")
+        logger.info(f"Retention: {RETENTION_MODE} {name} (older than {cutoff})")
+
+
+async def _locked(fn, wait: bool = False):
+    async with acquire() as c:
+        if wait:
+            await c.execute("select pg_advisory_lock($1)", LOCK_KEY)
+        elif not await c.fetchval("select pg_try_advisory_lock($1)", LOCK_KEY):
+            return False  # another worker is on it
+        try:
+            await fn(c)
+        finally:
+            await c.execute("select pg_advisory_unlock($1)", LOCK_KEY)
+    return True
+
+
+async def migrate(today: date = None):
+    """Convert heap tables to partitions, premake months and add BRIN indexes.
+
+    Every table is attempted; if any fails, RuntimeError names them so the
+    migration runner does not record the version and retries on next start.
+    """
+    today = today or date.today()
+    failed = []
+    for table in ROLLUP_SOURCES:
+        if RETENTION.get(table, 0) > 0:
+            logger.warning(f"Retention is set for {table}, a rollup source: rollups.py check will "
+                           f"report drift and backfill will lose history older than {RETENTION[table]} months")
+
+    async def run(c):
+        for table in TABLES:
+            try:
+                kind = await _relkind(c, table)
+                if kind is None:
+                    continue
+                if kind == "r":
+                    await _convert(c, table, _month(today, 1))
+                await _premake(c, table, today)
+                await c.execute(
+                    f"create index if not exists {table}_created_brin on {table} using brin (created_at)"
+                )
+            except Exception as e:
+                logger.error(f"Partition migration for {table} failed: {e}")
+                failed.append(table)
+
+    await _locked(run, wait=True)  # waits out a maintenance pass holding the lock
+    if failed:
+        raise RuntimeError(f"Partition migration failed for {', '.join(failed)}")
+
+
+async def maintain(today: date = None):
+    today = today or date.today()
+
+    async def run(c):
+        for table in TABLES:
+            try:
+                if await _relkind(c, table) != "p":
+                    continue
+                await _premake(c, table, today)
+                await _apply_retention(c, table, today)
+            except Exception as e:
+                logger.warning(f"Partition maintenance for {table} failed: {e}")
+
+    return await _locked(run)
+
+
+_task = None
+
+
+async def _loop():
+    while True:
+        try:
+            await maintain()
+        except Exception as e:
+            logger.warning(f"Partition maintenance failed: {e}")
+        await asyncio.sleep(MAINTENANCE_INTERVAL)
+
+
+def start():
+    global _task
+    if _task is None:
+        _task = asyncio.create_task(_loop())
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
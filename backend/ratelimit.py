@@ -0,0 +1,60 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any
+
+
+class TokenBucket:
+    """`rate` tokens per second, bursting up to `capacity`"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, n: float = 1.0) -> float:
+        """Take n tokens; returns 0 on success, else seconds until they would be available"""
+        self._refill(time.monotonic())
+        if self.tokens >= n:
+            self.tokens -= n
+            return 0.0
+        return (n - self.tokens) / self.rate
+
+    async def take(self, n: float = 1.0):
+        """Wait until n tokens are available, then take them"""
+        while True:
+            wait = self.try_take(n)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+
+class KeyedBuckets:
+    """One TokenBucket per key (IP, user id, ...), least recently used keys evicted"""
+
+    def __init__(self, rate: float, capacity: float = None, max_keys: int = 100_000):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[Any, TokenBucket]" = OrderedDict()
+
+    def hit(self, key) -> float:
+        """Take one token for key; returns 0 if allowed, else the seconds to wait"""
+        b = self._buckets.get(key)
+        if b is None:
+            b = self._buckets[key] = TokenBucket(self.rate, self.capacity)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return b.try_take()
+
+    def __len__(self):
+        return len(self._buckets)
@@ -0,0 +1,439 @@
+"""Incremental counter rollups for the dashboard analytics.
+
+Raw event tables grow without bound, so the analytics endpoints read
+per-bot/per-type/per-day counters from the rollup tables below plus the small
+"tail" of raw rows above each source's high-water mark. A background task
+folds the tail into the rollups every ROLLUP_INTERVAL_SECONDS.
+
+    python rollups.py backfill   # rebuild all rollups from the raw tables
+    python rollups.py check      # compare rollups against the raw tables
+
+Both commands assume the raw tables still hold every row. Partition retention
+on dashboard_bot_events or dashboard_moderation (see partitions.py) makes
+check report drift and backfill drop the months that are gone.
+"""
+import asyncio
+import logging
+import os
+import sys
+from typing import Dict, List, Tuple
+from db import acquire, fetch
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.getenv("ROLLUP_BATCH_SIZE", "50000"))
+INTERVAL_SECONDS = float(os.getenv("ROLLUP_INTERVAL_SECONDS", "30"))
+# dashboard_users has no serial id, so it is rolled up by created_at. Rows
+# younger than this lag are left in the tail to tolerate late commits.
+USERS_LAG = os.getenv("ROLLUP_USERS_LAG", "1 minute")
+# Minimum age of an id high-water candidate before it is folded, see settled_range
+SETTLE_SECONDS = float(os.getenv("ROLLUP_SETTLE_SECONDS", "2"))
+
+SCHEMA = [
+    """
+    create table if not exists dashboard_rollup_state(
+      name text primary key,
+      high_water bigint not null default 0,
+      high_water_ts timestamp,
+      updated_at timestamp not null default now()
+    );
+    """,
+    """
+    create table if not exists dashboard_rollup_bot_events(
+      bot_id integer not null,
+      type text not null,
+      day date not null,
+      events bigint not null default 0,
+      primary key(bot_id, type, day)
+    );
+    """,
+    """
+    create table if not exists dashboard_rollup_moderation(
+      type text not null,
+      action text not null,
+      day date not null,
+      events bigint not null default 0,
+      primary key(type, action, day)
+    );
+    """,
+    """
+    create table if not exists dashboard_rollup_banned_users(
+      user_id bigint primary key
+    );
+    """,
+    """
+    create table if not exists dashboard_rollup_users(
+      day date primary key,
+      users bigint not null default 0
+    );
+    """,
+    "insert into dashboard_rollup_state(name) values ('bot_events'), ('moderation'), ('users') on conflict do nothing;",
+]
+
+# Hourly per-bot counters behind /analytics/timeseries. They are folded by the
+# same id batches as the daily rollups above, so they share the high-water marks.
+HOURLY_SCHEMA = [
+    """
+    create table if not exists dashboard_rollup_bot_events_hourly(
+      bot_id integer not null,
+      hour timestamp not null,
+      events bigint not null default 0,
+      primary key(bot_id, hour)
+    );
+    """,
+    """
+    create table if not exists dashboard_rollup_moderation_hourly(
+      bot_id integer not null,
+      hour timestamp not null,
+      events bigint not null default 0,
+      primary key(bot_id, hour)
+    );
+    """,
+]
+
+# Seeds the hourly tables from raw rows already folded into the daily ones.
+# Locking the state rows keeps the refresher from advancing meanwhile.
+HOURLY_BACKFILL = [
+    "select 1 from dashboard_rollup_state where name in ('bot_events', 'moderation') for update;",
+    """
+    insert into dashboard_rollup_bot_events_hourly(bot_id, hour, events)
+    select coalesce(bot_id, 0), date_trunc('hour', created_at), count(1)
+    from dashboard_bot_events
+    where id <= (select high_water from dashboard_rollup_state where name='bot_events')
+    group by 1, 2
+    on conflict do nothing;
+    """,
+    """
+    insert into dashboard_rollup_moderation_hourly(bot_id, hour, events)
+    select coalesce(bot_id, 0), date_trunc('hour', created_at), count(1)
+    from dashboard_moderation
+    where id <= (select high_water from dashboard_rollup_state where name='moderation')
+    group by 1, 2
+    on conflict do nothing;
+    """,
+]
+
+# Candidate high-water marks for id-folded sources, see settled_range
+ID_STATE_SCHEMA = [
+    """
+    alter table dashboard_rollup_state
+      add column if not exists pending_high_water bigint,
+      add column if not exists pending_xid xid8,
+      add column if not exists pending_at timestamp;
+    """,
+]
+
+ROLLUP_TABLES = [
+    "dashboard_rollup_bot_events",
+    "dashboard_rollup_bot_events_hourly",
+    "dashboard_rollup_moderation",
+    "dashboard_rollup_moderation_hourly",
+    "dashboard_rollup_banned_users",
+    "dashboard_rollup_users",
+]
+
+# Sources with a serial id: (raw table, statements folding ids in ($1, $2])
+_ID_SOURCES = {
+    "bot_events": ("dashboard_bot_events", [
+        """insert into dashboard_rollup_bot_events(bot_id, type, day, events)
+           select coalesce(bot_id, 0), coalesce(type, ''), created_at::date, count(1)
+           from dashboard_bot_events where id > $1 and id <= $2
+           group by 1, 2, 3
+           on conflict(bot_id, type, day) do update
+           set events=dashboard_rollup_bot_events.events + excluded.events""",
+        """insert into dashboard_rollup_bot_events_hourly(bot_id, hour, events)
+           select coalesce(bot_id, 0), date_trunc('hour', created_at), count(1)
+           from dashboard_bot_events where id > $1 and id <= $2
+           group by 1, 2
+           on conflict(bot_id, hour) do update
+           set events=dashboard_rollup_bot_events_hourly.events + excluded.events""",
+    ]),
+    "moderation": ("dashboard_moderation", [
+        """insert into dashboard_rollup_moderation(type, action, day, events)
+           select coalesce(type, ''), coalesce(action, ''), created_at::date, count(1)
+           from dashboard_moderation where id > $1 and id <= $2
+           group by 1, 2, 3
+           on conflict(type, action, day) do update
+           set events=dashboard_rollup_moderation.events + excluded.events""",
+        """insert into dashboard_rollup_moderation_hourly(bot_id, hour, events)
+           select coalesce(bot_id, 0), date_trunc('hour', created_at), count(1)
+           from dashboard_moderation where id > $1 and id <= $2
+           group by 1, 2
+           on conflict(bot_id, hour) do update
+           set events=dashboard_rollup_moderation_hourly.events + excluded.events""",
+        """insert into dashboard_rollup_banned_users(user_id)
+           select distinct user_id from dashboard_moderation
+           where id > $1 and id <= $2 and action='ban' and user_id is not null
+           on conflict do nothing""",
+    ]),
+}
+
+_USERS_SQL = """
+insert into dashboard_rollup_users(day, users)
+select created_at::date, count(1) from dashboard_users
+where created_at > coalesce($1, '-infinity'::timestamp) and created_at <= $2
+group by 1
+on conflict(day) do update set users=dashboard_rollup_users.users + excluded.users
+"""
+
+# ---------- Reads: rollup + raw tail above the high-water mark ----------
+HW_BOT_EVENTS = "coalesce((select high_water from dashboard_rollup_state where name='bot_events'), 0)"
+HW_MODERATION = "coalesce((select high_water from dashboard_rollup_state where name='moderation'), 0)"
+HW_USERS = "coalesce((select high_water_ts from dashboard_rollup_state where name='users'), '-infinity'::timestamp)"
+
+WEEKLY_GROWTH_SQL = f"""
+select date_trunc('week', day)::date as week, sum(n)::bigint as count
+from (
+    select day, users as n from dashboard_rollup_users
+    union all
+    select created_at::date, 1 from dashboard_users where created_at > {HW_USERS}
+) t
+group by week
+order by week desc
+limit $1
+"""
+
+BOT_ACTIVITY_SQL = f"""
+select b.slug, coalesce(sum(t.n), 0)::bigint as events
+from dashboard_bots b
+left join (
+    select bot_id, events as n from dashboard_rollup_bot_events
+    union all
+    select bot_id, 1 from dashboard_bot_events where id > {HW_BOT_EVENTS}
+) t on t.bot_id=b.id
+group by b.slug
+order by events desc
+"""
+
+
+async def weekly_user_growth(limit: int = 12):
+    return await fetch(WEEKLY_GROWTH_SQL, limit)
+
+
+async def bot_activity():
+    return await fetch(BOT_ACTIVITY_SQL)
+
+
+async def ensure_schema():
+    async with acquire() as c:
+        for stmt in SCHEMA + HOURLY_SCHEMA + ID_STATE_SCHEMA:
+            await c.execute(stmt)
+
+
+async def settled_range(conn, name: str, table: str) -> Tuple[int, int]:
+    """Lock the state row of an id-folded source; returns (high_water, foldable upper bound).
+
+    Ids are drawn when a row is inserted, not when it commits, so a slow
+    transaction can commit id 5 after id 6 is visible. Folding up to max(id)
+    would skip it for good. Instead max(id) is recorded as a candidate along
+    with the xid horizon of the snapshot that saw it. It only becomes
+    foldable once every transaction running at that point has finished. It
+    must also be at least SETTLE_SECONDS old, for inserts that drew an id
+    before they had an xid. Call inside a transaction; the row lock
+    serializes workers.
+    """
+    r = await conn.fetchrow(
+        """select high_water, pending_high_water,
+                  coalesce(pg_snapshot_xmin(pg_current_snapshot()) >= pending_xid
+                           and pending_at <= clock_timestamp()::timestamp - make_interval(secs => $2), false) as settled
+           from dashboard_rollup_state where name=$1 for update""",
+        name, SETTLE_SECONDS
+    )
+    hw, pending = r["high_water"], r["pending_high_water"]
+    if r["settled"] and pending > hw:
+        return hw, pending
+    if pending is None or r["settled"]:
+        # Caught up with the last candidate: take the next one
+        await conn.execute(
+            f"""update dashboard_rollup_state
+                set pending_high_water=(select coalesce(max(id), 0) from {table}),
+                    pending_xid=pg_snapshot_xmax(pg_current_snapshot()),
+                    pending_at=clock_timestamp()
+                where name=$1""",
+            name
+        )
+    return hw, hw
+
+
+async def _refresh_ids(conn, name: str, table: str, stmts: List[str]) -> bool:
+    """Fold one batch of settled ids into the rollups; True if more are pending"""
+    async with conn.transaction():
+        hw, upper_bound = await settled_range(conn, name, table)
+        if upper_bound <= hw:
+            return False
+        upper = min(upper_bound, hw + BATCH_SIZE)
+        for stmt in stmts:
+            await conn.execute(stmt, hw, upper)
+        await conn.execute(
+            "update dashboard_rollup_state set high_water=$2, updated_at=now() where name=$1",
+            name, upper
+        )
+        return upper < upper_bound
+
+
+async def _refresh_users(conn):
+    async with conn.transaction():
+        hw = await conn.fetchval(
+            "select high_water_ts from dashboard_rollup_state where name='users' for update"
+        )
+        upper = await conn.fetchval(f"select (now() - interval '{USERS_LAG}')::timestamp")
+        if hw is not None and upper <= hw:
+            return
+        await conn.execute(_USERS_SQL, hw, upper)
+        await conn.execute(
+            "update dashboard_rollup_state set high_water_ts=$1, updated_at=now() where name='users'",
+            upper
+        )
+
+
+async def refresh_all(max_batches: int = 20):
+    """Fold new raw rows into every rollup, at most max_batches per source"""
+    async with acquire() as c:
+        for name, (table, stmts) in _ID_SOURCES.items():
+            try:
+                for _ in range(max_batches):
+                    if not await _refresh_ids(c, name, table, stmts):
+                        break
+            except Exception as e:
+                logger.warning(f"Rollup refresh for {name} failed: {e}")
+        try:
+            await _refresh_users(c)
+        except Exception as e:
+            logger.warning(f"Rollup refresh for users failed: {e}")
+
+
+async def backfill():
+    """Drop all rollup state and rebuild it from the raw tables"""
+    await ensure_schema()
+    async with acquire() as c:
+        async with c.transaction():
+            await c.execute(f"truncate {', '.join(ROLLUP_TABLES)}")
+            await c.execute(
+                """update dashboard_rollup_state
+                   set high_water=0, high_water_ts=null, pending_high_water=null, pending_xid=null,
+                       pending_at=null, updated_at=now()
+                   where name=any($1::text[])""",
+                list(_ID_SOURCES) + ["users"]
+            )
+        for name, (table, stmts) in _ID_SOURCES.items():
+            top = await c.fetchval(f"select coalesce(max(id), 0) from {table}")
+            while True:
+                more = await _refresh_ids(c, name, table, stmts)
+                hw = await c.fetchval("select high_water from dashboard_rollup_state where name=$1", name)
+                if hw >= top:
+                    break
+                if more:
+                    logger.info(f"Backfill {name}: high water {hw}")
+                else:
+                    await asyncio.sleep(SETTLE_SECONDS)  # wait for the candidate to settle
+        await _refresh_users(c)
+
+
+_CHECKS = {
+    "bot_events": """
+        with r as (select bot_id, type, sum(events)::bigint as n from dashboard_rollup_bot_events group by 1, 2),
+             s as (select coalesce(bot_id, 0) as bot_id, coalesce(type, '') as type, count(1) as n
+                   from dashboard_bot_events where id <= """ + HW_BOT_EVENTS + """ group by 1, 2)
+        select coalesce(r.bot_id, s.bot_id) as bot_id, coalesce(r.type, s.type) as type,
+               r.n as rollup, s.n as raw
+        from r full join s on r.bot_id=s.bot_id and r.type=s.type
+        where r.n is distinct from s.n""",
+    "moderation": """
+        with r as (select type, action, sum(events)::bigint as n from dashboard_rollup_moderation group by 1, 2),
+             s as (select coalesce(type, '') as type, coalesce(action, '') as action, count(1) as n
+                   from dashboard_moderation where id <= """ + HW_MODERATION + """ group by 1, 2)
+        select coalesce(r.type, s.type) as type, coalesce(r.action, s.action) as action,
+               r.n as rollup, s.n as raw
+        from r full join s on r.type=s.type and r.action=s.action
+        where r.n is distinct from s.n""",
+    "bot_events_hourly": """
+        with r as (select bot_id, sum(events)::bigint as n from dashboard_rollup_bot_events_hourly group by 1),
+             s as (select coalesce(bot_id, 0) as bot_id, count(1) as n
+                   from dashboard_bot_events where id <= """ + HW_BOT_EVENTS + """ group by 1)
+        select coalesce(r.bot_id, s.bot_id) as bot_id, r.n as rollup, s.n as raw
+        from r full join s on r.bot_id=s.bot_id
+        where r.n is distinct from s.n""",
+    "moderation_hourly": """
+        with r as (select bot_id, sum(events)::bigint as n from dashboard_rollup_moderation_hourly group by 1),
+             s as (select coalesce(bot_id, 0) as bot_id, count(1) as n
+                   from dashboard_moderation where id <= """ + HW_MODERATION + """ group by 1)
+        select coalesce(r.bot_id, s.bot_id) as bot_id, r.n as rollup, s.n as raw
+        from r full join s on r.bot_id=s.bot_id
+        where r.n is distinct from s.n""",
+    "banned_users": """
+        select r.n as rollup, s.n as raw
+        from (select count(1) as n from dashboard_rollup_banned_users) r,
+             (select count(distinct user_id) as n from dashboard_moderation
+              where action='ban' and id <= """ + HW_MODERATION + """) s
+        where r.n <> s.n""",
+    "users": """
+        with r as (select day, users as n from dashboard_rollup_users),
+             s as (select created_at::date as day, count(1) as n from dashboard_users
+                   where created_at <= """ + HW_USERS + """ group by 1)
+        select coalesce(r.day, s.day) as day, r.n as rollup, s.n as raw
+        from r full join s on r.day=s.day
+        where r.n is distinct from s.n""",
+}
+
+
+async def check() -> Dict[str, List[dict]]:
+    """Mismatches between rollups and raw rows below the high-water marks"""
+    out = {}
+    for name, q in _CHECKS.items():
+        rows = await fetch(q)
+        if rows:
+            out[name] = [dict(r) for r in rows]
+    return out
+
+
+# ---------- Background refresher ----------
+_task = None
+
+
+async def _loop():
+    while True:
+        try:
+            await refresh_all()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Rollup refresh failed: {e}")
+        await asyncio.sleep(INTERVAL_SECONDS)
+
+
+def start():
+    global _task
+    if _task is None:
+        _task = asyncio.create_task(_loop())
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+
+
+async def _main(cmd: str) -> int:
+    if cmd == "backfill":
+        await backfill()
+        print("backfill complete")
+        return 0
+    if cmd == "check":
+        bad = await check()
+        for name, rows in bad.items():
+            for r in rows:
+                print(f"{name}: {r}")
+        print("consistent" if not bad else f"{sum(map(len, bad.values()))} mismatches")
+        return 1 if bad else 0
+    print(__doc__)
+    return 2
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main(sys.argv[1] if len(sys.argv) > 1 else "")))
@@ -0,0 +1,236 @@
+"""Background RSS/Atom refresher for dashboard_rss_feeds.
+
+Every RSS_POLL_INTERVAL seconds one worker picks the feeds whose
+refresh_interval has elapsed and fetches them through a shared client with
+bounded concurrency. It sends If-None-Match/If-Modified-Since, so unchanged
+feeds cost a 304. A feed that fails is retried after refresh_interval *
+2**error_count, capped at RSS_MAX_BACKOFF_STEPS doublings, so a dead feed
+stops taking a slot on every pass. Bodies are parsed as they stream in. Items are keyed by a
+content hash, so re-published or re-ordered entries are not stored twice.
+All new items go in with one insert and all feed rows are updated with one
+statement per pass.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import random
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import List, Optional
+from xml.etree.ElementTree import XMLPullParser
+import httpx
+from db import acquire, fetch, execute
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = float(os.getenv("RSS_POLL_INTERVAL", "60"))
+CONCURRENCY = int(os.getenv("RSS_CONCURRENCY", "10"))
+BATCH = int(os.getenv("RSS_FEEDS_PER_PASS", "200"))
+MAX_ITEMS = int(os.getenv("RSS_MAX_ITEMS_PER_FEED", "200"))
+MAX_BYTES = int(os.getenv("RSS_MAX_FEED_BYTES", str(5 * 1024 * 1024)))
+USER_AGENT = os.getenv("RSS_USER_AGENT", "EmeraldContentBot/1.0 (+https://github.com/Greeny187/EmeraldContentBots)")
+MAX_BACKOFF_STEPS = int(os.getenv("RSS_MAX_BACKOFF_STEPS", "6"))
+LOCK_KEY = 7_245_301_915  # only one worker refreshes at a time
+
+_DUE_SQL = """
+select id, url, etag, last_modified from dashboard_rss_feeds
+where last_checked is null
+   or last_checked <= now() - make_interval(secs => refresh_interval * power(2, least(error_count, $2)))
+order by last_checked nulls first
+limit $1
+"""
+
+_INSERT_ITEMS_SQL = """
+with new as (
+    insert into dashboard_rss_items(feed_id, content_hash, guid, title, link, summary, published_at)
+    select * from unnest($1::int[], $2::text[], $3::text[], $4::text[], $5::text[], $6::text[], $7::timestamp[])
+    on conflict(feed_id, content_hash) do nothing
+    returning feed_id
+)
+select feed_id, count(1) as n from new group by feed_id
+"""
+
+_UPDATE_FEEDS_SQL = """
+update dashboard_rss_feeds f
+set etag=coalesce(v.etag, f.etag),
+    last_modified=coalesce(v.last_modified, f.last_modified),
+    last_checked=now(),
+    last_status=v.status,
+    error_count=case when v.status between 200 and 399 then 0 else f.error_count + 1 end,
+    item_count=f.item_count + v.new_items,
+    last_update=case when v.new_items > 0 then now() else f.last_update end
+from unnest($1::int[], $2::text[], $3::text[], $4::int[], $5::int[])
+     as v(id, etag, last_modified, status, new_items)
+where f.id=v.id
+"""
+
+_client: Optional[httpx.AsyncClient] = None
+_task = None
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            headers={"User-Agent": USER_AGENT}, follow_redirects=True, timeout=httpx.Timeout(15.0),
+            limits=httpx.Limits(max_connections=CONCURRENCY, max_keepalive_connections=CONCURRENCY),
+        )
+    return _client
+
+
+def set_client(client: httpx.AsyncClient):
+    """Swap in another client, e.g. one pointed at a local stub feed server"""
+    global _client
+    _client = client
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _date(text: Optional[str]) -> Optional[datetime]:
+    if not text:
+        return None
+    try:
+        d = parsedate_to_datetime(text)  # RSS: RFC 822
+    except (TypeError, ValueError):
+        try:
+            d = datetime.fromisoformat(text.strip().replace("Z", "+00:00"))  # Atom: RFC 3339
+        except ValueError:
+            return None
+    return d.astimezone(timezone.utc).replace(tzinfo=None) if d.tzinfo else d
+
+
+def _item(elem) -> tuple:
+    """(content_hash, guid, title, link, summary, published_at) for an <item>/<entry>"""
+    f = {}
+    for child in elem:
+        name = _local(child.tag)
+        if name == "link" and child.get("href"):
+            if child.get("rel", "alternate") == "alternate":
+                f.setdefault("link", child.get("href"))
+        elif name not in f:
+            f[name] = (child.text or "").strip()
+    guid = f.get("guid") or f.get("id")
+    title = f.get("title")
+    link = f.get("link")
+    summary = f.get("description") or f.get("summary") or f.get("content")
+    h = hashlib.blake2b(digest_size=16)
+    for part in (guid or link or "", title or "", summary or ""):
+        h.update(part.encode())
+        h.update(b"\0")
+    published = _date(f.get("pubDate") or f.get("published") or f.get("updated") or f.get("date"))
+    return h.hexdigest(), guid, title, link, (summary or "")[:4000] or None, published
+
+
+async def fetch_feed(feed) -> tuple:
+    """(status, etag, last_modified, items) for one feed row"""
+    headers = {}
+    if feed["etag"]:
+        headers["If-None-Match"] = feed["etag"]
+    if feed["last_modified"]:
+        headers["If-Modified-Since"] = feed["last_modified"]
+    items, seen = [], set()
+    async with get_client().stream("GET", feed["url"], headers=headers) as r:
+        if r.status_code != 200:
+            return r.status_code, None, None, []
+        parser = XMLPullParser(events=("end",))
+        size = 0
+        async for chunk in r.aiter_bytes():
+            size += len(chunk)
+            parser.feed(chunk)
+            for _, elem in parser.read_events():
+                if _local(elem.tag) in ("item", "entry"):
+                    it = _item(elem)
+                    elem.clear()
+                    if it[0] not in seen:
+                        seen.add(it[0])
+                        items.append(it)
+            if len(items) >= MAX_ITEMS or size >= MAX_BYTES:
+                break  # newest items come first; the rest is older history
+        return 200, r.headers.get("etag"), r.headers.get("last-modified"), items[:MAX_ITEMS]
+
+
+async def refresh_due() -> dict:
+    """Fetch every due feed once and store the results; returns pass totals"""
+    feeds = await fetch(_DUE_SQL, BATCH, MAX_BACKOFF_STEPS)
+    if not feeds:
+        return {"feeds": 0, "new_items": 0, "not_modified": 0, "errors": 0}
+    sem = asyncio.Semaphore(CONCURRENCY)
+
+    async def one(feed):
+        async with sem:
+            try:
+                return feed["id"], await fetch_feed(feed)
+            except Exception as e:  # network, XML, bad URL, ...: one feed must not sink the pass
+                logger.warning(f"RSS feed {feed['url']} failed: {type(e).__name__}: {e}")
+                return feed["id"], (599, None, None, [])
+
+    results = await asyncio.gather(*(one(f) for f in feeds))
+    cols: List[list] = [[] for _ in range(7)]
+    for feed_id, (_, _, _, items) in results:
+        for it in items:
+            cols[0].append(feed_id)
+            for i, v in enumerate(it):
+                cols[i + 1].append(v)
+    new_counts = {}
+    if cols[0]:
+        new_counts = {r["feed_id"]: r["n"] for r in await fetch(_INSERT_ITEMS_SQL, *cols)}
+    ids, etags, lms, statuses, news = [], [], [], [], []
+    for feed_id, (status, etag, lm, _) in results:
+        ids.append(feed_id)
+        etags.append(etag)
+        lms.append(lm)
+        statuses.append(status)
+        news.append(new_counts.get(feed_id, 0))
+    await execute(_UPDATE_FEEDS_SQL, ids, etags, lms, statuses, news)
+    return {
+        "feeds": len(results),
+        "new_items": sum(news),
+        "not_modified": statuses.count(304),
+        "errors": sum(1 for s in statuses if s >= 400),
+    }
+
+
+async def _refresh_locked() -> Optional[dict]:
+    async with acquire() as c:
+        if not await c.fetchval("select pg_try_advisory_lock($1)", LOCK_KEY):
+            return None  # another worker is refreshing
+        try:
+            return await refresh_due()
+        finally:
+            await c.execute("select pg_advisory_unlock($1)", LOCK_KEY)
+
+
+async def _loop():
+    while True:
+        try:
+            res = await _refresh_locked()
+            if res and res["feeds"]:
+                logger.info(f"RSS refresh: {res}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"RSS refresh failed: {e}")
+        await asyncio.sleep(POLL_INTERVAL * random.uniform(0.9, 1.1))
+
+
+def start():
+    global _task
+    if _task is None:
+        _task = asyncio.create_task(_loop())
+
+
+async def stop():
+    global _task, _client
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+    if _client is not None:
+        await _client.aclose()
+        _client = None
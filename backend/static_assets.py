@@ -0,0 +1,255 @@
+"""In-memory static file serving for the frontend, miniapp and token metadata.
+
+Every mounted directory is scanned once at startup: each file gets a
+content-hash ETag, and small files are kept in memory together with their
+gzip (and, when the optional brotli package is installed, brotli) variants.
+Requests then cost a dict lookup. If-None-Match is answered with 304, and
+URLs carrying the current hash (?v=<etag>, see url()) are cacheable forever.
+In-memory HTML files get that suffix added to their src/href references to
+other mounted files. Scripts and images then come from the browser cache, and
+only the HTML itself is revalidated.
+"""
+import asyncio
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+from typing import Dict, Optional, Tuple
+from fastapi.responses import FileResponse, Response
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+ROOT = os.path.abspath(os.getenv("STATIC_ROOT", os.path.join(os.path.dirname(__file__), "..")))
+# URL prefix -> directory (or single file) relative to ROOT
+MOUNTS = {
+    "/frontend": "frontend",
+    "/miniapp": "miniapp",
+    "/offchain": "offchain",
+    "/assets": "assets",
+    "/news.json": "news.json",
+}
+MEMORY_MAX_BYTES = int(os.getenv("STATIC_MEMORY_MAX_BYTES", "262144"))
+HOT_RELOAD = os.getenv("STATIC_HOT_RELOAD", "0") == "1"
+HOT_RELOAD_INTERVAL = float(os.getenv("STATIC_HOT_RELOAD_INTERVAL", "1"))
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"  # html/json: always revalidate, usually a 304
+DEFAULT_CACHE = f"public, max-age={int(os.getenv('STATIC_MAX_AGE', '3600'))}"
+
+_COMPRESSIBLE = ("text/", "application/json", "application/javascript", "application/xml", "image/svg+xml")
+mimetypes.add_type("application/javascript", ".js")
+mimetypes.add_type("image/svg+xml", ".svg")
+
+
+_REF = re.compile(rb"""(\b(?:src|href)=["'])([^"'#?:]+)(["'])""")
+
+
+class Asset:
+    __slots__ = ("path", "media_type", "etag", "mtime", "size", "body", "gzip", "br", "source")
+
+    def __init__(self, path: str, media_type: str, etag: str, mtime: float, size: int,
+                 body: Optional[bytes] = None, gz: Optional[bytes] = None, br: Optional[bytes] = None):
+        self.path = path
+        self.media_type = media_type
+        self.etag = etag
+        self.mtime = mtime
+        self.size = size
+        self.body = body
+        self.gzip = gz
+        self.br = br
+        self.source = None
+
+
+_assets: Dict[str, Asset] = {}  # URL path -> Asset
+_task = None
+
+
+def _load(path: str) -> Asset:
+    st = os.stat(path)
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    if st.st_size <= MEMORY_MAX_BYTES:
+        with open(path, "rb") as f:
+            body = f.read()
+        asset = Asset(path, media_type, "", st.st_mtime, st.st_size)
+        asset.source = body if media_type == "text/html" else None  # before versioning refs
+        _set_body(asset, body)
+        return asset
+    h = hashlib.blake2b(digest_size=8)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return Asset(path, media_type, h.hexdigest(), st.st_mtime, st.st_size)
+
+
+def _encode(media_type: str, body: bytes) -> Tuple[bytes, Optional[bytes], Optional[bytes]]:
+    """(body, gzip, brotli) for an in-memory file"""
+    gz = br = None
+    if media_type.startswith(_COMPRESSIBLE) and len(body) > 256:
+        gz = gzip.compress(body, 9, mtime=0)
+        gz = gz if len(gz) < len(body) else None
+        if brotli is not None:
+            br = brotli.compress(body, quality=11)
+            br = br if len(br) < len(body) else None
+    return body, gz, br
+
+
+def _set_body(asset: Asset, body: bytes):
+    asset.body, asset.gzip, asset.br = _encode(asset.media_type, body)
+    asset.etag = hashlib.blake2b(body, digest_size=8).hexdigest()
+
+
+def _version_refs(page_url: str, page: Asset, assets: Dict[str, Asset]) -> Asset:
+    """Copy of an HTML page with ?v=<etag> on its references to mounted files"""
+    base = page_url.rsplit("/", 1)[0] + "/"
+
+    def sub(m):
+        target = posixpath.normpath(posixpath.join(base, m.group(2).decode()))
+        ref = assets.get(target)
+        if ref is None or ref.media_type == "text/html":
+            return m.group(0)  # pages are revalidated anyway; keep their links stable
+        return m.group(1) + m.group(2) + url(target, assets)[len(target):].encode() + m.group(3)
+
+    out = Asset(page.path, page.media_type, "", page.mtime, page.size)
+    out.source = page.source
+    _set_body(out, _REF.sub(sub, page.source))
+    return out
+
+
+def _walk():
+    """(URL path, file path) for every mounted file"""
+    for prefix, rel in MOUNTS.items():
+        base = os.path.join(ROOT, rel)
+        if os.path.isfile(base):
+            yield prefix, base
+            continue
+        for dirpath, _, files in os.walk(base):
+            for name in files:
+                if name.startswith("."):
+                    continue
+                full = os.path.join(dirpath, name)
+                yield prefix + "/" + os.path.relpath(full, base).replace(os.sep, "/"), full
+
+
+def scan() -> int:
+    """(Re)load every mounted file whose mtime or size changed; returns the number loaded"""
+    global _assets
+    fresh, loaded = {}, 0
+    for url, path in _walk():
+        old = _assets.get(url)
+        try:
+            st = os.stat(path)
+            if old is not None and old.mtime == st.st_mtime and old.size == st.st_size:
+                fresh[url] = old
+                continue
+            fresh[url] = _load(path)
+            loaded += 1
+        except OSError as e:
+            logger.warning(f"Static asset {path} skipped: {e}")
+    if loaded or len(fresh) != len(_assets):
+        # Any changed file may be referenced by any page
+        for u, a in list(fresh.items()):
+            if a.source is not None:
+                fresh[u] = _version_refs(u, a, fresh)  # a fresh object: requests may be reading the old one
+    _assets = fresh
+    return loaded
+
+
+def get(url: str) -> Optional[Asset]:
+    return _assets.get(url)
+
+
+def url(path: str, assets: Optional[Dict[str, Asset]] = None) -> str:
+    """Cache-busting URL for a mounted path, e.g. /assets/logo.png?v=<etag>"""
+    a = (_assets if assets is None else assets).get(path)
+    return f"{path}?v={a.etag}" if a else path
+
+
+def _accepts(accept_encoding: str, coding: str) -> bool:
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip() == coding:
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        tag = tag[2:] if tag.startswith("W/") else tag
+        if tag.strip('"').split("-", 1)[0] == etag:
+            return True
+    return False
+
+
+def respond(asset: Asset, version: Optional[str], if_none_match: Optional[str],
+            accept_encoding: Optional[str]) -> Response:
+    if version == asset.etag:
+        cache_control = IMMUTABLE
+    elif asset.media_type in ("text/html", "application/json"):
+        cache_control = REVALIDATE
+    else:
+        cache_control = DEFAULT_CACHE
+    headers = {"Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    body, suffix = asset.body, ""
+    if accept_encoding and asset.br is not None and _accepts(accept_encoding, "br"):
+        body, suffix = asset.br, "-br"
+        headers["Content-Encoding"] = "br"
+    elif accept_encoding and asset.gzip is not None and _accepts(accept_encoding, "gzip"):
+        body, suffix = asset.gzip, "-gz"
+        headers["Content-Encoding"] = "gzip"
+    headers["ETag"] = f'"{asset.etag}{suffix}"'
+    if if_none_match and _etag_matches(if_none_match, asset.etag):
+        headers.pop("Content-Encoding", None)
+        return Response(status_code=304, headers=headers)
+    if body is None:
+        return FileResponse(asset.path, media_type=asset.media_type, headers=headers)
+    return Response(body, media_type=asset.media_type, headers=headers)
+
+
+def stats() -> dict:
+    in_memory = [a for a in _assets.values() if a.body is not None]
+    return {
+        "files": len(_assets),
+        "in_memory": len(in_memory),
+        "memory_bytes": sum(len(a.body) + len(a.gzip or b"") + len(a.br or b"") for a in in_memory),
+        "brotli": brotli is not None,
+        "hot_reload": HOT_RELOAD,
+    }
+
+
+# ---------- Development hot reload ----------
+async def _watch():
+    while True:
+        await asyncio.sleep(HOT_RELOAD_INTERVAL)
+        try:
+            n = await asyncio.to_thread(scan)
+            if n:
+                logger.info(f"Reloaded {n} static assets")
+        except Exception as e:
+            logger.warning(f"Static asset rescan failed: {e}")
+
+
+def start():
+    global _task
+    if HOT_RELOAD and _task is None:
+        _task = asyncio.create_task(_watch())
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
@@ -1,12 +1,39 @@
-import os,hmac,hashlib,time
+import os,hmac,hashlib,time,json
+from urllib.parse import parse_qsl
+
+# Keys are derived once from BOT_TOKEN: sha256(token) for the Login Widget,
+# HMAC_SHA256("WebAppData", token) for Mini App initData.
+_login_key=None
+_webapp_key=None
+TTL=int(os.getenv("TELEGRAM_LOGIN_TTL_SECONDS","86400"))
+
+def load_keys():
+  global _login_key,_webapp_key
+  tok=os.getenv("BOT_TOKEN")
+  if not tok: raise ValueError("BOT_TOKEN is not set")
+  _login_key=hashlib.sha256(tok.encode()).digest()
+  _webapp_key=hmac.new(b"WebAppData",tok.encode(),hashlib.sha256).digest()
+
 def _dcs(d): return "\n".join(f"{k}={d[k]}" for k in sorted([k for k in d if k!='hash']))
+
+def _check(key,d):
+  if not hmac.compare_digest(hmac.new(key,_dcs(d).encode(),hashlib.sha256).hexdigest(),str(d.get("hash",""))): raise ValueError("Bad hash")
+  if time.time()-int(d["auth_date"])>TTL: raise ValueError("Auth payload expired")
+
+def _user(u): return {"id":int(u["id"]), "username":u.get("username"), "first_name":u.get("first_name"), "last_name":u.get("last_name"), "photo_url":u.get("photo_url")}
+
 def verify_telegram_auth(p):
   for r in ["id","auth_date","hash"]:
     if r not in p: raise ValueError(f"Missing {r}")
-  tok=os.getenv("BOT_TOKEN")
-  if not tok: raise ValueError("BOT_TOKEN is not set")
-  key=hashlib.sha256(tok.encode()).digest()
-  if hmac.new(key,_dcs(p).encode(),hashlib.sha256).hexdigest()!=p.get("hash"): raise ValueError("Bad hash")
-  ttl=int(os.getenv("TELEGRAM_LOGIN_TTL_SECONDS","86400"))
-  if time.time()-int(p["auth_date"])>ttl: raise ValueError("Auth payload expired")
-  return {"id":int(p["id"]), "username":p.get("username"), "first_name":p.get("first_name"), "last_name":p.get("last_name"), "photo_url":p.get("photo_url")}
+  if _login_key is None: load_keys()
+  _check(_login_key,{k:v for k,v in p.items() if v is not None})
+  return _user(p)
+
+def verify_webapp_init_data(init_data):
+  """Mini App initData query string -> user dict (same shape as verify_telegram_auth)"""
+  d=dict(parse_qsl(init_data,keep_blank_values=True))
+  for r in ["user","auth_date","hash"]:
+    if r not in d: raise ValueError(f"Missing {r}")
+  if _webapp_key is None: load_keys()
+  _check(_webapp_key,d)
+  return _user(json.loads(d["user"]))
@@ -0,0 +1,195 @@
+"""Bucketed time series for the analytics graphs.
+
+A query names a metric, an optional bot, a time range and a bucket size
+(minute, hour, day or week). A series never has more than MAX_POINTS
+points. Longer ranges widen the bucket to the next round width (10 min,
+2 h, 1 day, ...). The source is then the coarsest one whose grain divides
+that width: the daily rollups, the hourly rollups or the raw table. A year
+of minute buckets is therefore read from daily counters. For the large event
+tables, raw scans cover at most MAX_POINTS half-hour buckets. The created_at
+BRIN indexes serve those scans.
+Rollups are read together with the raw tail above their high-water mark,
+as in rollups.py. Empty buckets come back as zeros.
+"""
+import math
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from db import acquire
+from rollups import HW_BOT_EVENTS, HW_MODERATION, HW_USERS
+
+MAX_POINTS = int(os.getenv("TIMESERIES_MAX_POINTS", "500"))
+MAX_RANGE_DAYS = int(os.getenv("TIMESERIES_MAX_RANGE_DAYS", "1100"))
+QUERY_TIMEOUT = float(os.getenv("TIMESERIES_QUERY_TIMEOUT", "5"))
+
+BUCKETS = {"minute": 60, "hour": 3600, "day": 86400, "week": 7 * 86400}
+DEFAULT_SPAN = {
+    "minute": timedelta(hours=6),
+    "hour": timedelta(days=7),
+    "day": timedelta(days=90),
+    "week": timedelta(weeks=52),
+}
+# Widened buckets are one of these (all divide a day) or whole days/weeks,
+# so bucket edges stay on round times and line up with the rollup grains.
+NICE_WIDTHS = (60, 120, 300, 600, 900, 1200, 1800,
+               3600, 7200, 10800, 14400, 21600, 28800, 43200, 86400)
+RAW = 1  # grain of raw rows: any bucket width works
+
+
+class Source(NamedTuple):
+    name: str
+    grain: int  # seconds; rows are stamped at multiples of it
+    per_bot: bool
+    sql: str  # yields (ts, n) for $1 <= ts < $2; {bot} filters on $4
+
+
+class Metric(NamedTuple):
+    cast: str
+    sources: Tuple[Source, ...]  # coarsest first
+
+
+def _raw(name: str, table: str, value: str = "1", where: str = "", per_bot: bool = True) -> Source:
+    return Source(name, RAW, per_bot, f"""
+        select created_at as ts, {value} as n from {table}
+        where created_at >= $1 and created_at < $2 {where} {{bot}}""")
+
+
+METRICS: Dict[str, Metric] = {
+    "bot_events": Metric("bigint", (
+        Source("daily rollup", 86400, True, f"""
+            select day::timestamp as ts, events as n from dashboard_rollup_bot_events
+            where day >= $1::timestamp::date and day < $2::timestamp::date {{bot}}
+            union all
+            select created_at, 1 from dashboard_bot_events
+            where id > {HW_BOT_EVENTS} and created_at >= $1 and created_at < $2 {{bot}}"""),
+        Source("hourly rollup", 3600, True, f"""
+            select hour as ts, events as n from dashboard_rollup_bot_events_hourly
+            where hour >= $1 and hour < $2 {{bot}}
+            union all
+            select created_at, 1 from dashboard_bot_events
+            where id > {HW_BOT_EVENTS} and created_at >= $1 and created_at < $2 {{bot}}"""),
+        _raw("raw", "dashboard_bot_events"),
+    )),
+    "moderation": Metric("bigint", (
+        Source("daily rollup", 86400, False, f"""
+            select day::timestamp as ts, events as n from dashboard_rollup_moderation
+            where day >= $1::timestamp::date and day < $2::timestamp::date
+            union all
+            select created_at, 1 from dashboard_moderation
+            where id > {HW_MODERATION} and created_at >= $1 and created_at < $2"""),
+        Source("hourly rollup", 3600, True, f"""
+            select hour as ts, events as n from dashboard_rollup_moderation_hourly
+            where hour >= $1 and hour < $2 {{bot}}
+            union all
+            select created_at, 1 from dashboard_moderation
+            where id > {HW_MODERATION} and created_at >= $1 and created_at < $2 {{bot}}"""),
+        _raw("raw", "dashboard_moderation"),
+    )),
+    "users": Metric("bigint", (
+        Source("daily rollup", 86400, False, f"""
+            select day::timestamp as ts, users as n from dashboard_rollup_users
+            where day >= $1::timestamp::date and day < $2::timestamp::date
+            union all
+            select created_at, 1 from dashboard_users
+            where created_at > {HW_USERS} and created_at >= $1 and created_at < $2"""),
+        _raw("raw", "dashboard_users", per_bot=False),
+    )),
+    "bot_users": Metric("bigint", (
+        _raw("raw", "dashboard_bot_users"),
+    )),
+    "payments": Metric("bigint", (
+        _raw("raw", "dashboard_payments", per_bot=False),
+    )),
+    "revenue": Metric("float8", (
+        _raw("raw", "dashboard_payments", "amount", "and status='completed'", per_bot=False),
+    )),
+}
+
+
+def _floor(ts: datetime, unit: int) -> datetime:
+    """Start of the minute/hour/day/week (Monday) containing ts"""
+    if unit == BUCKETS["week"]:
+        day = ts.replace(hour=0, minute=0, second=0, microsecond=0)
+        return day - timedelta(days=day.weekday())
+    epoch = datetime(1970, 1, 1)
+    return epoch + timedelta(seconds=(ts - epoch) // timedelta(seconds=unit) * unit)
+
+
+def _width(unit: int, needed: float) -> int:
+    """Smallest nice bucket width of at least `needed` seconds that is a multiple of unit"""
+    if unit == BUCKETS["week"]:
+        return unit * math.ceil(needed / unit)
+    for w in NICE_WIDTHS:
+        if w >= needed and w % unit == 0:
+            return w
+    return 86400 * math.ceil(needed / 86400)
+
+
+def _naive_utc(ts: datetime) -> datetime:
+    return ts.astimezone(timezone.utc).replace(tzinfo=None) if ts.tzinfo else ts
+
+
+def plan(metric: str, bucket: str, start: Optional[datetime], end: Optional[datetime],
+         bot_id: Optional[int] = None) -> Tuple[Source, datetime, int, int]:
+    """Choose (source, origin, width seconds, points) for a request; ValueError if invalid"""
+    m = METRICS.get(metric)
+    if m is None:
+        raise ValueError(f"Unknown metric {metric!r}; expected one of {', '.join(METRICS)}")
+    unit = BUCKETS.get(bucket)
+    if unit is None:
+        raise ValueError(f"Unknown bucket {bucket!r}; expected one of {', '.join(BUCKETS)}")
+    end = _naive_utc(end) if end else datetime.utcnow()
+    start = _naive_utc(start) if start else end - DEFAULT_SPAN[bucket]
+    if start >= end:
+        raise ValueError("start must be before end")
+    if end - start > timedelta(days=MAX_RANGE_DAYS):
+        raise ValueError(f"Range is limited to {MAX_RANGE_DAYS} days")
+
+    width = _width(unit, max(unit, (end - start).total_seconds() / MAX_POINTS))
+    while True:
+        if unit == BUCKETS["week"]:
+            align = unit
+        else:
+            align = width if 86400 % width == 0 else 86400
+        origin = _floor(start, align)
+        points = math.ceil((end - origin).total_seconds() / width)
+        if points <= MAX_POINTS:
+            break
+        width = _width(unit, width + 1)  # alignment added a bucket
+
+    for src in m.sources:
+        if bot_id is not None and not src.per_bot:
+            continue
+        if width % src.grain == 0 and align % src.grain == 0:
+            return src, origin, width, points
+    raise ValueError(f"Metric {metric!r} cannot be filtered by bot")
+
+
+async def series(metric: str, bucket: str, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                 bot_id: Optional[int] = None) -> dict:
+    """Gap-filled series; raises ValueError for bad input, asyncio.TimeoutError past QUERY_TIMEOUT"""
+    src, origin, width, points = plan(metric, bucket, start, end, bot_id)
+    stop = origin + timedelta(seconds=width * points)
+    sql = f"""
+        select floor(extract(epoch from ts - $1::timestamp) / $3::int)::int as i, sum(n)::{METRICS[metric].cast} as v
+        from ({src.sql.format(bot="and bot_id=$4" if bot_id is not None else "")}) t
+        group by 1
+    """
+    args = [origin, stop, width] + ([bot_id] if bot_id is not None else [])
+    async with acquire() as c:
+        rows = await c.fetch(sql, *args, timeout=QUERY_TIMEOUT)
+    values: List = [0] * points
+    for r in rows:
+        if 0 <= r["i"] < points:
+            values[r["i"]] = r["v"]
+    step = timedelta(seconds=width)
+    return {
+        "metric": metric,
+        "bot_id": bot_id,
+        "bucket": bucket,
+        "step_seconds": width,
+        "source": src.name,
+        "start": origin.isoformat(),
+        "end": stop.isoformat(),
+        "points": [{"t": (origin + step * i).isoformat(), "v": v} for i, v in enumerate(values)],
+    }
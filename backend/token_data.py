@@ -0,0 +1,236 @@
+"""EMRD token snapshot and incrementally maintained holder balances.
+
+Holder balances are folded from dashboard_token_events into
+dashboard_token_holders in id batches above a high-water mark kept in
+dashboard_rollup_state, so each run only touches the addresses that moved.
+The mark only advances past settled ids (rollups.settled_range), so a
+late-committing event is never skipped.
+/token/emrd is served from an in-memory snapshot: a stale snapshot is
+returned immediately while one coalesced background refresh replaces it.
+"""
+import asyncio
+import logging
+import os
+import time
+from decimal import Decimal
+from typing import Awaitable, Callable, Optional
+import httpx
+from db import acquire, fetchrow
+from rollups import ID_STATE_SCHEMA, settled_range
+
+logger = logging.getLogger(__name__)
+
+CONTRACT = os.getenv("EMRD_CONTRACT", "EQDkjqMPPCLYN2xUQp_mWMFt3zPxUgcLIEMCDe-RDHfx2Gsp")
+TOTAL_SUPPLY = Decimal(os.getenv("EMRD_TOTAL_SUPPLY", "100000000"))
+FRESH_SECONDS = float(os.getenv("TOKEN_SNAPSHOT_TTL", "60"))
+MAX_STALE_SECONDS = float(os.getenv("TOKEN_SNAPSHOT_MAX_STALE", "3600"))
+REFRESH_INTERVAL = float(os.getenv("TOKEN_REFRESH_INTERVAL", "60"))
+BATCH_SIZE = int(os.getenv("TOKEN_HOLDERS_BATCH_SIZE", "50000"))
+# JSON endpoint for the USD price; EMRD_PRICE_USD pins a static price instead
+PRICE_URL = os.getenv("EMRD_PRICE_URL", "https://tonapi.io/v2/rates")
+STATIC_PRICE = os.getenv("EMRD_PRICE_USD")
+
+SCHEMA = [
+    """
+    create table if not exists dashboard_token_holders(
+      ton_address text primary key,
+      telegram_id bigint,
+      balance numeric not null default 0,
+      percentage numeric not null default 0,
+      updated_at timestamp not null default now()
+    );
+    """,
+    "alter table dashboard_token_holders add column if not exists updated_at timestamp not null default now();",
+    "create unique index if not exists dashboard_token_holders_address_uidx on dashboard_token_holders(ton_address);",
+    "insert into dashboard_rollup_state(name) values ('token_holders') on conflict do nothing;",
+]
+
+# ton_watch stores native TON transfers in the same table; they are not EMRD
+EMRD_EVENTS = "type not in ('ton_in', 'ton_out')"
+
+# Net change per address for event ids in ($1, $2]; mints/burns have a null side.
+_FOLD_SQL = f"""
+with delta as (
+    select addr, sum(amount) as amount from (
+        select to_address as addr, amount from dashboard_token_events
+        where id > $1 and id <= $2 and to_address is not null and {EMRD_EVENTS}
+        union all
+        select from_address, -amount from dashboard_token_events
+        where id > $1 and id <= $2 and from_address is not null and {EMRD_EVENTS}
+    ) t
+    group by addr
+)
+insert into dashboard_token_holders(ton_address, telegram_id, balance, percentage, updated_at)
+select d.addr, u.telegram_id, d.amount, d.amount * 100 / $3, now()
+from delta d
+left join lateral (
+    select telegram_id from dashboard_users where ton_address=d.addr limit 1
+) u on true
+on conflict(ton_address) do update
+set balance=dashboard_token_holders.balance + excluded.balance,
+    percentage=(dashboard_token_holders.balance + excluded.balance) * 100 / $3,
+    telegram_id=coalesce(excluded.telegram_id, dashboard_token_holders.telegram_id),
+    updated_at=now()
+"""
+
+_SNAPSHOT_SQL = """
+select count(1) filter (where balance > 0) as holders,
+       coalesce(sum(balance) filter (where balance > 0), 0) as circulating
+from dashboard_token_holders
+"""
+
+PriceSource = Callable[[], Awaitable[Optional[float]]]
+
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(timeout=httpx.Timeout(10.0))
+    return _client
+
+
+def set_client(client: httpx.AsyncClient):
+    """Swap in another client, e.g. one pointed at a local stub price server"""
+    global _client
+    _client = client
+
+
+async def _http_price() -> Optional[float]:
+    r = await get_client().get(PRICE_URL, params={"tokens": CONTRACT, "currencies": "usd"})
+    r.raise_for_status()
+    body = r.json()
+    if "price_usd" in body:  # flat {"price_usd": ...}, e.g. a local stub
+        return float(body["price_usd"])
+    return float(body["rates"][CONTRACT]["prices"]["USD"])
+
+
+async def _static_price() -> Optional[float]:
+    return float(STATIC_PRICE) if STATIC_PRICE else None
+
+
+_price_source: PriceSource = _static_price if STATIC_PRICE else _http_price
+
+
+def set_price_source(fn: PriceSource):
+    """Replace the price lookup, e.g. with a stub returning a fixed price"""
+    global _price_source
+    _price_source = fn
+
+
+async def ensure_schema():
+    async with acquire() as c:
+        for stmt in SCHEMA + ID_STATE_SCHEMA:
+            await c.execute(stmt)
+
+
+async def _fold_batch(conn) -> bool:
+    """Fold one id batch of token events into holder balances; True if more are pending"""
+    async with conn.transaction():
+        hw, upper_bound = await settled_range(conn, "token_holders", "dashboard_token_events")
+        if upper_bound <= hw:
+            return False
+        upper = min(upper_bound, hw + BATCH_SIZE)
+        await conn.execute(_FOLD_SQL, hw, upper, TOTAL_SUPPLY)
+        await conn.execute(
+            "update dashboard_rollup_state set high_water=$1, updated_at=now() where name='token_holders'", upper
+        )
+        return upper < upper_bound
+
+
+async def update_holders(max_batches: int = 20):
+    async with acquire() as c:
+        for _ in range(max_batches):
+            if not await _fold_batch(c):
+                break
+
+
+# ---------- Snapshot (stale-while-revalidate) ----------
+_snapshot: Optional[dict] = None
+_fetched_at = 0.0
+_refreshing: Optional[asyncio.Task] = None
+
+
+async def _build() -> dict:
+    global _snapshot, _fetched_at
+    await update_holders()
+    row = await fetchrow(_SNAPSHOT_SQL)
+    price = None
+    try:
+        price = await _price_source()
+    except Exception as e:
+        logger.warning(f"EMRD price lookup failed: {e}")
+    if price is None and _snapshot:
+        price = _snapshot["price_usd"]  # keep the last known price
+    circulating = row["circulating"]
+    _snapshot = {
+        "price_usd": price,
+        "market_cap": float(circulating * Decimal(str(price))) if price is not None else None,
+        "holders": row["holders"],
+        "total_supply": str(TOTAL_SUPPLY),
+        "circulating_supply": str(circulating),
+        "updated_at": int(time.time()),
+    }
+    _fetched_at = time.monotonic()
+    return _snapshot
+
+
+def refresh() -> asyncio.Task:
+    """Start a refresh unless one is already running; all callers share it"""
+    global _refreshing
+    if _refreshing is None or _refreshing.done():
+        _refreshing = asyncio.get_running_loop().create_task(_build())
+        _refreshing.add_done_callback(_log_failure)
+    return _refreshing
+
+
+def _log_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception():
+        logger.warning(f"EMRD snapshot refresh failed: {task.exception()}")
+
+
+async def snapshot() -> dict:
+    """Current snapshot; stale ones are served while a refresh runs behind them"""
+    age = time.monotonic() - _fetched_at
+    if _snapshot is None or age > MAX_STALE_SECONDS:
+        return await asyncio.shield(refresh())
+    if age > FRESH_SECONDS:
+        refresh()
+    return _snapshot
+
+
+# ---------- Background refresher ----------
+_task = None
+
+
+async def _loop():
+    while True:
+        try:
+            await asyncio.shield(refresh())
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            pass  # logged by the done callback
+        await asyncio.sleep(REFRESH_INTERVAL)
+
+
+def start():
+    global _task
+    if _task is None:
+        _task = asyncio.create_task(_loop())
+
+
+async def stop():
+    global _task, _client
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+    if _client is not None:
+        await _client.aclose()
+        _client = None
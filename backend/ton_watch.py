@@ -0,0 +1,237 @@
+import asyncio
+import json
+import logging
+import os
+import random
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import List, Optional, Tuple
+import httpx
+from db import acquire, fetch
+from notify import publish
+from ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Polls every TON account in dashboard_watch_accounts for new transactions.
+# Each account resumes from the logical time stored in meta.last_lt; all
+# requests share one pooled client, a concurrency cap and a global rate limit.
+# These are native TON transfers, stored as ton_in/ton_out rows that the EMRD
+# holder fold and /token/transactions leave out (token_data.EMRD_EVENTS).
+# Each value-carrying message is one row keyed by its message hash: every out
+# message of the polled account, plus incoming ones whose sender is not itself
+# watched (that sender's own poll records them), so no transfer counts twice.
+API_URL = os.getenv("TON_API_URL", "https://toncenter.com/api/v2")
+API_KEY = os.getenv("TON_API_KEY")
+POLL_INTERVAL = float(os.getenv("TON_POLL_INTERVAL", "30"))
+CONCURRENCY = int(os.getenv("TON_POLL_CONCURRENCY", "8"))
+RATE = float(os.getenv("TON_API_RATE", "10" if API_KEY else "1"))  # requests per second
+PAGE_SIZE = int(os.getenv("TON_PAGE_SIZE", "50"))
+MAX_PAGES = int(os.getenv("TON_MAX_PAGES_PER_POLL", "10"))
+MAX_ATTEMPTS = 5
+NANO = Decimal(10) ** 9
+LOCK_KEY = 7_245_301_914  # only one worker polls at a time
+
+_client: Optional[httpx.AsyncClient] = None
+_bucket = TokenBucket(RATE)
+_task = None
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        headers = {"X-API-Key": API_KEY} if API_KEY else {}
+        _client = httpx.AsyncClient(
+            base_url=API_URL, headers=headers, timeout=httpx.Timeout(10.0),
+            limits=httpx.Limits(max_connections=CONCURRENCY, max_keepalive_connections=CONCURRENCY),
+        )
+    return _client
+
+
+def set_client(client: httpx.AsyncClient):
+    """Swap in another client, e.g. one pointed at a local stub server"""
+    global _client
+    _client = client
+
+
+async def _get(path: str, params: dict) -> dict:
+    """GET with rate limiting and full-jitter exponential backoff on 429/5xx/network errors"""
+    for attempt in range(MAX_ATTEMPTS):
+        await _bucket.take()
+        delay = None
+        try:
+            r = await get_client().get(path, params=params)
+            if r.status_code == 429 or r.status_code >= 500:
+                retry_after = r.headers.get("retry-after")
+                delay = float(retry_after) if retry_after and retry_after.isdigit() else None
+                raise httpx.HTTPStatusError(f"HTTP {r.status_code}", request=r.request, response=r)
+            r.raise_for_status()
+            body = r.json()
+            if isinstance(body, dict) and body.get("ok") is False:
+                raise ValueError(body.get("error") or "API returned ok=false")
+            return body
+        except (httpx.TransportError, httpx.HTTPStatusError) as e:
+            if isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500 and e.response.status_code != 429:
+                raise
+            if attempt == MAX_ATTEMPTS - 1:
+                raise
+            await asyncio.sleep(delay if delay is not None else random.uniform(0, min(30.0, 0.5 * 2 ** attempt)))
+
+
+def _msg_hash(m: dict) -> Optional[str]:
+    # created_lt is unique per sender, so source:created_lt stands in for a missing hash
+    return m.get("hash") or (f"{m['source']}:{m['created_lt']}" if m.get("created_lt") else None)
+
+
+def _events(account: str, tx: dict, watched: frozenset = frozenset()) -> List[tuple]:
+    """(type, amount, from, to, message hash, created_at) per TON transfer in a toncenter v2 transaction"""
+    created = datetime.fromtimestamp(int(tx.get("utime", 0)), timezone.utc).replace(tzinfo=None)
+    events = []
+    in_msg = tx.get("in_msg") or {}
+    if in_msg.get("source") and in_msg["source"] not in watched and int(in_msg.get("value") or 0) > 0:
+        events.append(("ton_in", Decimal(in_msg["value"]) / NANO, in_msg["source"], account,
+                       _msg_hash(in_msg), created))
+    for m in tx.get("out_msgs") or ():
+        if m.get("destination") and int(m.get("value") or 0) > 0:
+            events.append(("ton_out", Decimal(m["value"]) / NANO, account, m["destination"],
+                           _msg_hash({"source": account, **m}), created))
+    return events
+
+
+_RESUME_KEYS = ["resume_lt", "resume_hash", "pending_lt", "pending_hash"]
+
+
+async def poll_account(account: str, last_lt: Optional[int], resume: Optional[Tuple[int, str]] = None,
+                       pending: Optional[Tuple[int, str]] = None,
+                       watched: frozenset = frozenset()) -> Tuple[List[tuple], Optional[dict]]:
+    """Fetch transactions newer than last_lt, newest first, paging back at most MAX_PAGES.
+
+    Returns the events and the cursor for meta (None if nothing changed).
+    If the page cap is hit before last_lt is reached, the cursor records the
+    oldest fetched transaction as the resume point and the newest one as
+    pending. last_lt only advances once the gap has been paged through, so
+    nothing between last_lt and the resume point is skipped.
+    """
+    params = {"address": account, "limit": PAGE_SIZE, "archival": "true"}
+    if last_lt:
+        params["to_lt"] = last_lt
+    if resume:
+        params.update(lt=resume[0], hash=resume[1])
+    events, newest = [], pending
+    for _ in range(MAX_PAGES):
+        txs = (await _get("/getTransactions", params)).get("result") or []
+        txs = [t for t in txs if not last_lt or int(t["transaction_id"]["lt"]) > last_lt]
+        if not txs:
+            break
+        if newest is None:
+            newest = (int(txs[0]["transaction_id"]["lt"]), txs[0]["transaction_id"]["hash"])
+        for t in txs:
+            events.extend(_events(account, t, watched))
+        if len(txs) < PAGE_SIZE:
+            break
+        oldest = txs[-1]["transaction_id"]
+        params = {**params, "lt": oldest["lt"], "hash": oldest["hash"]}
+    else:
+        return events, {"resume_lt": str(oldest["lt"]), "resume_hash": oldest["hash"],
+                        "pending_lt": str(newest[0]), "pending_hash": newest[1]}
+    if newest is None:
+        return events, None
+    return events, {"last_lt": str(newest[0]), "last_hash": newest[1]}
+
+
+def _pair(lt, h) -> Optional[Tuple[int, str]]:
+    return (int(lt), h) if lt else None
+
+
+async def poll_once() -> int:
+    """Poll every watched TON account once; returns the number of new events"""
+    accounts = await fetch(
+        "select id, account_id, coalesce((meta->>'last_lt')::bigint, 0) as last_lt, "
+        "meta->>'resume_lt' as resume_lt, meta->>'resume_hash' as resume_hash, "
+        "meta->>'pending_lt' as pending_lt, meta->>'pending_hash' as pending_hash "
+        "from dashboard_watch_accounts where chain='ton'"
+    )
+    watched = frozenset(a["account_id"] for a in accounts)
+    sem = asyncio.Semaphore(CONCURRENCY)
+
+    async def one(a):
+        async with sem:
+            try:
+                return a["id"], await poll_account(
+                    a["account_id"], a["last_lt"] or None,
+                    _pair(a["resume_lt"], a["resume_hash"]), _pair(a["pending_lt"], a["pending_hash"]), watched
+                )
+            except Exception as e:
+                logger.warning(f"TON poll for {a['account_id']} failed: {e}")
+                return a["id"], ([], None)
+
+    results = await asyncio.gather(*(one(a) for a in accounts))
+    events = [e for _, (evs, _) in results for e in evs]
+    cursors = [(wid, cur) for wid, (_, cur) in results if cur]
+    # Events and cursors commit together: a cursor never moves past events
+    # that were not stored, and stored events are not fetched twice
+    async with acquire() as c:
+        async with c.transaction():
+            if events:
+                cols = list(zip(*events))
+                await c.execute(
+                    """insert into dashboard_token_events(type, amount, from_address, to_address, hash, created_at)
+                       select * from unnest($1::text[], $2::numeric[], $3::text[], $4::text[], $5::text[], $6::timestamp[])
+                       on conflict do nothing""",
+                    *map(list, cols)
+                )
+            if cursors:
+                await c.execute(
+                    """update dashboard_watch_accounts w
+                       set meta=(coalesce(w.meta, '{}'::jsonb) - $3::text[]) || v.patch::jsonb
+                       from unnest($1::int[], $2::text[]) as v(id, patch)
+                       where w.id=v.id""",
+                    [wid for wid, _ in cursors],
+                    [json.dumps(cur) for _, cur in cursors],
+                    _RESUME_KEYS
+                )
+    return len(events)
+
+
+async def _poll_locked() -> int:
+    async with acquire() as c:
+        if not await c.fetchval("select pg_try_advisory_lock($1)", LOCK_KEY):
+            return 0  # another worker is polling
+        try:
+            return await poll_once()
+        finally:
+            await c.execute("select pg_advisory_unlock($1)", LOCK_KEY)
+
+
+async def _loop():
+    while True:
+        try:
+            n = await _poll_locked()
+            if n:
+                await publish("token")
+                logger.info(f"TON poller stored {n} new events")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"TON poll failed: {e}")
+        await asyncio.sleep(POLL_INTERVAL * random.uniform(0.9, 1.1))
+
+
+def start():
+    global _task
+    if _task is None:
+        _task = asyncio.create_task(_loop())
+
+
+async def stop():
+    global _task, _client
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+    if _client is not None:
+        await _client.aclose()
+        _client = None